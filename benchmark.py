@@ -0,0 +1,565 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import cleaner
+import monitor
+import pipeline
+from enum_index import EnumIndex, load_scan_cache, ENUMERATORS
+from registry_backend import MemoryRegistry, set_registry
+from registry_fixtures import ENUM_USB, build_device, device_subkey, generate_fixture, generate_multi_root_fixture
+from usb_flags_manager import add_ignore_key_to_registry
+from utils import normalize_vidpid, get_locked_list
+
+def bench_delete(instances: int = 2000, spawn_sample: int = 30) -> dict:
+    """比較原生刪除引擎與「每鍵一個 reg delete 子程序」的刪除速度"""
+    registry = MemoryRegistry()
+    build_device(registry, "VID_05C6&PID_9091", instances)
+    total_keys = registry.count_keys(f"{ENUM_USB}\\VID_05C6&PID_9091") - 1
+    keys_per_instance = total_keys / instances
+
+    previous = set_registry(registry)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            start = time.perf_counter()
+            cleaner.clean_enum_for_vidpid("VID_05C6&PID_9091")
+            native_elapsed = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        set_registry(previous)
+
+    # 子程序路徑：在非 Windows 環境以空 shell 指令量測每次 cmd 啟動成本，再依實例數外推
+    start = time.perf_counter()
+    for _ in range(spawn_sample):
+        subprocess.run("exit 0", shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    spawn_cost = (time.perf_counter() - start) / spawn_sample
+    subprocess_elapsed = spawn_cost * instances
+
+    return {
+        "instances": instances,
+        "deleted_keys": total_keys,
+        "registry_ops": dict(registry.ops),
+        "native_seconds": round(native_elapsed, 4),
+        "native_keys_per_sec": round(total_keys / native_elapsed, 1),
+        "subprocess_seconds_estimated": round(subprocess_elapsed, 4),
+        "subprocess_keys_per_sec": round(keys_per_instance / spawn_cost, 1),
+    }
+
+def bench_scan_cache(devices: int = 2000, instances: int = 20, changed: int = 50) -> dict:
+    """完整掃描後改動部分裝置（時間戳由假時鐘控制），驗證使用掃描快取的結果與重新掃描一致，
+    並比較掃描加列舉所有實例的註冊表呼叫數（快取只省下實例列舉，裝置鍵仍逐一查詢）"""
+    tick = iter(range(1, 1 << 62))
+    registry = MemoryRegistry(clock=lambda: next(tick))
+    for d in range(devices):
+        build_device(registry, device_subkey(d), instances)
+
+    previous = set_registry(registry)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            full = EnumIndex.build()
+            with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, full.enum_path) as root:
+                for vidpid in list(full.devices):
+                    full.instance_paths(root, vidpid)
+            full.save_cache()
+
+            for d in range(0, devices, max(1, devices // changed)):
+                registry.add_key(f"{ENUM_USB}\\{device_subkey(d)}\\NEW{d:04X}")
+
+            registry.ops.clear()
+            cached = EnumIndex.build(cache=load_scan_cache())
+            with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, cached.enum_path) as root:
+                for vidpid in list(cached.devices):
+                    cached.instance_paths(root, vidpid)
+            cached_ops = sum(registry.ops.values())
+            registry.ops.clear()
+            rescan = EnumIndex.build()
+            with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, rescan.enum_path) as root:
+                for vidpid in list(rescan.devices):
+                    rescan.instance_paths(root, vidpid)
+            full_ops = sum(registry.ops.values())
+    finally:
+        os.chdir(cwd)
+        set_registry(previous)
+
+    checked = cached.cache_hits + cached.cache_misses
+    return {
+        "devices": devices,
+        "consistent": dict(cached.iter_counts()) == dict(rescan.iter_counts()),
+        "cache_hit_ratio": round(cached.cache_hits / checked, 4) if checked else 0.0,
+        "cached_registry_ops": cached_ops,
+        "full_registry_ops": full_ops,
+        "cached_seconds": round(cached.scan_seconds, 4),
+    }
+
+def bench_parallel(devices: int = 400, instances: int = 5, latency: float = 0.0005, workers: int = 8) -> dict:
+    """在每次註冊表呼叫注入延遲的替身上，比較循序與平行掃描的吞吐量"""
+    registry = MemoryRegistry()
+    for d in range(devices):
+        build_device(registry, device_subkey(d), instances)
+    registry.latency = latency
+
+    previous = set_registry(registry)
+    try:
+        sequential = EnumIndex.build()
+        parallel = EnumIndex.build(workers=workers)
+    finally:
+        set_registry(previous)
+
+    return {
+        "devices": devices,
+        "latency_ms": latency * 1000,
+        "workers": workers,
+        "same_order": list(sequential.iter_counts()) == list(parallel.iter_counts()),
+        "sequential_seconds": round(sequential.scan_seconds, 4),
+        "parallel_seconds": round(parallel.scan_seconds, 4),
+        "sequential_keys_per_sec": round(devices / sequential.scan_seconds, 1),
+        "parallel_keys_per_sec": round(devices / parallel.scan_seconds, 1),
+    }
+
+def bench_stream(devices: int = 5000, top_k: int = 10) -> dict:
+    """量測串流掃描產生第一筆超標記錄的延遲，以及堆積 top-K 與完整排序的結果是否一致"""
+    registry = MemoryRegistry()
+    for d in range(devices):
+        build_device(registry, device_subkey(d), 1 + (d * 7919) % 13)
+
+    previous = set_registry(registry)
+    try:
+        start = time.perf_counter()
+        stream = monitor.iter_scan(threshold=5, locked_list=frozenset())
+        next(stream)
+        first_record = time.perf_counter() - start
+        stream.close()
+
+        start = time.perf_counter()
+        top = monitor.select_offenders(monitor.iter_scan(threshold=5, locked_list=frozenset()), top_k=top_k)
+        top_k_seconds = time.perf_counter() - start
+        counts = monitor.scan_all_vidpid_counts(threshold=5)
+    finally:
+        set_registry(previous)
+
+    expected = sorted(counts.values(), reverse=True)[:top_k]
+    return {
+        "devices": devices,
+        "first_record_seconds": round(first_record, 6),
+        "top_k_seconds": round(top_k_seconds, 4),
+        "top_k_matches_sort": [record.instance_count for record in top] == expected,
+    }
+
+def bench_pipeline(vidpids: int = 200, max_instances: int = 60, threshold: int = 40, latency: float = 0.0002,
+                   workers: int = 4, queue_size: int = 8, max_concurrent_deletes: int = 2, seed: int = 0) -> dict:
+    """比較「先掃完再逐一清理」與掃描/清理管線的耗時；兩者都注入延遲與刪除錯誤，確認清理結果、Lock List 一致"""
+    results = {}
+    for mode in ("serial", "pipeline"):
+        fixture = generate_fixture(vidpids, max_instances, "uniform", locked_ratio=0.05, seed=seed)
+        registry = fixture["registry"]
+        worst = max(fixture["counts"], key=fixture["counts"].get)
+        faulty = f"{device_subkey(list(fixture['counts']).index(worst))}\\00000000\\Device Parameters"
+        registry.inject_fault("DeleteKey", faulty, PermissionError("[WinError 5] 存取被拒。"), times=None)
+        registry.latency = latency
+
+        previous = set_registry(registry)
+        cwd = os.getcwd()
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                os.chdir(tmp)
+                with open("lock_list.json", 'w', encoding='utf-8') as f:
+                    json.dump({"locked": fixture["locked"]}, f)
+                locked = get_locked_list()
+                index = EnumIndex()
+                start = time.perf_counter()
+                records = monitor.iter_scan(threshold, index=index, locked_list=locked)
+                if mode == "serial":
+                    for record in monitor.select_offenders(records):
+                        cleaner.clean_enum_for_vidpid(record.vidpid, index=index)
+                    stats = {}
+                else:
+                    limiter = pipeline.DeleteRateLimiter(max_concurrent_deletes)
+                    set_registry(pipeline.ThrottledRegistry(registry, limiter))
+                    stats = pipeline.run_pipeline(pipeline.coalesce_records(records),
+                                                  lambda record: cleaner.clean_enum_for_vidpid(record.vidpid, index=index),
+                                                  workers=workers, queue_size=queue_size).as_dict()
+                    stats["delete_wait_seconds"] = round(limiter.waited_seconds, 4)
+                elapsed = time.perf_counter() - start
+                lock_list = sorted(get_locked_list())
+        finally:
+            os.chdir(cwd)
+            set_registry(previous)
+
+        results[mode] = {
+            "seconds": round(elapsed, 4),
+            "remaining_keys": registry.count_keys(ENUM_USB),
+            "fault_kept": registry.exists(f"{ENUM_USB}\\{faulty}"),
+            "lock_list": lock_list,
+            "stats": stats,
+        }
+
+    serial, piped = results["serial"], results["pipeline"]
+    return {
+        "params": {"vidpids": vidpids, "max_instances": max_instances, "threshold": threshold,
+                   "latency_ms": latency * 1000, "workers": workers, "queue_size": queue_size,
+                   "max_concurrent_deletes": max_concurrent_deletes, "seed": seed},
+        "same_result": serial["remaining_keys"] == piped["remaining_keys"] and serial["lock_list"] == piped["lock_list"],
+        "fault_kept": serial["fault_kept"] and piped["fault_kept"],
+        "serial_seconds": serial["seconds"],
+        "pipeline_seconds": piped["seconds"],
+        "locked_after": len(piped["lock_list"]),
+        "pipeline_stats": piped["stats"],
+    }
+
+def bench_multi_root(vidpids: int = 300, max_instances: int = 60, threshold: int = 40, seed: int = 0) -> dict:
+    """多列舉器掃描：在合成的 USB/HID/FTDIBUS/USBSTOR/USBPRINT 樹上確認每個根鍵只列舉一次
+    （EnumKey 次數等於裝置鍵總數，OpenKey/QueryInfoKey 為每個根鍵與裝置鍵各一次），合併結果與預期相同，
+    並與「每個根鍵各自建一個索引」比較操作數；最後清理最嚴重的 VID/PID，確認各根鍵的實例都已刪除"""
+    fixture = generate_multi_root_fixture(vidpids, max_instances, seed=seed)
+    registry = fixture["registry"]
+    roots = len(fixture["device_keys"])
+    device_keys = sum(fixture["device_keys"].values())
+
+    previous = set_registry(registry)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            registry.ops.clear()
+            index = EnumIndex.build(enumerators=ENUMERATORS)
+            ops = dict(registry.ops)
+            counts_match = dict(index.iter_counts()) == fixture["counts"]
+
+            registry.ops.clear()
+            separate = [EnumIndex.build(enumerators=(name,)) for name in ENUMERATORS]
+            separate_ops = sum(registry.ops.values())
+
+            offenders = monitor.select_offenders(monitor.iter_scan(threshold, index=index, locked_list=frozenset()))
+            worst = offenders[0].vidpid
+            breakdown = index.breakdown(worst)
+            cleaner.clean_enum_for_vidpid(worst, index=index)
+            residual = EnumIndex.build(only={worst}, enumerators=ENUMERATORS).instance_count(worst)
+    finally:
+        os.chdir(cwd)
+        set_registry(previous)
+
+    return {
+        "params": {"vidpids": vidpids, "max_instances": max_instances, "threshold": threshold, "seed": seed},
+        "device_keys": fixture["device_keys"],
+        "merged_keys": len(index),
+        "counts_match": counts_match,
+        "one_walk_per_root": (ops.get("EnumKey", 0) == device_keys
+                              and ops.get("OpenKey", 0) == 1 + roots + device_keys
+                              and ops.get("QueryInfoKey", 0) == roots + device_keys),
+        "registry_ops": sum(ops.values()),
+        "separate_index_registry_ops": separate_ops,
+        "separate_index_keys": sum(len(item) for item in separate),
+        "scan_seconds": round(index.scan_seconds, 4),
+        "offenders": len(offenders),
+        "worst": {"vid_pid": worst, "breakdown": breakdown, "residual": residual},
+    }
+
+def bench_logging(deletions: int = 100_000, vidpids: int = 100) -> dict:
+    """量測 log 對清理的額外耗時：刪除 deletions 個實例（平均分散在 vidpids 個 VID/PID），
+    比較不輸出逐鍵 log、同步 FileHandler + stdout（原本的設定）、佇列管線（text / json / 彙總，與 install_pipeline 相同
+    關閉 LogRecord 不需要的欄位）；stdout 導向 os.devnull。
+    overhead 以不輸出 log 的清理耗時為基準，drain_seconds 為清理結束後寫入執行緒寫完佇列所需的時間"""
+    from log_pipeline import LogPipeline, LOG_FORMAT, lean_log_records, restore_log_records
+
+    per_vidpid = deletions // vidpids
+    modes = {
+        "off": None,
+        "sync_text": None,
+        "queue_text": {"fmt": "text", "aggregate": False},
+        "queue_json": {"fmt": "json", "aggregate": False},
+        "queue_aggregate": {"fmt": "text", "aggregate": True},
+    }
+    root_logger = logging.getLogger()
+    saved = (root_logger.handlers[:], root_logger.level)
+    record_fields = lean_log_records()
+    restore_log_records(record_fields)
+    cwd = os.getcwd()
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w", encoding="utf-8") as devnull:
+            os.chdir(tmp)
+            for mode, options in modes.items():
+                registry = MemoryRegistry()
+                subkeys = [device_subkey(n) for n in range(vidpids)]
+                for subkey in subkeys:
+                    build_device(registry, subkey, per_vidpid)
+                log_file = os.path.join(tmp, f"{mode}.log")
+                handlers = []
+                if mode == "sync_text":
+                    handlers = [logging.FileHandler(log_file, encoding="utf-8"), logging.StreamHandler(devnull)]
+                    for handler in handlers:
+                        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                elif options is not None:
+                    handlers = [LogPipeline(log_file, rotate="none", stream=devnull, **options)]
+                    lean_log_records()
+                root_logger.handlers[:] = handlers
+                root_logger.setLevel(logging.WARNING if mode == "off" else logging.INFO)
+
+                previous = set_registry(registry)
+                try:
+                    index = EnumIndex.build()
+                    start = time.perf_counter()
+                    for subkey in subkeys:
+                        cleaner.clean_enum_for_vidpid(subkey, index=index, skip_locked=False)
+                    elapsed = time.perf_counter() - start
+                    start = time.perf_counter()
+                    for handler in handlers:
+                        handler.close()
+                    drain = time.perf_counter() - start
+                finally:
+                    set_registry(previous)
+                    restore_log_records(record_fields)
+
+                result = {"seconds": round(elapsed, 4), "drain_seconds": round(drain, 4)}
+                if os.path.exists(log_file):
+                    with open(log_file, "rb") as f:
+                        data = f.read()
+                    result.update(log_bytes=len(data), log_lines=data.count(b"\n"))
+                if isinstance(handlers[:1] and handlers[0], LogPipeline):
+                    result.update(batches=handlers[0].stats["batches"], max_batch=handlers[0].stats["max_batch"])
+                results[mode] = result
+    finally:
+        os.chdir(cwd)
+        root_logger.handlers[:] = saved[0]
+        root_logger.setLevel(saved[1])
+        restore_log_records(record_fields)
+
+    baseline = results["off"]["seconds"]
+    for mode, result in results.items():
+        if mode != "off":
+            result["overhead_seconds"] = round(result["seconds"] - baseline, 4)
+            result["overhead_pct"] = round((result["seconds"] - baseline) / baseline * 100, 1)
+    return {"deletions": per_vidpid * vidpids, "vidpids": vidpids, "modes": results}
+
+def write_synthetic_log(path: str, size_mb: int, offenders: int = 20, instances: int = 500) -> dict:
+    """寫出約 size_mb MB 的合成 enum_guardian_log.txt：每次執行清理 offenders 個 VID/PID、各 instances 個實例
+    （逐鍵 log，即舊版格式），夾雜其他模組的訊息；每次執行使用不同日期。回傳執行數與預期的每個 VID/PID 實例數"""
+    lines = ["[2000-01-01 00:10:00,000] [AUTO] ====== EnumGuardian Auto Scan & Cleanup Started ======",
+             "[2000-01-01 00:10:00,010] [Index] 完整掃描 Enum\\USB：300 個裝置鍵"]
+    subkeys = [device_subkey(n) for n in range(offenders)]
+    for n, subkey in enumerate(subkeys):
+        lines.append(f"[2000-01-01 00:10:00,{n:03d}] [Monitor] 偵測到 {normalize_vidpid(subkey)} 子鍵數量 {instances}，超過門檻 100")
+    lines.append(f"[2000-01-01 00:10:00,500] [AUTO] 本次掃描共偵測到 {offenders} 個裝置項目")
+    for n, subkey in enumerate(subkeys):
+        lines += [f"[2000-01-01 00:10:{10 + n:02d},{i % 1000:03d}] [Cleaner] 已刪除 ENUM 註冊表項目: {subkey}\\{i:08X}"
+                  for i in range(instances)]
+        lines.append(f"[2000-01-01 00:10:{10 + n:02d},999] [Cleaner] {normalize_vidpid(subkey)} 共刪除 {instances * 4} 個註冊表鍵"
+                     f"（{instances}/{instances} 個裝置實例），失敗 0 項")
+        lines.append(f"[2000-01-01 00:10:{10 + n:02d},999] [Cleaner] 已加入 Lock List: {normalize_vidpid(subkey)}")
+    lines += [f"[2000-01-01 00:11:00,000] [AUTO] 本次清理完成，共處理 {offenders} 項，跳過 0 項",
+              "[2000-01-01 00:11:00,500] [AUTO] ====== 全部流程執行完畢 ======"]
+    block = ("\n".join(lines) + "\n").encode("utf-8")
+    runs = max(1, size_mb * 1048576 // len(block))
+    start = datetime(2001, 1, 1)
+    with open(path, "wb") as f:
+        for run in range(runs):
+            f.write(block.replace(b"2000-01-01", f"{start + timedelta(days=run):%Y-%m-%d}".encode()))
+    return {"runs": runs, "bytes": runs * len(block),
+            "expected": {normalize_vidpid(subkey): runs * instances for subkey in subkeys}}
+
+def bench_log_analyzer(size_mb: int = 2048, workers: int = None, wrapper_runs: int = 10, launch_failures: int = 5) -> dict:
+    """在合成的多 GB log 上量測 log_analyzer 的吞吐量與主行程峰值 RSS（tracemalloc 會讓解析慢數十倍，因此不使用；
+    Windows 沒有 resource 模組時不回報）。
+    另寫一個 cp950 的批次檔 log：前 wrapper_runs 次執行的輸出與主 log 重複（應只計一次），
+    外加 launch_failures 次程式未啟動的紀錄；確認各 VID/PID 實例數、執行數與編碼判斷都正確"""
+    import log_analyzer
+
+    workers = workers or log_analyzer.ANALYSIS_WORKERS
+    with tempfile.TemporaryDirectory() as tmp:
+        log_file = os.path.join(tmp, "enum_guardian_log.txt")
+        start = time.perf_counter()
+        fixture = write_synthetic_log(log_file, size_mb)
+        generate_seconds = time.perf_counter() - start
+
+        wrapper_file = os.path.join(tmp, "Enum_Guardian.log")
+        with open(log_file, "rb") as src, open(wrapper_file, "wb") as dst:
+            for run in range(launch_failures):
+                dst.write(f"[1999/12/{run + 1:02d} 週五 14:18:01.21] Starting enum_auto_run.exe \r\n"
+                          "'enum_auto_run.exe' 不是內部或外部命令、可執行的程式或批次檔。\r\n"
+                          f"[1999/12/{run + 1:02d} 週五 14:18:01.23] Ended \r\n".encode("cp950"))
+            day = None
+            for line in src:
+                if line.endswith("Started ======\n".encode()):
+                    day = line[1:11]
+                    if day > f"{datetime(2001, 1, 1) + timedelta(days=wrapper_runs - 1):%Y-%m-%d}".encode():
+                        break
+                    dst.write(f"[{day.decode().replace('-', '/')} 週一  0:09:59.90] Starting enum_auto_run.exe \r\n".encode("cp950"))
+                dst.write(line.decode("utf-8").rstrip("\n").encode("cp950") + b"\r\n")
+                if line.endswith("執行完畢 ======\n".encode()):
+                    dst.write(f"[{day.decode().replace('-', '/')} 週一  0:11:00.90] Ended \r\n".encode("cp950"))
+
+        rows = []
+        aggregator, stats = log_analyzer.analyse_logs([log_file, wrapper_file], workers=workers, on_run=rows.append)
+        try:
+            import resource
+            peak_rss = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        except ImportError:
+            peak_rss = None
+
+    counts = {vidpid: stats_["instances_deleted"] for vidpid, stats_ in aggregator.vidpids.items()}
+    summary = aggregator.run_summary()
+    return {
+        "params": {"size_mb": size_mb, "workers": workers, "wrapper_runs": wrapper_runs, "launch_failures": launch_failures},
+        "runs": fixture["runs"],
+        "generate_seconds": round(generate_seconds, 2),
+        "analyse": stats,
+        "peak_rss_mb": peak_rss,
+        "counts_match": counts == fixture["expected"],
+        "runs_match": (summary["status"] == {"completed": fixture["runs"], "no_output": launch_failures}
+                       and summary["duplicates_skipped"] == wrapper_runs and len(rows) == fixture["runs"] + launch_failures),
+        "run_seconds": summary["seconds"],
+    }
+
+def measure(registry: MemoryRegistry, func, *args, **kwargs):
+    """執行 func 並回傳 (結果, {耗時, 註冊表操作數, tracemalloc 峰值記憶體})"""
+    ops_before = sum(registry.ops.values())
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, {
+        "seconds": round(elapsed, 4),
+        "registry_ops": sum(registry.ops.values()) - ops_before,
+        "peak_memory_kb": round(peak / 1024, 1),
+    }
+
+def bench_suite(vidpids: int = 1000, max_instances: int = 500, distribution: str = "skewed",
+                locked_ratio: float = 0.05, threshold: int = 100, clean_limit: int = 20, seed: int = 0) -> dict:
+    """以合成樹依序量測 normalize_vidpid、get_locked_list、掃描、UsbFlags 寫入與 ENUM 清理"""
+    start = time.perf_counter()
+    fixture = generate_fixture(vidpids, max_instances, distribution, locked_ratio, seed=seed)
+    generate_seconds = time.perf_counter() - start
+    registry = fixture["registry"]
+    phases = {}
+
+    previous = set_registry(registry)
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            with open("lock_list.json", 'w', encoding='utf-8') as f:
+                json.dump({"locked": fixture["locked"]}, f)
+
+            _, phases["normalize_vidpid"] = measure(registry, lambda: [normalize_vidpid(s) for s in fixture["subkeys"]])
+            _, phases["get_locked_list_cold"] = measure(registry, get_locked_list)
+            probes = list(fixture["counts"])
+            _, phases["get_locked_list_warm_x1000"] = measure(
+                registry, lambda: sum(probes[i % len(probes)] in get_locked_list() for i in range(1000)))
+
+            index = EnumIndex()
+            counts, phases["scan_all_vidpid_counts"] = measure(
+                registry, lambda: monitor.scan_all_vidpid_counts(threshold, index=index))
+            offenders = sorted(counts, key=counts.get, reverse=True)[:clean_limit]
+
+            _, phases["add_ignore_key_to_registry"] = measure(
+                registry, lambda: [add_ignore_key_to_registry(vidpid) for vidpid in offenders])
+            keys_before = registry.ops["DeleteKey"]
+            _, phases["clean_enum_for_vidpid"] = measure(
+                registry, lambda: [cleaner.clean_enum_for_vidpid(vidpid, index=index) for vidpid in offenders])
+            phases["clean_enum_for_vidpid"]["deleted_keys"] = registry.ops["DeleteKey"] - keys_before
+    finally:
+        os.chdir(cwd)
+        set_registry(previous)
+
+    return {
+        "params": {
+            "vidpids": vidpids, "max_instances": max_instances, "distribution": distribution,
+            "locked_ratio": locked_ratio, "threshold": threshold, "clean_limit": clean_limit, "seed": seed,
+        },
+        "total_instances": fixture["total_instances"],
+        "total_keys": registry.count_keys(),
+        "offenders": len(counts),
+        "generate_seconds": round(generate_seconds, 4),
+        "phases": phases,
+    }
+
+def bench_startup(runs: int = 5) -> dict:
+    """量測 enum_auto_run 冷啟動時間：不在排程時間（快速結束）與在排程時間（載入完整模組）兩種情況"""
+    strategies = {
+        "not_scheduled": {"enabled": True, "mode": "manual"},
+        "scheduled": {"enabled": True, "mode": "daily", "time": "00:00", "tolerance": 86400},
+    }
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for path in glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "*.py")):
+            shutil.copy(path, tmp)
+        for case, strategy in strategies.items():
+            with open(os.path.join(tmp, "config.json"), 'w', encoding='utf-8') as f:
+                json.dump({"threshold": 100, "scan_strategy": strategy, "monitored_devices": []}, f)
+            timings = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, os.path.join(tmp, "enum_auto_run.py")], cwd=tmp,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                timings.append(time.perf_counter() - start)
+            results[f"{case}_seconds_min"] = round(min(timings), 4)
+            results[f"{case}_seconds_mean"] = round(sum(timings) / runs, 4)
+    results["runs"] = runs
+    return results
+
+BENCHMARKS = {
+    "delete": bench_delete,
+    "scan_cache": bench_scan_cache,
+    "parallel": bench_parallel,
+    "stream": bench_stream,
+    "pipeline": bench_pipeline,
+    "multi_root": bench_multi_root,
+    "logging": bench_logging,
+    "log_analyzer": bench_log_analyzer,
+    "suite": bench_suite,
+    "startup": bench_startup,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Enum_Guardian 效能量測（以記憶體註冊表模擬）")
+    parser.add_argument("names", nargs="*", help=f"要執行的項目（{', '.join(BENCHMARKS)}），預設全部")
+    parser.add_argument("--output", help="結果輸出 JSON 檔")
+    parser.add_argument("--vidpids", type=int, default=1000, help="suite：合成 VID/PID 數量")
+    parser.add_argument("--max-instances", type=int, default=500, help="suite：單一 VID/PID 最多實例數")
+    parser.add_argument("--distribution", choices=["skewed", "uniform"], default="skewed", help="suite：實例數分布")
+    parser.add_argument("--locked-ratio", type=float, default=0.05, help="suite：已鎖定的 VID/PID 比例")
+    parser.add_argument("--seed", type=int, default=0, help="suite：亂數種子")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='[%(asctime)s] %(message)s')
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"未知的量測項目：{unknown}")
+
+    shape = {
+        "vidpids": args.vidpids, "max_instances": args.max_instances, "distribution": args.distribution,
+        "locked_ratio": args.locked_ratio, "seed": args.seed,
+    }
+    results = {}
+    for name in args.names or list(BENCHMARKS):
+        results[name] = BENCHMARKS[name](**shape) if name == "suite" else BENCHMARKS[name]()
+        print(f"[Benchmark] {name}: {json.dumps(results[name], ensure_ascii=False)}")
+
+    if args.output:
+        report = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "results": results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,20 @@
-import winreg
-import subprocess
-import json
-import os
+import time
+import heapq
 import logging
 
-from utils import normalize_vidpid
+from utils import normalize_vidpid, filetime_from_timestamp
 from utils import get_locked_list
+from lock_list_store import get_lock_list_store
+from registry_backend import get_registry
+from enum_index import EnumIndex, ENUM_USB_PATH
 
 LOCK_LIST_FILE = "lock_list.json"
+DELETE_BATCH_SIZE = 500
 
 def update_lock_list(lock_list_file: str, vidpid: str) -> bool:
     try:
         vidpid = normalize_vidpid(vidpid)
-        if not os.path.exists(lock_list_file):
-            data = {"locked": []}
-        else:
-            with open(lock_list_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-        if vidpid not in data.get("locked", []):
-            data["locked"].append(vidpid)
-            with open(lock_list_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4)
+        if get_lock_list_store(lock_list_file).add(vidpid):
             logging.info(f"[Cleaner] 已加入 Lock List: {vidpid}")
             return True
         return False
@@ -29,92 +22,168 @@ def update_lock_list(lock_list_file: str, vidpid: str) -> bool:
         logging.error(f"[Cleaner] 更新 Lock List 失敗: {e}")
         return False
 
-def clean_comdb():
-    comdb_path = r"SYSTEM\\CurrentControlSet\\Control\\COM Name Arbiter"
+def delete_registry_tree(root, relpath: str, errors: list) -> int:
+    """以同一個根 handle 深度優先刪除 relpath 整棵子樹，回傳實際刪除的鍵數，錯誤逐鍵記入 errors"""
+    registry = get_registry()
+    deleted = 0
+    stack = [(relpath, False)]
+    while stack:
+        path, expanded = stack.pop()
+        if not expanded:
+            try:
+                with registry.OpenKey(root, path) as key:
+                    children = [registry.EnumKey(key, i) for i in range(registry.QueryInfoKey(key)[0])]
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                errors.append({"key": path, "error": f"{type(e).__name__} - {e}"})
+                continue
+            stack.append((path, True))
+            stack.extend((f"{path}\\{child}", False) for child in children)
+        else:
+            try:
+                registry.DeleteKey(root, path)
+                deleted += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                errors.append({"key": path, "error": f"{type(e).__name__} - {e}"})
+    return deleted
+
+def delete_enum_keys(root, keys: list[str], batch_size: int = DELETE_BATCH_SIZE, on_removed=None,
+                     vidpid: str = None) -> tuple[int, list, list]:
+    """批次刪除 root 底下多個子樹（共用同一個 handle），回傳 (刪除鍵數, 完整刪除的子樹, 錯誤清單)；
+    每完整刪除一個子樹就呼叫 on_removed(key)。傳入 vidpid 時逐鍵 log 會標記該 VID/PID，由 log 管線彙總成一行"""
+    deleted = 0
+    removed = []
+    errors = []
+    for start in range(0, len(keys), batch_size):
+        batch = keys[start:start + batch_size]
+        for key in batch:
+            error_count = len(errors)
+            deleted += delete_registry_tree(root, key, errors)
+            if len(errors) == error_count:
+                removed.append(key)
+                if on_removed is not None:
+                    on_removed(key)
+                logging.info(f"[Cleaner] 已刪除 ENUM 註冊表項目: {key}",
+                             extra={"vid_pid": vidpid, "aggregate": "[Cleaner] 已刪除 ENUM 註冊表項目", "item": key})
+            else:
+                for item in errors[error_count:]:
+                    logging.error(f"[Cleaner] 刪除 {item['key']} 發生錯誤: {item['error']}")
+        logging.debug(f"[Cleaner] 批次刪除進度 {start + len(batch)}/{len(keys)}，累計刪除 {deleted} 個鍵")
+    return deleted, removed, errors
+
+def select_prunable(instances, policy, now: float = None) -> list[str]:
+    """依 PrunePolicy 挑出要刪除的實例路徑（由舊到新）：目前接上的實例（keep_present）與未超過 max_age_days 天的
+    實例中最新的 keep_instances 個保留，其餘刪除。保留者以 heapq.nlargest 選出（O(n log k)），
+    其餘建堆後依 LastWriteTime 由舊到新取出"""
+    now = time.time() if now is None else now
+    candidates = [item for item in instances if not (policy.keep_present and item.present)]
+    fresh = candidates
+    if policy.max_age_days:
+        cutoff = filetime_from_timestamp(now - policy.max_age_days * 86400)
+        fresh = [item for item in candidates if item.last_write >= cutoff]
+    keep = {item.path for item in heapq.nlargest(policy.keep_instances, fresh, key=lambda item: item.last_write)}
+    heap = [(item.last_write, item.path) for item in candidates if item.path not in keep]
+    heapq.heapify(heap)
+    return [heapq.heappop(heap)[1] for _ in range(len(heap))]
+
+def clean_comdb(enumerators=None, dry_run: bool = False, index: EnumIndex = None):
+    """釋放 ComDB 中已無裝置使用的 COM 編號（保留仍存在於 Enum 或目前接上的埠），回傳 reconcile_comdb 摘要；失敗時回傳 None。
+    傳入本次執行的完整 index 時，使用中的埠由索引取得，不再走訪 Enum"""
+    from comdb import reconcile_comdb, SERIAL_ENUMERATORS
     try:
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, comdb_path, 0, winreg.KEY_SET_VALUE) as key:
-            winreg.SetValueEx(key, "ComDB", 0, winreg.REG_BINARY, b'\x00' * 128)
-        logging.info("[Cleaner] ComDB 位元已清空（128 bytes）")
+        summary = reconcile_comdb(enumerators or SERIAL_ENUMERATORS, dry_run=dry_run, index=index)
+        freed = ", ".join(f"COM{port}" for port in summary["freed"][:20]) + ("..." if len(summary["freed"]) > 20 else "")
+        logging.info(f"[Cleaner] ComDB 共 {summary['size_ports']} 個埠：已保留 {summary['reserved']}、使用中 {summary['in_use']}，"
+                     f"{'可釋放' if dry_run else '釋放'} {len(summary['freed'])} 個 {freed}")
+        if not dry_run and not summary["written"]:
+            logging.info("[Cleaner] ComDB 未變動，不寫回")
+        return summary
     except PermissionError:
         logging.warning("[Cleaner] 權限不足，請使用系統管理員身分執行")
     except FileNotFoundError:
         logging.warning("[Cleaner] COMDB 註冊表不存在，可能尚未建立過裝置")
     except Exception as e:
         logging.error(f"[Cleaner] 清除 ComDB 位元失敗: {type(e).__name__} - {e}")
+    return None
 
-def clean_enum_for_vidpid(vidpid: str):
+def clean_enum_for_vidpid(vidpid: str, index: EnumIndex = None, skip_locked: bool = True, journal=None, policy=None) -> int:
+    """刪除 vidpid 所有 ENUM 實例；傳入 index 時沿用既有索引並於刪除後就地更新。
+    skip_locked=False 供同一次執行內的補清重試使用（此時 vidpid 已剛加入 Lock List）。
+    傳入 journal（CleanupJournal）時先記錄刪除計畫，並逐一記錄已刪除的實例，供中斷後接續。
+    傳入 policy（PrunePolicy）時只刪除 select_prunable 挑出的舊實例。回傳刻意保留的實例數"""
     vidpid = normalize_vidpid(vidpid)
 
     locked_list = get_locked_list(LOCK_LIST_FILE)
-    if vidpid in locked_list:
+    if skip_locked and vidpid in locked_list:
         logging.info(f"[Cleaner] {vidpid} 已存在於 Lock List，略過清除")
-        return
+        return 0
 
-    base_key = r"SYSTEM\\CurrentControlSet\\Enum\\USB"
-    to_delete = []
-    subkeys = []
+    registry = get_registry()
     try:
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, base_key, 0, winreg.KEY_ALL_ACCESS) as root:
-            i = 0
-            while True:
-                try:
-                    subkey_name = winreg.EnumKey(root, i)
-                    subkeys.append(subkey_name)
-                    compare_key = normalize_vidpid(subkey_name)
-                    if compare_key == vidpid:
-                        with winreg.OpenKey(root, subkey_name) as dev_key:
-                            for j in range(winreg.QueryInfoKey(dev_key)[0]):
-                                try:
-                                    child = winreg.EnumKey(dev_key, j)
-                                    to_delete.append(f"{subkey_name}\\{child}")
-                                except OSError:
-                                    continue
-                    i += 1
-                except OSError:
-                    break
+        if index is None:
+            index = EnumIndex.build(only={vidpid})
 
-        if not to_delete:
-            logging.info(f"[Cleaner] 找不到匹配 {vidpid} 的 VID/PID 項目，無項目可刪")
-            logging.debug(f"[Cleaner] 當前可見 USB 子鍵: {subkeys}")
-            return
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, index.enum_path, 0, registry.KEY_ALL_ACCESS) as root:
+            kept = 0
+            if policy is None:
+                to_delete = index.instance_paths(root, vidpid)
+            else:
+                instances = index.instance_details(root, vidpid)
+                to_delete = select_prunable(instances, policy)
+                kept = len(instances) - len(to_delete)
+                logging.info(f"[Cleaner] {vidpid} 部分清理：保留 {kept} 個實例"
+                             f"（目前接上 {sum(item.present for item in instances)} 個），刪除最舊的 {len(to_delete)} 個")
+            if journal is not None:
+                to_delete = journal.pending_keys(vidpid, to_delete)
+            if not to_delete and kept:
+                update_lock_list(LOCK_LIST_FILE, vidpid)
+                if journal is not None:
+                    journal.completed(vidpid)
+                return kept
+            if not to_delete:
+                logging.info(f"[Cleaner] 找不到匹配 {vidpid} 的 VID/PID 項目，無項目可刪")
+                logging.debug(f"[Cleaner] {vidpid} 對應的 USB 子鍵: {index.subkeys(vidpid)}")
+                if journal is not None and journal.resuming(vidpid):
+                    # 上次已刪完但在加入 Lock List 前中斷
+                    update_lock_list(LOCK_LIST_FILE, vidpid)
+                    journal.completed(vidpid)
+                return 0
+
+            on_removed = None
+            if journal is not None:
+                journal.plan(vidpid, to_delete)
+                on_removed = lambda key: journal.key_deleted(vidpid, key)
+            deleted, removed, errors = delete_enum_keys(root, to_delete, on_removed=on_removed, vidpid=vidpid)
+            index.discard_instances(vidpid, removed)
+            logging.info(f"[Cleaner] {vidpid} 共刪除 {deleted} 個註冊表鍵（{len(removed)}/{len(to_delete)} 個裝置實例），失敗 {len(errors)} 項",
+                         extra={"vid_pid": vidpid})
 
-        for key in to_delete:
-            try:
-                subprocess.run(
-                    f'reg delete "HKLM\\{base_key}\\{key}" /f',
-                    shell=True,
-                    check=True,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                logging.info(f"[Cleaner] 已刪除 ENUM 註冊表項目: {key}")
-            except subprocess.CalledProcessError as e:
-                logging.error(f"[Cleaner] 刪除 {key} 發生錯誤: {e.stderr}")
-        
         update_lock_list(LOCK_LIST_FILE, vidpid)
+        if journal is not None:
+            journal.completed(vidpid)
+        return kept
 
     except PermissionError:
         logging.warning("[Cleaner] 權限不足，請使用系統管理員身分執行")
     except Exception as e:
         logging.error(f"[Cleaner] 清除 ENUM 失敗: {type(e).__name__} - {e}")
+    return 0
 
 def clean_enum_for_subkey(subkey: str):
-    base_key = r"SYSTEM\\CurrentControlSet\\Enum\\USB"
+    registry = get_registry()
     try:
-        full_path = f"{base_key}\\{subkey}"
-        subprocess.run(
-            f'reg delete "HKLM\\{full_path}" /f',
-            shell=True,
-            check=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-        logging.info(f"[Cleaner] [子鍵清理] 已刪除 ENUM 子鍵項目: {subkey}")
-    except subprocess.CalledProcessError as e:
-        logging.error(f"[Cleaner] [子鍵清理] 刪除 {subkey} 發生錯誤: {e.stderr}")
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_PATH, 0, registry.KEY_ALL_ACCESS) as root:
+            errors = []
+            delete_registry_tree(root, subkey, errors)
+        if errors:
+            for item in errors:
+                logging.error(f"[Cleaner] [子鍵清理] 刪除 {item['key']} 發生錯誤: {item['error']}")
+        else:
+            logging.info(f"[Cleaner] [子鍵清理] 已刪除 ENUM 子鍵項目: {subkey}")
     except PermissionError:
         logging.warning(f"[Cleaner] [子鍵清理] 權限不足，請使用系統管理員身分執行")
     except Exception as e:
-        logging.error(f"[Cleaner] [子鍵清理] 清除 {subkey} 失敗: {type(e).__name__} - {e}")
\ No newline at end of file
+        logging.error(f"[Cleaner] [子鍵清理] 清除 {subkey} 失敗: {type(e).__name__} - {e}")
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import logging
+import threading
+
+JOURNAL_FILE = "cleanup_journal.log"
+LAST_JOURNAL_SUFFIX = ".last"
+SYNC_BATCH = 64
+SYNC_INTERVAL_SECONDS = 1.0
+
+class ResumeState:
+    """中斷的清理執行：依序的 offender 清單、已完成的 VID/PID、各 VID/PID 已寫入計畫與已刪除的鍵"""
+
+    def __init__(self):
+        self.offenders = []
+        self.completed = set()
+        self.planned = {}
+        self.done_keys = {}
+        self.snapshots = []
+
+    def pending_offenders(self) -> list[tuple[str, int]]:
+        return [(vidpid, count) for vidpid, count in self.offenders if vidpid not in self.completed]
+
+def read_journal(journal_file: str) -> tuple[ResumeState, bool]:
+    """讀取 journal，回傳 (狀態, 是否已正常結束)；寫入中斷留下的最後半行會被略過"""
+    state = ResumeState()
+    finished = False
+    seen = set()
+    with open(journal_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logging.warning(f"[Journal] 略過無法解析的紀錄：{line.strip()[:80]}")
+                continue
+            op = entry.get("op")
+            if op in ("begin", "resume"):
+                if entry.get("snapshot"):
+                    state.snapshots.append(entry["snapshot"])
+            elif op == "offender":
+                if entry["vid_pid"] not in seen:
+                    seen.add(entry["vid_pid"])
+                    state.offenders.append((entry["vid_pid"], entry["count"]))
+            elif op == "plan":
+                state.planned.setdefault(entry["vid_pid"], []).extend(entry["keys"])
+            elif op == "deleted":
+                state.done_keys.setdefault(entry["vid_pid"], set()).update(entry["keys"])
+            elif op == "completed":
+                state.completed.add(entry["vid_pid"])
+            elif op == "end":
+                finished = True
+    return state, finished
+
+class CleanupJournal:
+    """清理的預寫式 journal（JSON lines）：刪除前先寫入並 fsync 計畫，刪除完成的鍵累積到 sync_batch 筆
+    或 sync_interval 秒才 fsync 一次；執行被中斷時下次可由 recover() 取回進度接續。"""
+
+    def __init__(self, journal_file: str = JOURNAL_FILE, sync_batch: int = SYNC_BATCH,
+                 sync_interval: float = SYNC_INTERVAL_SECONDS):
+        self.journal_file = journal_file
+        self.last_file = journal_file + LAST_JOURNAL_SUFFIX
+        self.sync_batch = sync_batch
+        self.sync_interval = sync_interval
+        self._file = None
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._last_sync = 0.0
+        self._deleted = {}
+        self.resume_state = None
+
+    def recover(self):
+        """journal 存在且沒有 end 紀錄時回傳 ResumeState，否則回傳 None"""
+        if not os.path.exists(self.journal_file):
+            return None
+        try:
+            state, finished = read_journal(self.journal_file)
+        except Exception as e:
+            logging.error(f"[Journal] 讀取清理 journal 失敗，改為完整執行：{e}")
+            return None
+        if finished:
+            return None
+        self.resume_state = state
+        if state.snapshots:
+            from snapshot import repair_snapshot
+            for snapshot_file in state.snapshots:
+                if snapshot_file:
+                    repair_snapshot(snapshot_file)
+        logging.warning(f"[Journal] 偵測到上次清理未完成：{len(state.completed)}/{len(state.offenders)} 個 VID/PID 已完成，將接續執行")
+        return state
+
+    def resuming(self, vidpid: str) -> bool:
+        """vidpid 是否為上次中斷時已開始刪除的項目"""
+        return self.resume_state is not None and vidpid in self.resume_state.planned
+
+    def pending_keys(self, vidpid: str, keys: list[str]) -> list[str]:
+        """排除上次已確認刪除的鍵"""
+        if self.resume_state is None:
+            return keys
+        done = self.resume_state.done_keys.get(vidpid)
+        return [key for key in keys if key not in done] if done else keys
+
+    def _append(self, entries: list[dict], sync: bool) -> None:
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.journal_file, 'a', encoding='utf-8')
+            for entry in entries:
+                self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._unsynced += len(entries)
+            if sync or self._unsynced >= self.sync_batch or time.monotonic() - self._last_sync >= self.sync_interval:
+                self._sync()
+
+    def _sync(self) -> None:
+        for vidpid, keys in self._deleted.items():
+            self._file.write(json.dumps({"op": "deleted", "vid_pid": vidpid, "keys": keys}, ensure_ascii=False) + "\n")
+        self._deleted = {}
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def begin(self, snapshot_file: str = None, resume: bool = False) -> None:
+        if not resume and os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+        self._append([{"op": "resume" if resume else "begin", "time": time.time(), "snapshot": snapshot_file}], sync=True)
+
+    def add_offenders(self, offenders) -> None:
+        """記錄本次要處理的 VID/PID（一次寫入、一次 fsync）"""
+        self._append([{"op": "offender", "vid_pid": vidpid, "count": count} for vidpid, count in offenders], sync=True)
+
+    def plan(self, vidpid: str, keys: list[str]) -> None:
+        """刪除 vidpid 的鍵之前呼叫，確保計畫已落地"""
+        self._append([{"op": "plan", "vid_pid": vidpid, "keys": keys}], sync=True)
+
+    def key_deleted(self, vidpid: str, key: str) -> None:
+        """記錄一個已刪除的實例鍵（批次 fsync；遺失的紀錄在接續時只會多嘗試一次刪除）"""
+        with self._lock:
+            self._deleted.setdefault(vidpid, []).append(key)
+            self._unsynced += 1
+            if self._file is not None and (self._unsynced >= self.sync_batch
+                                           or time.monotonic() - self._last_sync >= self.sync_interval):
+                self._sync()
+
+    def completed(self, vidpid: str) -> None:
+        """vidpid 已刪除並加入 Lock List"""
+        self._append([{"op": "completed", "vid_pid": vidpid}], sync=True)
+
+    def finish(self) -> None:
+        """寫入 end 並把 journal 改名為 .last（保留給 --rollback 使用）"""
+        self._append([{"op": "end", "time": time.time()}], sync=True)
+        with self._lock:
+            self._file.close()
+            self._file = None
+        os.replace(self.journal_file, self.last_file)
+
+def rollback(journal_file: str = JOURNAL_FILE) -> int:
+    """依 journal 找出清理過的 VID/PID，從清理前快照還原其 Enum\\USB 子樹；回傳還原的鍵數。
+    執行中的 journal 不存在時使用上次完成的 .last"""
+    from snapshot import SnapshotReader, restore_vidpid, repair_snapshot
+
+    path = journal_file if os.path.exists(journal_file) else journal_file + LAST_JOURNAL_SUFFIX
+    if not os.path.exists(path):
+        logging.error("[Journal] 找不到清理 journal，無法還原")
+        return 0
+    state, _ = read_journal(path)
+    snapshots = [snapshot for snapshot in state.snapshots if snapshot and repair_snapshot(snapshot)]
+    if not snapshots:
+        logging.error("[Journal] journal 沒有可用的清理前快照（snapshot.enabled 未開啟或快照已被清除），無法還原")
+        return 0
+
+    restored = 0
+    for vidpid in state.planned:
+        source = None
+        for snapshot_file in snapshots:
+            with SnapshotReader(snapshot_file) as snapshot:
+                if snapshot.vidpid_groups(vidpid):
+                    source = snapshot_file
+                    break
+        if source is None:
+            logging.warning(f"[Journal] 快照中找不到 {vidpid}，略過還原")
+            continue
+        try:
+            restored += restore_vidpid(source, vidpid)
+        except Exception as e:
+            logging.error(f"[Journal] 還原 {vidpid} 失敗：{e}")
+    logging.info(f"[Journal] 還原完成：{len(state.planned)} 個 VID/PID，共 {restored} 個鍵（注意：Lock List 不會自動移除）")
+    return restored
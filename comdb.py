@@ -0,0 +1,129 @@
+import re
+from registry_backend import get_registry
+
+COMDB_PATH = r"SYSTEM\\CurrentControlSet\\Control\\COM Name Arbiter"
+SERIALCOMM_PATH = r"HARDWARE\\DEVICEMAP\\SERIALCOMM"
+ENUM_PATH = r"SYSTEM\\CurrentControlSet\\Enum"
+# 會建立 COM 埠的列舉器：USB CDC/廠商驅動、FTDI、主機板內建（ACPI）、藍牙 SPP、PCI 擴充卡
+SERIAL_ENUMERATORS = ("USB", "FTDIBUS", "ACPI", "BTHENUM", "PCI")
+
+_PORT_PATTERN = re.compile(r"^COM(\d+)$", re.IGNORECASE)
+
+def parse_port(name) -> int:
+    """'COM12' → 12，其他名稱（LPT1 等）回傳 None"""
+    match = _PORT_PATTERN.match(name.strip()) if isinstance(name, str) else None
+    return int(match.group(1)) if match else None
+
+def ports_in_bitmap(data: bytes) -> set[int]:
+    """ComDB 中已保留的 COM 編號（第 n 個位元為 COMn+1，位元組內由低位元開始）"""
+    bits = int.from_bytes(data, "little")
+    ports = set()
+    while bits:
+        low = bits & -bits
+        ports.add(low.bit_length())
+        bits ^= low
+    return ports
+
+def bitmap_for_ports(ports, size: int) -> bytes:
+    """以 COM 編號建立 size 位元組的 ComDB（超出範圍的編號忽略）"""
+    bits = 0
+    for port in ports:
+        if 1 <= port <= size * 8:
+            bits |= 1 << (port - 1)
+    return bits.to_bytes(size, "little")
+
+def reconcile_bitmap(data: bytes, in_use) -> tuple[bytes, list[int]]:
+    """只清除不在 in_use 內的已保留位元；整個點陣圖轉成整數一次 AND（以機器字組為單位運算，與大小無關），
+    回傳 (新的 ComDB, 被釋放的 COM 編號)"""
+    old = int.from_bytes(data, "little")
+    keep = int.from_bytes(bitmap_for_ports(in_use, len(data)), "little")
+    new = old & keep
+    return new.to_bytes(len(data), "little"), sorted(ports_in_bitmap((old ^ new).to_bytes(len(data), "little")))
+
+def _port_value(registry, key, name: str):
+    try:
+        return parse_port(registry.QueryValueEx(key, name)[0])
+    except OSError:
+        return None
+
+def indexed_enumerators(index) -> set[str]:
+    """index（EnumIndex）完整涵蓋的列舉器；只索引部分 VID/PID 時為空集合"""
+    if index is None or not index.complete:
+        return set()
+    return {name.upper() for name in index.enumerators} if index.enumerators else {"USB"}
+
+def live_com_ports(enumerators=SERIAL_ENUMERATORS, index=None) -> set[int]:
+    """仍在使用中的 COM 編號：目前接上的埠（DEVICEMAP\\SERIALCOMM）加上 Enum 內仍存在的裝置實例
+    Device Parameters\\PortName（清理後剩下的實例即為仍保留的裝置）。
+    傳入本次執行的完整 EnumIndex 時，其涵蓋的列舉器直接由索引取得（EnumIndex.com_ports，不再走訪一次），
+    只有索引未涵蓋的列舉器（ACPI、PCI 等通常很小）才另外走訪。
+    列舉器不存在時略過，權限不足等其他錯誤往外拋（此時不應修改 ComDB）"""
+    registry = get_registry()
+    ports = set()
+    covered = indexed_enumerators(index) & {name.upper() for name in enumerators}
+    if covered:
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, index.enum_path) as root:
+            ports.update(index.com_ports(root, covered))
+    try:
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, SERIALCOMM_PATH) as key:
+            for i in range(registry.QueryInfoKey(key)[1]):
+                try:
+                    port = parse_port(registry.EnumValue(key, i)[1])
+                except OSError:
+                    break
+                if port is not None:
+                    ports.add(port)
+    except FileNotFoundError:
+        pass
+
+    for enumerator in enumerators:
+        if enumerator.upper() in covered:
+            continue
+        try:
+            root = registry.OpenKey(registry.HKEY_LOCAL_MACHINE, f"{ENUM_PATH}\\{enumerator}")
+        except FileNotFoundError:
+            continue
+        with root:
+            device_keys = [registry.EnumKey(root, i) for i in range(registry.QueryInfoKey(root)[0])]
+            for device in device_keys:
+                try:
+                    with registry.OpenKey(root, device) as dev_key:
+                        instances = [registry.EnumKey(dev_key, i) for i in range(registry.QueryInfoKey(dev_key)[0])]
+                except FileNotFoundError:
+                    continue
+                for instance in instances:
+                    try:
+                        with registry.OpenKey(root, f"{device}\\{instance}\\Device Parameters") as params:
+                            port = _port_value(registry, params, "PortName")
+                    except FileNotFoundError:
+                        continue
+                    if port is not None:
+                        ports.add(port)
+    return ports
+
+def reconcile_comdb(enumerators=SERIAL_ENUMERATORS, dry_run: bool = False, index=None) -> dict:
+    """讀取 ComDB（任意大小），保留使用中裝置的 COM 編號、只釋放已無裝置的編號；點陣圖有變動且非 dry_run 時才寫回。
+    index 為本次執行的 EnumIndex（見 live_com_ports）。回傳 {size_ports, reserved, in_use, freed, written}"""
+    registry = get_registry()
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, COMDB_PATH) as key:
+        data, _ = registry.QueryValueEx(key, "ComDB")
+    data = bytes(data)
+    in_use = live_com_ports(enumerators, index)
+    new_data, freed = reconcile_bitmap(data, in_use)
+    summary = {
+        "size_ports": len(data) * 8,
+        "reserved": len(ports_in_bitmap(data)),
+        "in_use": len(in_use),
+        "freed": freed,
+        "written": False,
+    }
+    if new_data != data and not dry_run:
+        # 寫回前重新讀取，只清除 freed 的位元，期間新裝置取得的編號不會被覆蓋
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, COMDB_PATH, 0, registry.KEY_READ | registry.KEY_SET_VALUE) as key:
+            current = bytes(registry.QueryValueEx(key, "ComDB")[0])
+            freed_bits = int.from_bytes(bitmap_for_ports(freed, len(current)), "little")
+            final = (int.from_bytes(current, "little") & ~freed_bits).to_bytes(len(current), "little")
+            if final != current:
+                registry.SetValueEx(key, "ComDB", 0, registry.REG_BINARY, final)
+                summary["written"] = True
+    return summary
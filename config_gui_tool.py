@@ -1,20 +1,82 @@
 import tkinter as tk
-import json
+import copy
 import os
 import logging
 
-from utils import normalize_vidpid, get_locked_list
+from utils import get_locked_list
+from config_model import AppConfig, ConfigError, CONFIG_FILE, DEFAULT_CONFIG, DEFAULT_NOTIFY_THRESHOLD
+from config_model import load_config, validate_config, normalize_device_vidpid
+from device_table import COLUMNS, DeviceTableModel, ScanWorker
 from tkinter import messagebox, ttk
 
-CONFIG_FILE = "config.json"
 WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+TABLE_ROWS = 15
+SCAN_POLL_MS = 100
+COLUMN_TITLES = {"vid_pid": "VID/PID", "instances": "實例數", "threshold": "閾值", "locked": "已鎖定", "usb_flags": "UsbFlags"}
 
-DEFAULT_CONFIG = {
-    "threshold": 100,
-    "log_file": "enum_guardian_log.txt",
-    "scan_strategy": {"mode": "scheduled", "time": "12:30", "days": [], "enabled": True},
-    "monitored_devices": []
-}
+class VirtualTable:
+    """固定 TABLE_ROWS 列的 Treeview，捲動時只替換可見列的內容，資料量再大也只建立這些列"""
+
+    def __init__(self, parent, model: DeviceTableModel, rows: int = TABLE_ROWS):
+        self.model = model
+        self.rows = rows
+        self.offset = 0
+        self.visible = []
+        self.frame = tk.Frame(parent)
+        self.tree = ttk.Treeview(self.frame, columns=COLUMNS, show="headings", height=rows, selectmode="extended")
+        for column in COLUMNS:
+            self.tree.heading(column, text=COLUMN_TITLES[column], command=lambda c=column: self.sort(c))
+            self.tree.column(column, width=110 if column == "vid_pid" else 70, anchor="w" if column == "vid_pid" else "center")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="vertical", command=self.on_scroll)
+        self.tree.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.tree.bind("<<TreeviewSelect>>", self.on_select)
+        self.tree.bind("<MouseWheel>", lambda e: self.scroll_to(self.offset - (1 if e.delta > 0 else -1) * 3))
+        self.tree.bind("<Button-4>", lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind("<Button-5>", lambda e: self.scroll_to(self.offset + 3))
+
+    def grid(self, **kwargs):
+        self.frame.grid(**kwargs)
+
+    def sort(self, column: str):
+        self.model.sort_by(column)
+        self.render()
+
+    def scroll_to(self, offset: int):
+        self.offset = self.model.clamp_offset(offset, self.rows)
+        self.render()
+
+    def on_scroll(self, action, value, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(value) * len(self.model)))
+        elif action == "scroll":
+            self.scroll_to(self.offset + int(value) * (self.rows if unit == "pages" else 1))
+
+    def on_select(self, _event=None):
+        chosen = {self.visible[int(iid)] for iid in self.tree.selection() if int(iid) < len(self.visible)}
+        self.model.select_visible(self.visible, chosen)
+
+    def render(self):
+        """依目前 offset 更新可見列與捲軸位置"""
+        self.offset = self.model.clamp_offset(self.offset, self.rows)
+        page = self.model.page(self.offset, self.rows)
+        self.visible = [row.vid_pid for row in page]
+        for slot in range(self.rows):
+            iid = str(slot)
+            if slot < len(page):
+                if self.tree.exists(iid):
+                    self.tree.item(iid, values=page[slot].values())
+                    self.tree.move(iid, "", slot)
+                else:
+                    self.tree.insert("", slot, iid=iid, values=page[slot].values())
+            elif self.tree.exists(iid):
+                self.tree.delete(iid)
+        self.tree.selection_set([str(slot) for slot, vidpid in enumerate(self.visible) if vidpid in self.model.selected])
+        total = len(self.model)
+        if total:
+            self.scrollbar.set(self.offset / total, min(1.0, (self.offset + self.rows) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
 class ConfigGUI:
     def __init__(self, root):
@@ -26,25 +88,32 @@ class ConfigGUI:
                 self.root.iconbitmap(icon_path)
             except Exception as e:
                 logging.warning(f"[ConfigGUI] 載入圖示失敗: {e}")
-        self.config = self.load_config()
+        self.app_config = self.load_config()
+        self.config = self.app_config.data
         self.locked_list = get_locked_list()
+        self.table_model = DeviceTableModel()
+        self.table_model.load(self.app_config.devices, self.locked_list)
+        self.scan_worker = None
         self.build_widgets()
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
     def load_config(self):
-        if not os.path.exists(CONFIG_FILE):
-            return DEFAULT_CONFIG.copy()
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
+            return load_config(CONFIG_FILE)
+        except ConfigError as e:
             logging.error(f"[ConfigGUI] config.json 解析失敗：{e}")
             messagebox.showerror("錯誤", "config.json 格式錯誤，請修正或刪除重新建立")
-            return DEFAULT_CONFIG.copy()
+            return AppConfig(copy.deepcopy(DEFAULT_CONFIG), CONFIG_FILE)
 
     def save_config(self):
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=4, ensure_ascii=False)
-        logging.info("[ConfigGUI] 設定已儲存至 config.json")
+        try:
+            validate_config(self.app_config.to_dict())
+        except ConfigError as e:
+            messagebox.showerror("錯誤", f"設定內容有誤，未儲存：{e}")
+            return
+        if self.app_config.save():
+            logging.info("[ConfigGUI] 設定已儲存至 config.json")
+        self.config = self.app_config.data
         messagebox.showinfo("完成", "設定已儲存！")
 
     def build_widgets(self):
@@ -79,10 +148,22 @@ class ConfigGUI:
             self.day_vars[day] = var
 
         row += 1
-        tk.Label(self.root, text="監控 VID:PID").grid(row=row, column=0, sticky='ne')
-        self.vid_listbox = tk.Listbox(self.root, height=5, width=30, selectmode=tk.MULTIPLE)
-        self.vid_listbox.grid(row=row, column=1, sticky='w')
-        self.refresh_vid_list()
+        tk.Label(self.root, text="篩選 VID/PID").grid(row=row, column=0, sticky='e')
+        frame_scan = tk.Frame(self.root)
+        frame_scan.grid(row=row, column=1, sticky='w')
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *_: self.apply_filter())
+        tk.Entry(frame_scan, textvariable=self.filter_var, width=12).pack(side='left')
+        self.scan_button = tk.Button(frame_scan, text="掃描註冊表", command=self.toggle_scan)
+        self.scan_button.pack(side='left')
+        self.status_var = tk.StringVar(value=f"監控 {len(self.app_config.devices)} 個裝置")
+        tk.Label(frame_scan, textvariable=self.status_var).pack(side='left')
+
+        row += 1
+        tk.Label(self.root, text="裝置").grid(row=row, column=0, sticky='ne')
+        self.table = VirtualTable(self.root, self.table_model)
+        self.table.grid(row=row, column=1, sticky='w')
+        self.table.render()
 
         row += 1
         self.new_vid_var = tk.StringVar()
@@ -99,19 +180,53 @@ class ConfigGUI:
         tk.Button(self.root, text="刪除選取", command=self.remove_selected).grid(row=row, column=0)
         tk.Button(self.root, text="儲存設定", command=self.save).grid(row=row, column=1)
 
-    def refresh_vid_list(self):
-        self.vid_listbox.delete(0, tk.END)
-        for item in self.config.get("monitored_devices", []):
-            norm_vid = normalize_vidpid(item.get("vid_pid", ""))
-            if norm_vid in self.locked_list:
-                logging.info(f"[ConfigGUI] 裝置 {norm_vid} 已在 lock_list.json 中標示為鎖定，略過顯示。")
-                continue
-            line = f'{norm_vid} (閾值: {item.get("notify_threshold", "?")})'
-            self.vid_listbox.insert(tk.END, line)
+    def apply_filter(self):
+        self.table_model.set_filter(self.filter_var.get())
+        self.table.scroll_to(0)
+
+    def toggle_scan(self):
+        """開始背景掃描；掃描中再按一次則取消"""
+        if self.scan_worker is not None and self.scan_worker.running:
+            self.scan_worker.cancel()
+            self.status_var.set("取消中...")
+            return
+        self.table_model.begin_scan()
+        self.scan_worker = ScanWorker(workers=self.config.get("scan_workers", 1),
+                                      enumerators=self.config.get("scan_enumerators"))
+        self.scan_worker.start()
+        self.scan_button.config(text="取消掃描")
+        self.status_var.set("掃描中...")
+        self.root.after(SCAN_POLL_MS, self.poll_scan)
+
+    def poll_scan(self):
+        """主執行緒定期取出背景掃描的結果並重繪可見列"""
+        worker = self.scan_worker
+        if worker is None:
+            return
+        finished = False
+        for kind, payload in worker.poll():
+            if kind == "usb_flags":
+                self.table_model.set_usb_flags(payload)
+            elif kind == "counts":
+                self.table_model.apply_counts(payload)
+                self.status_var.set(f"掃描中... {len(self.table_model)} 個 VID/PID")
+            elif kind == "error":
+                messagebox.showerror("錯誤", f"掃描註冊表失敗：{payload}")
+            elif kind == "done":
+                finished = True
+                state = "已取消" if payload["cancelled"] else "完成"
+                self.status_var.set(f"掃描{state}：{payload['devices']} 個裝置鍵，{payload['seconds']:.1f}s")
+                logging.info(f"[ConfigGUI] 背景掃描{state}：{payload['devices']} 個裝置鍵，耗時 {payload['seconds']:.2f}s")
+        self.table.render()
+        if finished:
+            self.scan_button.config(text="掃描註冊表")
+            self.scan_worker = None
+        else:
+            self.root.after(SCAN_POLL_MS, self.poll_scan)
 
     def add_vid(self):
-        vid = normalize_vidpid(self.new_vid_var.get())
-        if not vid or len(vid) < 4:
+        vid = normalize_device_vidpid(self.new_vid_var.get())
+        if len(vid) != 8:
             messagebox.showerror("錯誤", "請輸入合法的 VID:PID")
             return
 
@@ -126,10 +241,10 @@ class ConfigGUI:
             messagebox.showerror("錯誤", "請輸入有效的閾值數字（如 30）")
             return
 
-        if all(normalize_vidpid(d["vid_pid"]) != vid for d in self.config["monitored_devices"]):
-            self.config["monitored_devices"].append({"vid_pid": vid, "notify_threshold": threshold})
-            self.refresh_vid_list()
-            self.notify_threshold_var.set("50")
+        if self.app_config.add_device(vid, threshold):
+            self.table_model.set_monitored(vid, threshold)
+            self.table.render()
+            self.notify_threshold_var.set(str(DEFAULT_NOTIFY_THRESHOLD))
             self.save_config()
             logging.info(f"[ConfigGUI] 已新增監控裝置：{vid} 閾值={threshold}")
         else:
@@ -137,34 +252,46 @@ class ConfigGUI:
             logging.warning(f"[ConfigGUI] 嘗試加入重複裝置：{vid}")
 
     def remove_selected(self):
-        if not self.vid_listbox.curselection():
-            messagebox.showinfo("提示", "請先選取要刪除的項目")
+        selected = self.table_model.selected_monitored()
+        if not selected:
+            messagebox.showinfo("提示", "請先選取要刪除的監控裝置")
             return
 
-        selected = [normalize_vidpid(self.vid_listbox.get(i)) for i in self.vid_listbox.curselection()]
-        self.config["monitored_devices"] = [
-            d for d in self.config["monitored_devices"]
-            if normalize_vidpid(d["vid_pid"]) not in selected
-        ]
-        self.refresh_vid_list()
+        self.app_config.remove_devices(selected)
+        for vidpid in selected:
+            self.table_model.set_monitored(vidpid, None)
+        self.table.render()
         self.save_config()
         logging.info(f"[ConfigGUI] 刪除裝置：{selected}")
 
     def save(self):
         try:
-            self.config["threshold"] = int(self.threshold_var.get())
+            threshold = int(self.threshold_var.get())
         except ValueError:
             messagebox.showerror("錯誤", "請輸入有效的整數門檻")
             return
-        self.config["log_file"] = self.log_file_var.get()
-        self.config["scan_strategy"] = {
+        scan_strategy = dict(self.config.get("scan_strategy", {}))
+        scan_strategy.update({
             "enabled": self.enabled_var.get(),
             "time": self.time_var.get(),
             "days": [day for day, var in self.day_vars.items() if var.get()],
             "mode": "scheduled"
-        }
+        })
+        values = {"threshold": threshold, "log_file": self.log_file_var.get(), "scan_strategy": scan_strategy}
+        # 先以副本驗證，通過後才寫入 AppConfig，避免錯誤的設定留在記憶體中被之後的寫回帶出
+        try:
+            validate_config({**self.app_config.to_dict(), **values})
+        except ConfigError as e:
+            messagebox.showerror("錯誤", f"設定內容有誤，未儲存：{e}")
+            return
+        self.app_config.update(**values)
         self.save_config()
 
+    def close(self):
+        if self.scan_worker is not None:
+            self.scan_worker.cancel()
+        self.root.destroy()
+
     def run(self):
         self.root.mainloop()
 
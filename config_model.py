@@ -0,0 +1,272 @@
+import os
+import json
+import copy
+import logging
+import threading
+from collections import namedtuple
+
+CONFIG_FILE = "config.json"
+DEFAULT_NOTIFY_THRESHOLD = 50
+DEFAULT_PRUNE_KEEP = 5
+
+DEFAULT_CONFIG = {
+    "threshold": 100,
+    "log_file": "enum_guardian_log.txt",
+    "scan_strategy": {"mode": "scheduled", "time": "12:30", "days": [], "enabled": True},
+    "monitored_devices": []
+}
+
+# 選用區段：值必須是 dict（各模組自行以 .get 取預設值）
+SECTIONS = ("scan_cache", "metrics", "verify", "pipeline", "snapshot", "journal", "usb_flags", "prune", "logging")
+
+# 部分清理：保留目前接上的實例與 max_age_days 天內（0 為不限）最新的 keep_instances 個，其餘由舊到新刪除
+PrunePolicy = namedtuple("PrunePolicy", ["keep_instances", "max_age_days", "keep_present"])
+
+class ConfigError(ValueError):
+    """config.json 無法解析或結構不符"""
+
+class MonitoredDevice:
+    """monitored_devices 的一筆設定；vid_pid 為正規化後的 8 碼 VID/PID，raw 為設定檔中的原始寫法。
+    keep_instances / max_age_days 為該裝置的部分清理設定（None 表示未指定）"""
+    __slots__ = ("vid_pid", "notify_threshold", "raw", "extra", "keep_instances", "max_age_days")
+
+    def __init__(self, vid_pid: str, notify_threshold: int = DEFAULT_NOTIFY_THRESHOLD, raw: str = None, extra: dict = None,
+                 keep_instances: int = None, max_age_days: float = None):
+        self.vid_pid = vid_pid
+        self.notify_threshold = notify_threshold
+        self.raw = raw or vid_pid
+        self.extra = extra or {}
+        self.keep_instances = keep_instances
+        self.max_age_days = max_age_days
+
+    def to_dict(self) -> dict:
+        return {"vid_pid": self.raw, "notify_threshold": self.notify_threshold, **self.extra}
+
+def normalize_device_vidpid(value: str) -> str:
+    """設定檔中的 VID/PID 正規化：去掉 &MI_xx，接受 VID_XXXX&PID_YYYY、VIDXXXX&PIDYYYY、XXXX:YYYY 等寫法"""
+    import re
+    from utils import normalize_vidpid
+
+    value = re.sub(r"&MI_[0-9A-Fa-f]{2}", "", value.strip())
+    match = re.fullmatch(r"VID_?([0-9A-F]{4})[&_:\s]*PID_?([0-9A-F]{4})", value, re.IGNORECASE)
+    if match:
+        return (match.group(1) + match.group(2)).upper()
+    return normalize_vidpid(value)
+
+def validate_config(data) -> dict:
+    """檢查 config.json 結構並補上預設值，回傳新的 dict；結構錯誤時拋出 ConfigError（列出所有問題）"""
+    if not isinstance(data, dict):
+        raise ConfigError("config.json 最外層必須是物件")
+    errors = []
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config.update(copy.deepcopy(data))
+
+    threshold = config["threshold"]
+    if not isinstance(threshold, int) or isinstance(threshold, bool) or threshold < 1:
+        errors.append(f"threshold 必須是正整數：{threshold!r}")
+    if not isinstance(config["log_file"], str) or not config["log_file"]:
+        errors.append(f"log_file 必須是檔名字串：{config['log_file']!r}")
+    if "scan_workers" in config and (not isinstance(config["scan_workers"], int) or config["scan_workers"] < 1):
+        errors.append(f"scan_workers 必須是正整數：{config['scan_workers']!r}")
+    enumerators = config.get("scan_enumerators")
+    if enumerators is not None and (not isinstance(enumerators, list)
+                                    or not all(isinstance(name, str) and name and "\\" not in name for name in enumerators)):
+        errors.append(f"scan_enumerators 必須是列舉器名稱陣列（例如 [\"USB\", \"HID\"]）：{enumerators!r}")
+    for section in ("scan_strategy",) + SECTIONS:
+        if section in config and not isinstance(config[section], dict):
+            errors.append(f"{section} 必須是物件：{config[section]!r}")
+    log_options = config.get("logging", {})
+    if isinstance(log_options, dict):
+        if log_options.get("format", "text") not in ("text", "json"):
+            errors.append(f"logging.format 必須是 \"text\" 或 \"json\"：{log_options['format']!r}")
+        if log_options.get("rotate", "size") not in ("size", "daily", "none"):
+            errors.append(f"logging.rotate 必須是 \"size\"、\"daily\" 或 \"none\"：{log_options['rotate']!r}")
+        for name in ("max_bytes", "backup_count", "batch_size"):
+            value = log_options.get(name, 1)
+            if not isinstance(value, int) or isinstance(value, bool) or value < (0 if name == "backup_count" else 1):
+                errors.append(f"logging.{name} 必須是正整數：{value!r}")
+        interval = log_options.get("flush_interval", 0)
+        if not isinstance(interval, (int, float)) or isinstance(interval, bool) or interval < 0:
+            errors.append(f"logging.flush_interval 必須是非負數（秒）：{interval!r}")
+    if isinstance(config["scan_strategy"], dict) and config["scan_strategy"].get("enabled", False):
+        from scheduler import Schedule
+        try:
+            Schedule(config["scan_strategy"])
+        except (ValueError, KeyError, TypeError) as e:
+            errors.append(f"scan_strategy 設定錯誤：{e}")
+    if not isinstance(config["monitored_devices"], list):
+        errors.append("monitored_devices 必須是陣列")
+
+    if errors:
+        raise ConfigError("；".join(errors))
+    return config
+
+class AppConfig:
+    """編譯後的設定：data 為驗證並補齊預設值的 dict，devices 為以正規化 VID/PID 為鍵的索引（首次使用時才建立）。
+    raw 為檔案中的原始內容；save() 只把刻意變更的鍵（update / 新增、移除裝置）套用到 raw 上寫回，
+    預設值、重複或無法辨識的裝置等原樣保留，內容確實改變時才以暫存檔 + os.replace 寫回。"""
+
+    def __init__(self, data: dict, path: str = CONFIG_FILE, signature=None, raw: dict = None):
+        self.path = path
+        self.data = data
+        self.raw = copy.deepcopy(raw) if raw is not None else {}
+        self.signature = signature
+        self._devices = None
+        self._changed = set()
+        self._lock = threading.RLock()
+
+    @property
+    def threshold(self) -> int:
+        return self.data["threshold"]
+
+    @property
+    def devices(self) -> dict:
+        with self._lock:
+            if self._devices is None:
+                self._devices = self._compile_devices()
+            return self._devices
+
+    def _compile_devices(self) -> dict:
+        devices = {}
+        for item in self.data["monitored_devices"]:
+            if not isinstance(item, dict) or not isinstance(item.get("vid_pid"), str):
+                logging.warning(f"[Config] 略過格式錯誤的監控裝置：{item!r}")
+                continue
+            threshold = item.get("notify_threshold", DEFAULT_NOTIFY_THRESHOLD)
+            if not isinstance(threshold, int) or isinstance(threshold, bool):
+                logging.warning(f"[Config] {item['vid_pid']} 的 notify_threshold 不是整數，改用 {DEFAULT_NOTIFY_THRESHOLD}")
+                threshold = DEFAULT_NOTIFY_THRESHOLD
+            vidpid = normalize_device_vidpid(item["vid_pid"])
+            if len(vidpid) != 8:
+                logging.warning(f"[Config] 無法辨識的 VID/PID，略過：{item['vid_pid']}")
+                continue
+            if vidpid in devices:
+                logging.debug(f"[Config] 重複的監控裝置 {vidpid}，保留第一筆")
+                continue
+            keep = item.get("keep_instances")
+            if keep is not None and (not isinstance(keep, int) or isinstance(keep, bool) or keep < 0):
+                logging.warning(f"[Config] {item['vid_pid']} 的 keep_instances 必須是非負整數，忽略：{keep!r}")
+                keep = None
+            max_age = item.get("max_age_days")
+            if max_age is not None and (not isinstance(max_age, (int, float)) or isinstance(max_age, bool) or max_age < 0):
+                logging.warning(f"[Config] {item['vid_pid']} 的 max_age_days 必須是非負數，忽略：{max_age!r}")
+                max_age = None
+            extra = {key: value for key, value in item.items() if key not in ("vid_pid", "notify_threshold")}
+            devices[vidpid] = MonitoredDevice(vidpid, threshold, item["vid_pid"], extra, keep, max_age)
+        return devices
+
+    def prune_policy(self, vidpid: str):
+        """vidpid 的部分清理設定：裝置有指定 keep_instances / max_age_days，或 prune.enabled 為 true 時回傳 PrunePolicy
+        （未指定的欄位取 prune 區段的值），否則回傳 None（刪除全部實例）"""
+        defaults = self.data.get("prune", {})
+        device = self.devices.get(vidpid)
+        keep = device.keep_instances if device is not None else None
+        max_age = device.max_age_days if device is not None else None
+        if keep is None and max_age is None and not defaults.get("enabled", False):
+            return None
+        return PrunePolicy(keep if keep is not None else defaults.get("keep_instances", DEFAULT_PRUNE_KEEP),
+                           max_age if max_age is not None else defaults.get("max_age_days", 0),
+                           defaults.get("keep_present", True))
+
+    def __contains__(self, vidpid: str) -> bool:
+        return vidpid in self.devices
+
+    def add_device(self, vidpid: str, notify_threshold: int = DEFAULT_NOTIFY_THRESHOLD) -> bool:
+        """加入監控裝置（以正規化 VID/PID 寫入），已存在或格式不符時回傳 False"""
+        vidpid = normalize_device_vidpid(vidpid)
+        with self._lock:
+            if len(vidpid) != 8 or vidpid in self.devices:
+                return False
+            device = MonitoredDevice(vidpid, notify_threshold)
+            self.devices[vidpid] = device
+            self.data["monitored_devices"].append(device.to_dict())
+            self._changed.add("monitored_devices")
+            return True
+
+    def remove_devices(self, vidpids) -> int:
+        """移除多個監控裝置（索引每筆 O(1)，設定清單只掃一次；同一裝置的重複寫法一併移除），回傳實際移除的數量"""
+        with self._lock:
+            removed = set()
+            for vidpid in vidpids:
+                vidpid = normalize_device_vidpid(vidpid)
+                if self.devices.pop(vidpid, None) is not None:
+                    removed.add(vidpid)
+            if removed:
+                self.data["monitored_devices"][:] = [
+                    item for item in self.data["monitored_devices"]
+                    if not (isinstance(item, dict) and isinstance(item.get("vid_pid"), str)
+                            and normalize_device_vidpid(item["vid_pid"]) in removed)]
+                self._changed.add("monitored_devices")
+            return len(removed)
+
+    def update(self, **values) -> None:
+        """更新最上層設定（例如 threshold、scan_strategy），之後由 save() 寫回"""
+        with self._lock:
+            self.data.update(values)
+            self._changed.update(values)
+
+    def to_dict(self) -> dict:
+        """要寫回的內容：檔案原始內容加上刻意變更的鍵"""
+        with self._lock:
+            data = copy.deepcopy(self.raw)
+            for key in self._changed:
+                data[key] = copy.deepcopy(self.data[key])
+            return data
+
+    def save(self, force: bool = False) -> bool:
+        """有變更（或 force）且內容與檔案不同時才寫回，回傳是否實際寫入"""
+        with self._lock:
+            if not self._changed and not force:
+                return False
+            data = self.to_dict()
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    if json.load(f) == data:
+                        self.raw = data
+                        self._changed.clear()
+                        return False
+            except (FileNotFoundError, ValueError):
+                pass
+            tmp_file = f"{self.path}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.path)
+            self.raw = data
+            self._changed.clear()
+            self.signature = _signature(self.path)
+            logging.info(f"[Config] 設定已寫回 {self.path}")
+            return True
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+    except FileNotFoundError:
+        return None
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def load_config(path: str = CONFIG_FILE) -> AppConfig:
+    """讀取並驗證 config.json；檔案 mtime/size 未變時回傳同一個 AppConfig（含尚未寫回的變更）。
+    檔案不存在時使用預設值，JSON 或結構錯誤時拋出 ConfigError"""
+    key = os.path.abspath(path)
+    signature = _signature(path)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None and cached.signature == signature:
+            return cached
+    if signature is None:
+        app_config = AppConfig(copy.deepcopy(DEFAULT_CONFIG), path)
+    else:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except ValueError as e:
+            raise ConfigError(f"config.json 解析失敗：{e}") from e
+        app_config = AppConfig(validate_config(raw), path, signature, raw)
+    with _cache_lock:
+        _cache[key] = app_config
+    return app_config
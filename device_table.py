@@ -0,0 +1,215 @@
+import time
+import queue
+import logging
+import threading
+
+COLUMNS = ("vid_pid", "instances", "threshold", "locked", "usb_flags")
+SCAN_BATCH_SIZE = 200
+SCAN_BATCH_SECONDS = 0.1
+
+class DeviceRow:
+    """裝置表的一列：instances 為 None 表示尚未掃描到，threshold 為 None 表示不在監控清單"""
+    __slots__ = ("vid_pid", "instances", "threshold", "locked", "usb_flags")
+
+    def __init__(self, vid_pid: str):
+        self.vid_pid = vid_pid
+        self.instances = None
+        self.threshold = None
+        self.locked = False
+        self.usb_flags = False
+
+    def values(self) -> tuple:
+        """Treeview 顯示用的欄位值（依 COLUMNS 順序）"""
+        return (self.vid_pid,
+                "" if self.instances is None else self.instances,
+                "" if self.threshold is None else self.threshold,
+                "是" if self.locked else "",
+                "是" if self.usb_flags else "")
+
+class DeviceTableModel:
+    """設定工具裝置表的資料層（不依賴 Tk）：監控清單、Lock List、UsbFlags 與掃描結果合併成一列一個 VID/PID，
+    篩選與排序後的順序只在資料變動後第一次讀取時重算，畫面只需以 page() 取出可見的列"""
+
+    def __init__(self):
+        self._rows = {}
+        self._view = None
+        self.filter_text = ""
+        self.sort_column = "vid_pid"
+        self.sort_reverse = False
+        self.selected = set()
+
+    def _row(self, vidpid: str) -> DeviceRow:
+        row = self._rows.get(vidpid)
+        if row is None:
+            row = self._rows[vidpid] = DeviceRow(vidpid)
+        return row
+
+    def _changed(self) -> None:
+        self._view = None
+
+    def load(self, devices: dict, locked=(), usb_flags=()) -> None:
+        """以監控清單（vidpid → MonitoredDevice 或門檻值）、鎖定清單與已設定 UsbFlags 的 VID/PID 重建表格，保留已掃描的實例數"""
+        for row in self._rows.values():
+            row.threshold = None
+            row.locked = False
+        for vidpid, device in devices.items():
+            self._row(vidpid).threshold = getattr(device, "notify_threshold", device)
+        for vidpid in locked:
+            self._row(vidpid).locked = True
+        self.set_usb_flags(usb_flags)
+        self._changed()
+
+    def set_monitored(self, vidpid: str, threshold=None) -> None:
+        """新增（threshold 為數字）或移出（None）監控清單"""
+        self._row(vidpid).threshold = threshold
+        self._changed()
+
+    def set_usb_flags(self, vidpids) -> None:
+        vidpids = set(vidpids)
+        for row in self._rows.values():
+            row.usb_flags = row.vid_pid in vidpids
+        for vidpid in vidpids - self._rows.keys():
+            self._row(vidpid).usb_flags = True
+        self._changed()
+
+    def begin_scan(self) -> None:
+        """新的一輪掃描：清掉上次的實例數，掃描結果由 apply_counts 累加"""
+        for row in self._rows.values():
+            row.instances = None
+        self._changed()
+
+    def apply_counts(self, counts) -> None:
+        """加入一批 (vidpid, 實例數)；同一 VID/PID 的多個子鍵（&MI_xx）會累加"""
+        for vidpid, count in counts:
+            row = self._row(vidpid)
+            row.instances = (row.instances or 0) + count
+        self._changed()
+
+    def set_filter(self, text: str) -> None:
+        self.filter_text = text.strip().upper()
+        self._changed()
+
+    def sort_by(self, column: str) -> None:
+        """依欄位排序，重複點同一欄時反向"""
+        if column not in COLUMNS:
+            raise ValueError(f"未知的欄位：{column}")
+        self.sort_reverse = not self.sort_reverse if column == self.sort_column else column in ("instances", "threshold")
+        self.sort_column = column
+        self._changed()
+
+    @property
+    def view(self) -> list[str]:
+        """篩選並排序後的 VID/PID 順序（空值一律排在最後）"""
+        if self._view is None:
+            rows = self._rows.values()
+            if self.filter_text:
+                rows = [row for row in rows if self.filter_text in row.vid_pid]
+            column = self.sort_column
+            present = [row for row in rows if getattr(row, column) is not None]
+            missing = [row for row in rows if getattr(row, column) is None]
+            present.sort(key=lambda row: (getattr(row, column), row.vid_pid), reverse=self.sort_reverse)
+            missing.sort(key=lambda row: row.vid_pid)
+            self._view = [row.vid_pid for row in present + missing]
+        return self._view
+
+    def __len__(self) -> int:
+        return len(self.view)
+
+    def __contains__(self, vidpid: str) -> bool:
+        return vidpid in self._rows
+
+    def row(self, vidpid: str) -> DeviceRow:
+        return self._rows[vidpid]
+
+    def page(self, start: int, count: int) -> list[DeviceRow]:
+        """view 中 [start, start + count) 的列"""
+        return [self._rows[vidpid] for vidpid in self.view[max(0, start):max(0, start) + count]]
+
+    def clamp_offset(self, offset: int, visible: int) -> int:
+        return max(0, min(offset, len(self.view) - visible))
+
+    def select_visible(self, visible: list[str], chosen) -> None:
+        """更新可見列的選取狀態（不可見的列維持原狀）"""
+        chosen = set(chosen)
+        for vidpid in visible:
+            if vidpid in chosen:
+                self.selected.add(vidpid)
+            else:
+                self.selected.discard(vidpid)
+
+    def selected_monitored(self) -> list[str]:
+        return sorted(vidpid for vidpid in self.selected
+                      if vidpid in self._rows and self._rows[vidpid].threshold is not None)
+
+class ScanWorker:
+    """在背景執行緒走訪 Enum\\USB（或設定的各列舉器）與 UsbFlags，結果分批放入佇列，由 Tk 主執行緒以 poll() 取出；cancel() 後在下一筆停止。
+
+    事件為 (種類, 內容)：("usb_flags", VID/PID 集合)、("counts", [(vidpid, 實例數), ...])、
+    ("done", {"devices", "seconds", "cancelled"})、("error", 訊息)。
+    """
+
+    def __init__(self, workers: int = 1, batch_size: int = SCAN_BATCH_SIZE, batch_seconds: float = SCAN_BATCH_SECONDS,
+                 enumerators=None):
+        self.workers = workers
+        self.enumerators = enumerators
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+        self.events = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="gui-scan", daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def join(self, timeout: float = None) -> None:
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def poll(self) -> list[tuple]:
+        """取出目前所有事件（不阻塞）"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _run(self) -> None:
+        from enum_index import EnumIndex
+        from usb_flags_manager import list_all_ignore_keys, IGNORE_PREFIX
+        from utils import normalize_vidpid
+
+        start = time.perf_counter()
+        devices = 0
+        try:
+            self.events.put(("usb_flags", {name[len(IGNORE_PREFIX):].upper() for name in list_all_ignore_keys()}))
+            batch = []
+            flushed = time.perf_counter()
+            records = EnumIndex.for_enumerators(self.enumerators).scan(workers=self.workers)
+            try:
+                for record in records:
+                    if self._cancel.is_set():
+                        break
+                    batch.append((normalize_vidpid(record.vidpid), record.instance_count))
+                    devices += 1
+                    if len(batch) >= self.batch_size or time.perf_counter() - flushed >= self.batch_seconds:
+                        self.events.put(("counts", batch))
+                        batch = []
+                        flushed = time.perf_counter()
+            finally:
+                records.close()
+            if batch:
+                self.events.put(("counts", batch))
+        except Exception as e:
+            logging.error(f"[ConfigGUI] 背景掃描失敗：{e}")
+            self.events.put(("error", str(e)))
+        self.events.put(("done", {"devices": devices, "seconds": round(time.perf_counter() - start, 3),
+                                  "cancelled": self._cancel.is_set()}))
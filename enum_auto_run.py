@@ -1,14 +1,13 @@
 import json
 import logging
 import os
-import re
 import sys
+import threading
+import time
 from datetime import datetime
-from utils import normalize_vidpid, get_locked_list
-from monitor import scan_all_vidpid_counts
-from cleaner import clean_enum_for_vidpid, clean_comdb
-from usb_flags_manager import add_ignore_key_to_registry
-from scheduler import should_execute_now
+from scheduler import should_execute_now, compile_schedule
+import config_model
+import metrics
 
 if getattr(sys, 'frozen', False):
     os.chdir(os.path.dirname(sys.executable))
@@ -17,30 +16,39 @@ else:
 
 CONFIG_FILE = "config.json"
 LOCK_FILE = "last_comdb_cleaned.log"
+LAST_RUN_FILE = "last_run.log"
+CONFIG_POLL_SECONDS = 60
 FAILED_DIR = "failed_logs"
-
-with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-    config = json.load(f)
-
-for dev in config.get("monitored_devices", []):
-    original = dev.get("vid_pid", "")
-    cleaned = re.sub(r"&MI_[0-9A-Fa-f]{2}", "", original)
-    if original != cleaned:
-        logging.debug(f"[AUTO] 清理 config VIDPID: {original} → {cleaned}")
-        dev["vid_pid"] = cleaned
-
-LOG_FILE = config.get("log_file", "enum_guardian_log.txt")
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s] %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-
-AUTO_THRESHOLD = config.get("threshold", 100)
+LOG_FORMAT = '[%(asctime)s] %(message)s'
+
+app_config = None
+config = {}
+AUTO_THRESHOLD = 100
+
+def load_config():
+    """讀取並驗證 config.json（檔案未變更時沿用已編譯的設定）；監控裝置索引延後到第一次使用時才建立"""
+    global app_config, config, AUTO_THRESHOLD
+    app_config = config_model.load_config(CONFIG_FILE)
+    config = app_config.data
+    AUTO_THRESHOLD = app_config.threshold
+    return config
+
+def setup_logging():
+    """啟動時只輸出到 stdout（排程器包裝批次檔會收集），確定要執行後再由 add_file_logging 開啟 log 檔"""
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT, handlers=[logging.StreamHandler(sys.stdout)])
+
+def add_file_logging():
+    """開啟 log 檔。預設改用 log_pipeline（呼叫端只入列，由寫入執行緒批次寫檔、輪替並彙總逐鍵紀錄）；
+    logging.queue 設為 false 時沿用同步 FileHandler"""
+    log_file = config.get("log_file", "enum_guardian_log.txt")
+    options = config.get("logging", {})
+    if not options.get("queue", True):
+        handler = logging.FileHandler(log_file, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logging.getLogger().addHandler(handler)
+        return
+    from log_pipeline import install_pipeline
+    install_pipeline(log_file, options)
 
 def should_clean_comdb_today():
     today = datetime.now().strftime("%Y-%m-%d")
@@ -55,112 +63,555 @@ def mark_comdb_cleaned():
     with open(LOCK_FILE, "w", encoding='utf-8') as f:
         f.write(today)
 
-def main():
-    logging.info("[AUTO] ====== EnumGuardian Auto Scan & Cleanup Started ======")
+def read_last_run():
+    """讀取上次完成執行的時間（供 min_interval_minutes 判斷），沒有紀錄時回傳 None"""
+    try:
+        with open(LAST_RUN_FILE, "r", encoding='utf-8') as f:
+            return datetime.fromisoformat(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+def mark_last_run(when: datetime) -> None:
+    with open(LAST_RUN_FILE, "w", encoding='utf-8') as f:
+        f.write(when.isoformat(timespec="seconds"))
+
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="EnumGuardian 自動掃描與清理")
+    parser.add_argument("--rollback", nargs="?", const="", metavar="JOURNAL",
+                        help="依清理 journal 從清理前快照還原上次清理的 VID/PID（預設使用 config 的 journal.file）")
+    parser.add_argument("--daemon", action="store_true", help="常駐模式：依排程睡到下次觸發時間再執行")
+    parser.add_argument("--plan", nargs="?", const="", metavar="PLAN_FILE",
+                        help="只掃描並寫出清理計畫檔與預估耗時，不修改註冊表（預設 cleanup_plan.json）")
+    parser.add_argument("--apply-plan", metavar="PLAN_FILE", help="執行先前產生並審閱過的計畫檔，不重新掃描")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """先以最少的匯入判斷排程，不在執行時間就直接結束；確定執行後才載入註冊表相關模組與 log 檔。
+    config 的 metrics.enabled 為 true 時，結束後輸出各階段耗時與計數"""
+    args = parse_args(argv)
+    load_config()
+    setup_logging()
+    if args.rollback is not None:
+        from cleanup_journal import rollback, JOURNAL_FILE
+        add_file_logging()
+        rollback(args.rollback or config.get("journal", {}).get("file", JOURNAL_FILE))
+        return
+    if args.plan is not None:
+        from planner import PLAN_FILE
+        make_plan(args.plan or PLAN_FILE)
+        return
+    if args.apply_plan:
+        add_file_logging()
+        if config.get("metrics", {}).get("enabled", False):
+            metrics.enable()
+        run_instrumented(task=lambda: run_plan(args.apply_plan))
+        return
+    if args.daemon:
+        add_file_logging()
+        try:
+            run_daemon()
+        except KeyboardInterrupt:
+            logging.info("[AUTO] 常駐模式已停止")
+        return
+
+    if config.get("metrics", {}).get("enabled", False):
+        metrics.enable()
 
-    scan_strategy = config.get("scan_strategy", {})
-    if not should_execute_now(scan_strategy):
+    with metrics.span("schedule_check"):
+        scheduled = should_execute_now(config.get("scan_strategy", {}), last_run=read_last_run())
+    if not scheduled:
         logging.info("[AUTO] 當前不在設定執行時間，已退出。")
+        metrics.disable()
         return
 
-    failed = []
-    locked_list = get_locked_list()
+    add_file_logging()
+    run_instrumented()
+    mark_last_run(datetime.now())
+
+def run_instrumented(warm: dict = None, task=None):
+    """執行一次 run_once（或指定的 task）；metrics 開啟時安裝計數用的註冊表後端，結束後輸出量測檔"""
+    if task is None:
+        task = lambda: run_once(warm)
+    if not metrics.is_enabled():
+        task()
+        return
 
+    from registry_backend import get_registry, set_registry
+    metrics_config = config.get("metrics", {})
+    log_counter = metrics.LogLineCounter()
+    logging.getLogger().addHandler(log_counter)
+    previous_registry = set_registry(metrics.CountingRegistry(get_registry()))
     try:
-        counts = scan_all_vidpid_counts(threshold=AUTO_THRESHOLD)
+        with metrics.span("total"):
+            task()
+    finally:
+        set_registry(previous_registry)
+        logging.getLogger().removeHandler(log_counter)
+        metrics.write_metrics(metrics_config.get("json_file", metrics.METRICS_JSON_FILE),
+                              metrics_config.get("prom_file", metrics.METRICS_PROM_FILE))
+        metrics.disable()
+
+def run_daemon(clock=datetime.now, sleep=time.sleep, max_runs: int = None) -> int:
+    """常駐模式：計算下次觸發時間後睡到該時間再執行，期間每 CONFIG_POLL_SECONDS 檢查 config.json 是否變更並重新載入。
+    掃描快取與 Lock List 留在記憶體中供下次執行使用；clock/sleep 可注入以便測試，回傳執行次數"""
+    warm = {}
+    schedule = compile_schedule(config.get("scan_strategy", {}))
+    last_run = read_last_run()
+    now = clock()
+    anchor = now - schedule.tolerance if schedule else now
+    if schedule and last_run and last_run + schedule.tolerance > anchor:
+        anchor = last_run + schedule.tolerance
+    runs = 0
+    logging.info("[AUTO] 常駐模式啟動")
+
+    while max_runs is None or runs < max_runs:
+        current = app_config
+        try:
+            load_config()
+        except Exception as e:
+            logging.error(f"[AUTO] 重新載入 config.json 失敗，沿用原設定：{e}")
+        # 執行中自己寫回的 config.json 會同步更新快取的 signature，只有外部修改才會換成新的 AppConfig
+        if app_config is not current:
+            schedule = compile_schedule(config.get("scan_strategy", {}))
+            logging.info("[AUTO] config.json 已變更，重新載入設定")
+
+        fire = schedule.next_fire(anchor) if schedule else None
+        now = clock()
+        if fire is None:
+            sleep(CONFIG_POLL_SECONDS)
+            continue
+        wait = (fire - now).total_seconds()
+        if wait > 0:
+            logging.debug(f"[AUTO] 下次執行時間 {fire:%Y-%m-%d %H:%M}（{wait:.0f} 秒後）")
+            sleep(min(wait, CONFIG_POLL_SECONDS))
+            continue
+
+        if last_run and schedule.min_interval and now - last_run < schedule.min_interval:
+            logging.info(f"[AUTO] 排程 {fire:%H:%M} 距上次執行未超過最短間隔，略過")
+        else:
+            logging.info(f"[AUTO] 排程 {fire:%Y-%m-%d %H:%M} 觸發")
+            if config.get("metrics", {}).get("enabled", False):
+                metrics.enable()
+            try:
+                run_instrumented(warm)
+            except Exception as e:
+                logging.error(f"[AUTO] 執行失敗：{e}")
+            last_run = clock()
+            mark_last_run(last_run)
+            runs += 1
+        anchor = max(fire, clock())
+    return runs
+
+def open_snapshot_writer():
+    """snapshot.enabled 時建立本次的清理前快照並先寫入 UsbFlags 與 ComDB；失敗時回傳 None（不中斷清理）"""
+    snapshot_config = config.get("snapshot", {})
+    if not snapshot_config.get("enabled", True):
+        return None
+    from snapshot import SnapshotWriter, snapshot_path, SNAPSHOT_DIR, USB_FLAGS_ROOT, COM_NAME_ARBITER_ROOT
+    snapshot_writer = None
+    try:
+        with metrics.span("snapshot"):
+            snapshot_writer = SnapshotWriter(snapshot_path(snapshot_config.get("dir", SNAPSHOT_DIR)))
+            snapshot_writer.write_group(USB_FLAGS_ROOT)
+            snapshot_writer.write_group(COM_NAME_ARBITER_ROOT)
+            snapshot_writer.sync()
     except Exception as e:
-        logging.error(f"[AUTO] 裝置掃描失敗：{e}")
+        logging.error(f"[AUTO] 建立清理前快照失敗：{e}")
+        if snapshot_writer is not None:
+            snapshot_writer.abort()
+        snapshot_writer = None
+    return snapshot_writer
+
+def close_snapshot_writer(snapshot_writer) -> None:
+    if snapshot_writer is None:
+        return
+    from snapshot import prune_snapshots, SNAPSHOT_DIR, SNAPSHOT_KEEP
+    snapshot_config = config.get("snapshot", {})
+    try:
+        snapshot_writer.close()
+        prune_snapshots(snapshot_config.get("dir", SNAPSHOT_DIR), snapshot_config.get("keep", SNAPSHOT_KEEP))
+    except Exception as e:
+        logging.error(f"[AUTO] 寫入清理前快照失敗：{e}")
+
+def save_failed(failed: list) -> None:
+    """清理失敗的項目寫入 failed_logs/failed_<日期>.json"""
+    if not failed:
         return
+    today_str = datetime.now().strftime("%Y-%m-%d")
+    os.makedirs(FAILED_DIR, exist_ok=True)
+    failed_filename = os.path.join(FAILED_DIR, f"failed_{today_str}.json")
 
-    logging.info(f"[AUTO] 本次掃描共偵測到 {len(counts)} 個裝置項目")
-    sorted_counts = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+    for item in failed:
+        item["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    monitored_dict = {
-        normalize_vidpid(d["vid_pid"]): d.get("notify_threshold", 50)
-        for d in config.get("monitored_devices", [])
+    try:
+        with metrics.span("failure_dump"), open(failed_filename, 'w', encoding='utf-8') as f:
+            json.dump(failed, f, indent=4, ensure_ascii=False)
+        logging.warning(f"[AUTO] 共 {len(failed)} 項清理失敗，已儲存至：{failed_filename}")
+    except Exception as e:
+        logging.error(f"[AUTO] 儲存失敗清單錯誤：{e}")
+
+def make_plan(plan_file: str) -> dict:
+    """--plan：掃描一次並寫出計畫檔（不寫入註冊表）。掃描時安裝計數後端量測開啟/列舉耗時，
+    刪除與寫值耗時取自上次執行的 metrics 檔，估計套用計畫所需時間"""
+    from utils import get_locked_list
+    from monitor import iter_scan, select_offenders
+    from enum_index import EnumIndex
+    from usb_flags_manager import list_all_ignore_keys
+    from registry_backend import get_registry, set_registry
+    from planner import build_plan, sample_keys_per_instance, estimate_plan, recorded_latencies
+    from planner import load_metrics_counters, write_plan, summarize_plan
+
+    metrics_config = config.get("metrics", {})
+    previous_counters = load_metrics_counters(metrics_config.get("json_file", metrics.METRICS_JSON_FILE))
+    metrics.enable()
+    previous_registry = set_registry(metrics.CountingRegistry(get_registry()))
+    try:
+        locked_list = get_locked_list()
+        index = EnumIndex.for_enumerators(config.get("scan_enumerators"))
+        offenders = select_offenders(iter_scan(AUTO_THRESHOLD, index=index, workers=config.get("scan_workers", 1),
+                                               locked_list=frozenset()))
+        comdb_due = should_clean_comdb_today()
+        comdb_preview = None
+        if comdb_due:
+            from cleaner import clean_comdb
+            comdb_preview = clean_comdb(config.get("comdb", {}).get("enumerators"), dry_run=True, index=index)
+        plan = build_plan(index, offenders, AUTO_THRESHOLD, locked_list, list(app_config.devices), list_all_ignore_keys(),
+                          remove_stale=config.get("usb_flags", {}).get("remove_stale", False),
+                          comdb_due=comdb_due, comdb_preview=comdb_preview,
+                          policies={record.vidpid: app_config.prune_policy(record.vidpid) for record in offenders})
+        keys_per_instance = sample_keys_per_instance(index, [entry["vid_pid"] for entry in plan["cleanup"]])
+        live_counters = metrics.snapshot()["counters"]
+    finally:
+        set_registry(previous_registry)
+        metrics.disable()
+
+    latencies, sources = recorded_latencies(("plan_scan", live_counters), ("last_run", previous_counters))
+    plan["estimate"] = {
+        "seconds": round(estimate_plan(plan, keys_per_instance, latencies), 2),
+        "keys_per_instance": round(keys_per_instance, 2),
+        "latencies": latencies,
+        "latency_sources": sources,
     }
+    write_plan(plan, plan_file)
+    logging.info(f"[Plan] 已寫入計畫 {plan_file}：{summarize_plan(plan)}")
+    return plan
+
+def run_plan(plan_file: str):
+    """--apply-plan：依審閱過的計畫執行，不重新掃描整個 Enum\\USB；計畫產生後已變動的項目會略過。
+    同樣會建立清理前快照與 journal（可用 --rollback 還原）"""
+    import platform
+    from utils import get_locked_list
+    from enum_index import EnumIndex
+    from cleaner import clean_comdb
+    from planner import load_plan, apply_plan, summarize_plan
+
+    plan = load_plan(plan_file)
+    if plan["host"] != platform.node():
+        logging.error(f"[Plan] 計畫檔由 {plan['host']} 產生，與本機 {platform.node()} 不同，拒絕執行")
+        return None
+    logging.info(f"[Plan] 套用計畫 {plan_file}（{plan['created']} 產生）：{summarize_plan(plan)}")
+
+    journal = None
+    journal_config = config.get("journal", {})
+    if journal_config.get("enabled", True):
+        from cleanup_journal import CleanupJournal, JOURNAL_FILE
+        journal = CleanupJournal(journal_config.get("file", JOURNAL_FILE))
+        if journal.recover() is not None:
+            logging.error("[Plan] 上次清理尚未完成，請先以一般模式接續或執行 --rollback，再套用計畫")
+            return None
+
+    index = EnumIndex.build(plan["enum_path"], only={entry["vid_pid"] for entry in plan["cleanup"]},
+                            enumerators=plan.get("enumerators"))
+    locked_list = get_locked_list()
+    for vidpid in plan.get("monitored_add", []):
+        if vidpid not in locked_list and app_config.add_device(vidpid):
+            logging.info(f"[Plan] {vidpid} 未在監控清單，將新增")
+    snapshot_writer = open_snapshot_writer()
+    if journal is not None:
+        journal.begin(snapshot_writer.snapshot_file if snapshot_writer is not None else None)
+    result = apply_plan(plan, index, locked_list, journal, snapshot_writer)
+    close_snapshot_writer(snapshot_writer)
 
-    cleaned_count = 0
-    skipped_count = 0
+    try:
+        app_config.save()
+    except Exception as e:
+        logging.error(f"[Plan] 寫回 config.json 失敗：{e}")
 
-    for idx, (vidpid_raw, count) in enumerate(sorted_counts, start=1):
-        vidpid = normalize_vidpid(vidpid_raw)
+    if plan["comdb"]["action"] != "skip":
+        if clean_comdb(config.get("comdb", {}).get("enumerators")) is not None:
+            mark_comdb_cleaned()
 
-        if vidpid in locked_list:
-            logging.info(f"[AUTO] [{idx}] {vidpid} 已存在於 Lock List，跳過")
-            skipped_count += 1
-            continue
+    save_failed(result["failed"])
+    if journal is not None:
+        journal.finish()
+    return result
+
+def record_growth(index, cleaned_before: dict, locked_list) -> list[tuple[str, int, float]]:
+    """把本次掃描到的實例數（已清理的裝置以清理前數量）寫入成長紀錄；history.predictive 開啟時
+    回傳目前未達 threshold、但推估在下次排程執行前會超過 threshold 的裝置（notify_threshold 只用於通知，不影響清理）"""
+    from growth_history import GrowthHistory, HISTORY_FILE, HISTORY_KEEP_DAYS, LOOKBACK_DAYS, MIN_SAMPLES, HORIZON_HOURS
+    from growth_history import predict_offenders
+
+    history_config = config.get("history", {})
+    counts = dict(index.iter_counts())
+    counts.update(cleaned_before)
+    now = datetime.now()
+    with metrics.span("history"), GrowthHistory(history_config.get("file", HISTORY_FILE)) as history:
+        history.record_run(counts, now.timestamp())
+        history.prune(history_config.get("keep_days", HISTORY_KEEP_DAYS))
+        if not history_config.get("predictive", False):
+            return []
+        rates = history.growth_rates(history_config.get("lookback_days", LOOKBACK_DAYS),
+                                     history_config.get("min_samples", MIN_SAMPLES))
+
+    schedule = compile_schedule(config.get("scan_strategy", {}))
+    next_fire = schedule.next_fire(now) if schedule else None
+    horizon = (next_fire - now).total_seconds() / 3600 if next_fire else history_config.get("horizon_hours", HORIZON_HOURS)
+    limits = {vidpid: AUTO_THRESHOLD for vidpid in counts if vidpid not in cleaned_before}
+    predicted = predict_offenders(counts, rates, limits, horizon, locked_list)
+    for vidpid, count, projected in predicted:
+        logging.info(f"[AUTO] {vidpid} 目前 {count} 個實例，成長率 {rates[vidpid]:.2f}/h，"
+                     f"預估 {horizon:.1f} 小時後（下次執行前）達 {projected}，提前清理")
+    return predicted
+
+def run_once(warm: dict = None):
+    """執行一次掃描與清理；warm 為常駐模式跨次保留的狀態（掃描快取）"""
+    from utils import normalize_vidpid, get_locked_list
+    from monitor import iter_scan, select_offenders
+    from enum_index import EnumIndex, ScanRecord, load_scan_cache, SCAN_CACHE_FILE, SCAN_CACHE_MAX_AGE_HOURS
+    from cleaner import clean_enum_for_vidpid, clean_comdb
+    from usb_flags_manager import add_ignore_key_to_registry, reconcile_ignore_keys, IGNORE_PREFIX
+    from verifier import find_new_offenders, verify_cleanup, save_verify_report, VERIFY_RETRIES, VERIFY_BACKOFF_SECONDS
 
-        try:
-            if vidpid not in monitored_dict:
-                logging.info(f"[AUTO] [{idx}] {vidpid} 未在監控清單，將新增")
-                config["monitored_devices"].append({"vid_pid": vidpid, "notify_threshold": 50})
-                monitored_dict[vidpid] = 50
-
-            add_ignore_key_to_registry(vidpid, auto=True)
-            clean_enum_for_vidpid(vidpid)
-            cleaned_count += 1
-        except Exception as e:
-            logging.error(f"[AUTO] [{idx}] 清理 {vidpid} 發生錯誤：{e}")
-            failed.append({"vid_pid": vidpid, "count": count, "error": str(e)})
+    logging.info("[AUTO] ====== EnumGuardian Auto Scan & Cleanup Started ======")
+
+    failed = []
+    locked_list = get_locked_list()
 
-    logging.info("[AUTO] 第二次掃描確認中...")
+    enumerators = config.get("scan_enumerators")
+    cache_config = config.get("scan_cache", {})
+    cache_file = cache_config.get("file", SCAN_CACHE_FILE)
+    scan_cache = None
+    if cache_config.get("enabled", False):
+        max_age_hours = cache_config.get("max_age_hours", SCAN_CACHE_MAX_AGE_HOURS)
+        scan_cache = (warm or {}).get("scan_cache")
+        if (scan_cache is None or time.time() - scan_cache["saved_at"] > max_age_hours * 3600
+                or scan_cache.get("enumerators") != (list(enumerators) if enumerators else None)):
+            scan_cache = load_scan_cache(cache_file, max_age_hours, EnumIndex.for_enumerators(enumerators).enum_path, enumerators)
+
+    journal_config = config.get("journal", {})
+    journal = None
+    resume = None
+    if journal_config.get("enabled", True):
+        from cleanup_journal import CleanupJournal, JOURNAL_FILE
+        journal = CleanupJournal(journal_config.get("file", JOURNAL_FILE))
+        resume = journal.recover()
+
+    pipeline_config = config.get("pipeline", {})
+    use_pipeline = pipeline_config.get("enabled", False) and resume is None
     try:
-        counts_2 = scan_all_vidpid_counts(threshold=AUTO_THRESHOLD)
+        if resume is not None:
+            # 接續上次中斷的清理：只重新索引未完成的 VID/PID，不重新掃描整個 Enum\USB
+            pending = resume.pending_offenders()
+            index = EnumIndex.build(only={vidpid for vidpid, _ in pending}, enumerators=enumerators)
+            offenders = [ScanRecord(vidpid, count, 0) for vidpid, count in pending]
+            logging.info(f"[AUTO] 接續上次中斷的清理，尚有 {len(offenders)} 個裝置項目")
+        else:
+            index = EnumIndex.for_enumerators(enumerators)
+            records = iter_scan(AUTO_THRESHOLD, index=index, workers=config.get("scan_workers", 1), cache=scan_cache)
+        if resume is None and not use_pipeline:
+            with metrics.span("scan_1"):
+                offenders = select_offenders(records)
+            logging.info(f"[AUTO] 本次掃描共偵測到 {len(offenders)} 個裝置項目")
     except Exception as e:
-        logging.error(f"[AUTO] 第二次掃描失敗：{e}")
+        logging.error(f"[AUTO] 裝置掃描失敗：{e}")
         return
 
-    sorted_counts_2 = sorted(counts_2.items(), key=lambda x: x[1], reverse=True)
-    has_second_clean = False
-
-    for idx, (vidpid_raw, count) in enumerate(sorted_counts_2, start=1):
-        vidpid = normalize_vidpid(vidpid_raw)
+    monitored = app_config.devices
 
+    cleaned_count = 0
+    skipped_count = 0
+    cleaned_before = {}
+    kept = {}
+    policies = {}
+    state_lock = threading.Lock()
+
+    snapshot_writer = open_snapshot_writer()
+    if journal is not None:
+        journal.begin(snapshot_writer.snapshot_file if snapshot_writer is not None else None, resume=resume is not None)
+
+    remove_stale = config.get("usb_flags", {}).get("remove_stale", False)
+
+    def reconcile_flags(vidpids, remove_stale=remove_stale):
+        with metrics.span("usb_flags"):
+            summary = reconcile_ignore_keys(list(vidpids) + list(monitored), remove_stale=remove_stale)
+        for item in summary["failed"]:
+            logging.warning(f"[AUTO] {item['key'][len(IGNORE_PREFIX):]} UsbFlags 寫入失敗：{item['error']}")
+
+    def admit(idx, vidpid):
+        """鎖定檢查與監控清單更新（只在呼叫端執行緒執行）"""
+        nonlocal skipped_count
         if vidpid in locked_list:
-            continue
+            logging.info(f"[AUTO] [{idx}] {vidpid} 已存在於 Lock List，跳過")
+            skipped_count += 1
+            return False
+        if app_config.add_device(vidpid):
+            logging.info(f"[AUTO] [{idx}] {vidpid} 未在監控清單，將新增")
+        return True
 
+    def clean(idx, vidpid, count):
+        nonlocal cleaned_count
         try:
-            if vidpid not in monitored_dict:
-                config["monitored_devices"].append({"vid_pid": vidpid, "notify_threshold": 50})
-                monitored_dict[vidpid] = 50
-
-            add_ignore_key_to_registry(vidpid, auto=True)
-            clean_enum_for_vidpid(vidpid)
-            has_second_clean = True
-            cleaned_count += 1
+            policy = app_config.prune_policy(vidpid)
+            if snapshot_writer is not None:
+                snapshot_writer.write_vidpid(index, vidpid)
+            with metrics.span("cleanup", vidpid=vidpid):
+                keep = clean_enum_for_vidpid(vidpid, index=index, journal=journal, policy=policy)
+            with state_lock:
+                cleaned_before[vidpid] = count
+                cleaned_count += 1
+                if policy is not None:
+                    policies[vidpid] = policy
+                    kept[vidpid] = keep
         except Exception as e:
+            logging.error(f"[AUTO] [{idx}] 清理 {vidpid} 發生錯誤：{e}")
             failed.append({"vid_pid": vidpid, "count": count, "error": str(e)})
 
-    if has_second_clean:
-        logging.info("[AUTO] 第二次補清完成。")
-    elif sorted_counts_2:
-        logging.warning("[AUTO] 第二次掃描仍有未清除裝置，建議人工確認")
-
-    if should_clean_comdb_today():
+    if use_pipeline:
+        from pipeline import run_pipeline, coalesce_records, DeleteRateLimiter, ThrottledRegistry
+        from pipeline import PIPELINE_WORKERS, PIPELINE_QUEUE_SIZE, MAX_CONCURRENT_DELETES
+        from registry_backend import get_registry, set_registry
+
+        def admitted():
+            for idx, record in enumerate(coalesce_records(records), start=1):
+                vidpid = normalize_vidpid(record.vidpid)
+                if admit(idx, vidpid):
+                    if journal is not None:
+                        journal.add_offenders([(vidpid, record.instance_count)])
+                    # 交給刪除執行緒前先寫入 UsbFlags，清理期間重新接上的裝置不會再以序號建立新實例
+                    with metrics.span("usb_flags"):
+                        add_ignore_key_to_registry(vidpid, auto=True)
+                    yield idx, vidpid, record.instance_count
+
+        # 監控清單的 UsbFlags 在管線開始前一次補齊；remove_stale 要等所有違規裝置都確定後才執行
+        reconcile_flags([], remove_stale=False)
+
+        limiter = DeleteRateLimiter(pipeline_config.get("max_concurrent_deletes", MAX_CONCURRENT_DELETES),
+                                    pipeline_config.get("deletes_per_second", 0))
+        previous_registry = set_registry(ThrottledRegistry(get_registry(), limiter))
         try:
-            clean_comdb()
-            mark_comdb_cleaned()
-            logging.info("[AUTO] 今日COMDB清理完成")
+            with metrics.span("scan_cleanup_pipeline"):
+                stats = run_pipeline(admitted(), lambda item: clean(*item),
+                                     workers=pipeline_config.get("workers", PIPELINE_WORKERS),
+                                     queue_size=pipeline_config.get("queue_size", PIPELINE_QUEUE_SIZE))
+        finally:
+            set_registry(previous_registry)
+        if remove_stale:
+            reconcile_flags(cleaned_before)
+        summary = stats.as_dict()
+        summary["delete_wait_seconds"] = round(limiter.waited_seconds, 4)
+        logging.info(f"[AUTO] 管線統計：{json.dumps(summary, ensure_ascii=False)}")
+        for name in ("produced", "max_queue_depth"):
+            metrics.inc(f"pipeline_{name}", summary[name])
+    else:
+        pending = [(normalize_vidpid(record.vidpid), record.instance_count) for record in offenders]
+        pending = [(vidpid, count) for vidpid, count in pending if vidpid not in locked_list]
+        if journal is not None and resume is None:
+            journal.add_offenders(pending)
+        reconcile_flags(vidpid for vidpid, _ in pending)
+        for idx, (vidpid_raw, count, _) in enumerate(offenders, start=1):
+            vidpid = normalize_vidpid(vidpid_raw)
+            if admit(idx, vidpid):
+                clean(idx, vidpid, count)
+
+    if resume is None and config.get("history", {}).get("enabled", False):
+        try:
+            predicted = record_growth(index, cleaned_before, get_locked_list())
         except Exception as e:
-            logging.error(f"[AUTO] COMDB清理失敗：{e}")
+            logging.error(f"[AUTO] 寫入成長紀錄失敗：{e}")
+            predicted = []
+        if predicted:
+            if journal is not None:
+                journal.add_offenders([(vidpid, count) for vidpid, count, _ in predicted])
+            reconcile_flags(vidpid for vidpid, _, _ in predicted)
+            for idx, (vidpid, count, _) in enumerate(predicted, start=1):
+                if admit(idx, vidpid):
+                    clean(idx, vidpid, count)
+            metrics.inc("predicted_cleanups", len(predicted))
+
+    logging.info("[AUTO] 確認清理結果中（只重新查詢本次清理的 VID/PID 與執行期間變動的裝置鍵）...")
+    verify_config = config.get("verify", {})
+    report = []
+    try:
+        with metrics.span("verify"):
+            new_offenders = find_new_offenders(index, AUTO_THRESHOLD, get_locked_list(), skip=cleaned_before)
+            for idx, (vidpid, count) in enumerate(new_offenders.items(), start=1):
+                try:
+                    app_config.add_device(vidpid)
+                    policy = app_config.prune_policy(vidpid)
+                    if snapshot_writer is not None:
+                        snapshot_writer.write_vidpid(index, vidpid)
+                    with metrics.span("cleanup", vidpid=vidpid):
+                        add_ignore_key_to_registry(vidpid, auto=True)
+                        keep = clean_enum_for_vidpid(vidpid, index=index, journal=journal, policy=policy)
+                    cleaned_before[vidpid] = count
+                    cleaned_count += 1
+                    if policy is not None:
+                        policies[vidpid] = policy
+                        kept[vidpid] = keep
+                except Exception as e:
+                    failed.append({"vid_pid": vidpid, "count": count, "error": str(e)})
+
+            report = verify_cleanup(index, cleaned_before,
+                                    retries=verify_config.get("retries", VERIFY_RETRIES),
+                                    backoff=verify_config.get("backoff_seconds", VERIFY_BACKOFF_SECONDS),
+                                    kept=kept, policies=policies)
+    except Exception as e:
+        logging.error(f"[AUTO] 清理結果確認失敗：{e}")
+
+    save_verify_report(report)
+    close_snapshot_writer(snapshot_writer)
+    residual = [item for item in report if item["residual"]]
+    for item in residual:
+        failed.append({"vid_pid": item["vid_pid"], "count": item["before"], "error": f"重試後仍殘留 {item['residual']} 個實例"})
+    if residual:
+        logging.warning("[AUTO] 確認後仍有未清除裝置，建議人工確認")
+    elif report:
+        logging.info("[AUTO] 清理結果確認完成，無殘留實例。")
+
+    if cache_config.get("enabled", False) and resume is None:
+        saved_cache = index.save_cache(cache_file, previous=scan_cache)
+        if warm is not None:
+            warm["scan_cache"] = saved_cache
 
-    if failed:
-        today_str = datetime.now().strftime("%Y-%m-%d")
-        os.makedirs(FAILED_DIR, exist_ok=True)
-        failed_filename = os.path.join(FAILED_DIR, f"failed_{today_str}.json")
+    try:
+        app_config.save()
+    except Exception as e:
+        logging.error(f"[AUTO] 寫回 config.json 失敗：{e}")
 
-        for item in failed:
-            item["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if should_clean_comdb_today():
+        with metrics.span("comdb"):
+            summary = clean_comdb(config.get("comdb", {}).get("enumerators"), index=index)
+        if summary is not None:
+            mark_comdb_cleaned()
+            metrics.inc("comdb_ports_freed", len(summary["freed"]))
+            logging.info("[AUTO] 今日COMDB清理完成")
 
+    save_failed(failed)
+    if journal is not None:
         try:
-            with open(failed_filename, 'w', encoding='utf-8') as f:
-                json.dump(failed, f, indent=4, ensure_ascii=False)
-            logging.warning(f"[AUTO] 共 {len(failed)} 項清理失敗，已儲存至：{failed_filename}")
+            journal.finish()
         except Exception as e:
-            logging.error(f"[AUTO] 儲存失敗清單錯誤：{e}")
+            logging.error(f"[AUTO] 結束清理 journal 失敗：{e}")
 
+    metrics.inc("vidpids_cleaned", cleaned_count)
+    metrics.inc("vidpids_skipped", skipped_count)
+    metrics.inc("vidpids_failed", len(failed))
+    metrics.inc("instances_kept", sum(kept.values()))
     logging.info(f"[AUTO] 本次清理完成，共處理 {cleaned_count} 項，跳過 {skipped_count} 項")
+    logging.info(f"[AUTO] 清理後 ENUM 共 {len(index)} 個 VID/PID，剩餘 {index.total_instances()} 個實例")
     logging.info("[AUTO] ====== 全部流程執行完畢 ======")
 
 if __name__ == "__main__":
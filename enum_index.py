@@ -0,0 +1,478 @@
+import re
+import json
+import os
+import time
+import logging
+import contextlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from utils import normalize_vidpid
+from registry_backend import get_registry
+
+ENUM_USB_PATH = r"SYSTEM\\CurrentControlSet\\Enum\\USB"
+ENUM_ROOT_PATH = r"SYSTEM\\CurrentControlSet\\Enum"
+# 多列舉器模式可走訪的 Enum 底下根鍵（config.json 的 scan_enumerators）
+ENUMERATORS = ("USB", "USBSTOR", "HID", "FTDIBUS", "USBPRINT")
+# 裝置鍵名稱本身含序號的列舉器（FTDIBUS\VID_0403+PID_6001+序號\0000）：每個序號一個裝置鍵，清理時整個裝置鍵刪除
+SERIAL_KEYED_ENUMERATORS = ("FTDIBUS",)
+SCAN_CACHE_FILE = "scan_cache.json"
+SCAN_CACHE_VERSION = 3
+SCAN_CACHE_MAX_AGE_HOURS = 168
+
+# VID_xxxx&PID_xxxx（USB/HID）、VID_xxxx+PID_xxxx（FTDIBUS）、VID&0002xxxx_PID&xxxx（藍牙 HID）
+_VID_PID_PATTERN = re.compile(r"VID[_&](?:[0-9A-F]{4})?([0-9A-F]{4})[&_+]PID[_&](?:[0-9A-F]{4})?([0-9A-F]{4})", re.IGNORECASE)
+_REVISION_PATTERN = re.compile(r"&REV_[^&]*$")
+
+def device_key(enumerator: str, name: str) -> str:
+    """多列舉器模式下裝置鍵名稱對應的合併鍵：名稱含 VID/PID 時為 8 碼 VID/PID（去掉 &MI_xx、&Col 與序號），
+    沒有 VID/PID 的列舉器（USBSTOR 的 Disk&Ven_&Prod_&Rev_、USBPRINT 的型號）為「列舉器\\型號」（去掉 &Rev_ 版本）"""
+    match = _VID_PID_PATTERN.search(name)
+    if match:
+        return (match.group(1) + match.group(2)).upper()
+    return f"{enumerator.upper()}\\{_REVISION_PATTERN.sub('', name.upper())}"
+
+def _split_subkey(subkey: str) -> tuple[str, str]:
+    """索引中的子鍵拆成 (列舉器根鍵, 裝置鍵名稱)；單一 Enum\\USB 模式的子鍵沒有根鍵部分"""
+    root, _, name = subkey.rpartition("\\")
+    return root, name
+
+def load_scan_cache(cache_file: str = SCAN_CACHE_FILE, max_age_hours: float = SCAN_CACHE_MAX_AGE_HOURS,
+                    enum_path: str = ENUM_USB_PATH, enumerators=None):
+    """讀取上次掃描快取；檔案不存在、損毀、版本不符、列舉器不同或過期時回傳 None（改為完整掃描）"""
+    if not os.path.exists(cache_file):
+        logging.info("[Index] 沒有掃描快取，執行完整掃描")
+        return None
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if (cache.get("version") != SCAN_CACHE_VERSION or cache.get("enum_path") != enum_path
+                or cache.get("enumerators") != (list(enumerators) if enumerators else None)):
+            logging.info("[Index] 掃描快取版本或路徑不符，執行完整掃描")
+            return None
+        age = time.time() - cache["saved_at"]
+        if age < 0 or age > max_age_hours * 3600:
+            logging.info(f"[Index] 掃描快取已過期（{age / 3600:.1f} 小時），執行完整掃描")
+            return None
+        if not isinstance(cache["devices"], dict) or not isinstance(cache["roots"], dict):
+            raise ValueError("devices/roots 格式錯誤")
+        return cache
+    except Exception as e:
+        logging.warning(f"[Index] 掃描快取損毀，執行完整掃描：{e}")
+        return None
+
+ScanRecord = namedtuple("ScanRecord", ["vidpid", "instance_count", "last_write"])
+InstanceInfo = namedtuple("InstanceInfo", ["path", "last_write", "present"])
+
+def _query_device(registry, usb_root, subkey: str):
+    """開啟單一裝置鍵取得 (子鍵, 實例數, LastWriteTime)，失敗時記錄並回傳 None"""
+    try:
+        with registry.OpenKey(usb_root, subkey) as device_key:
+            instance_count, _, last_write = registry.QueryInfoKey(device_key)
+        return subkey, instance_count, last_write
+    except PermissionError:
+        logging.warning(f"[Index] 權限不足，無法開啟裝置鍵: {subkey}")
+    except OSError as e:
+        logging.warning(f"[Index] 開啟子鍵失敗: {subkey} - {e}")
+    return None
+
+class DeviceEntry:
+    """單一裝置鍵（相對 enum_path 的原始子鍵名稱）的統計資料；ports 為已讀取的 {實例名稱: COM 編號}（None 表示尚未讀取）"""
+    __slots__ = ("subkey", "instance_count", "last_write", "instances", "ports")
+
+    def __init__(self, subkey: str, instance_count: int, last_write: int):
+        self.subkey = subkey
+        self.instance_count = instance_count
+        self.last_write = last_write
+        self.instances = None
+        self.ports = None
+
+    @property
+    def enumerator(self) -> str:
+        return _split_subkey(self.subkey)[0].upper() or "USB"
+
+class EnumIndex:
+    """單次走訪 Enum\\USB 建立的索引：正規化 VID/PID → 原始子鍵 → 實例，供掃描、清理與報表共用。
+
+    實例名稱只在需要刪除時才載入（每個裝置鍵至多一次），刪除後直接就地更新，不重新掃描。
+
+    指定 enumerators 時為多列舉器模式：enum_path 為 Enum 根鍵，每個列舉器根鍵各走訪一次，
+    子鍵為「列舉器\\裝置鍵」，各列舉器的裝置鍵依 device_key() 合併到同一個 VID/PID。
+    """
+
+    def __init__(self, enum_path: str = ENUM_USB_PATH, enumerators=None):
+        self.enum_path = enum_path
+        self.enumerators = tuple(enumerators) if enumerators else None
+        self.devices = {}
+        self.root_last_writes = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.scan_seconds = 0.0
+        self.scanned = False
+        self.complete = False
+
+    @classmethod
+    def for_enumerators(cls, enumerators=None):
+        """依設定建立空索引：未指定列舉器時只走訪 Enum\\USB，否則以 Enum 根鍵走訪各列舉器"""
+        return cls(ENUM_ROOT_PATH, enumerators) if enumerators else cls()
+
+    @classmethod
+    def build(cls, enum_path: str = None, only=None, cache: dict = None, workers: int = 1, enumerators=None):
+        """走訪 enum_path 一次建立索引（scan() 全部走完）；未指定 enum_path 時依 enumerators 決定"""
+        index = cls(enum_path, enumerators) if enum_path else cls.for_enumerators(enumerators)
+        for _ in index.scan(only=only, cache=cache, workers=workers):
+            pass
+        return index
+
+    @property
+    def root_last_write(self) -> int:
+        return max(self.root_last_writes.values(), default=0)
+
+    def key_for(self, subkey: str) -> str:
+        """子鍵對應的合併鍵（單一 Enum\\USB 模式沿用 normalize_vidpid）"""
+        if self.enumerators is None:
+            return normalize_vidpid(subkey)
+        return device_key(*_split_subkey(subkey))
+
+    def _roots(self):
+        return self.enumerators or ("",)
+
+    def _open_root(self, registry, base, name: str):
+        """開啟列舉器根鍵（name 為空時即 base 本身）；不存在時回傳 None"""
+        if not name:
+            return contextlib.nullcontext(base)
+        try:
+            return registry.OpenKey(base, name)
+        except FileNotFoundError:
+            logging.debug(f"[Index] 沒有 {name} 列舉器，略過")
+            return None
+
+    def _root_subkeys(self, registry, base, name: str, cached) -> list[str]:
+        """列舉一個列舉器根鍵底下的裝置鍵（回傳相對 enum_path 的子鍵）；
+        根鍵 LastWriteTime 與快取相同時沿用快取的清單，根鍵不存在時回傳空清單"""
+        handle = self._open_root(registry, base, name)
+        if handle is None:
+            return []
+        prefix = f"{name}\\" if name else ""
+        with handle as root:
+            device_count, _, last_write = registry.QueryInfoKey(root)
+            self.root_last_writes[name] = last_write
+            if cached and cached[0] == last_write and len(cached[1]) == device_count:
+                return [prefix + subkey for subkey in cached[1]]
+            subkeys = []
+            for i in range(device_count):
+                try:
+                    subkeys.append(prefix + registry.EnumKey(root, i))
+                except OSError:
+                    continue
+            return subkeys
+
+    def scan(self, only=None, cache: dict = None, workers: int = 1):
+        """邊走訪邊建立索引，每加入一個裝置鍵就產生一筆 ScanRecord；only 為正規化 VID/PID 集合時只開啟符合的裝置鍵。
+
+        workers > 1 時以執行緒池平行開啟/查詢裝置鍵（註冊表呼叫會釋放 GIL），結果仍依列舉順序產生。
+
+        傳入 cache（load_scan_cache 的結果）時：根鍵 LastWriteTime 未變就沿用快取的子鍵清單（不逐一 EnumKey），
+        裝置鍵 LastWriteTime 與實例數都未變時沿用快取的實例名稱與 COM 埠，之後不必再列舉實例。
+        每個裝置鍵仍會開啟並查詢一次：新增/刪除實例只會更新裝置鍵本身的 LastWriteTime，根鍵不變，無法據此略過裝置鍵。
+
+        未指定 only 且走訪完所有根鍵時 complete 為 True（索引涵蓋整個列舉器，可取代重新走訪，例如 ComDB 使用中的埠）。
+
+        多列舉器模式依序走訪各列舉器根鍵（每個根鍵只列舉一次），同一 VID/PID 會在不同根鍵各產生一筆 ScanRecord。
+        """
+        registry = get_registry()
+        start = time.perf_counter()
+        cached_roots = cache["roots"] if cache else {}
+        cached_devices = cache["devices"] if cache else None
+        pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+        # 走訪時自行累計：管線模式下最後一筆產生後清理執行緒已在修改索引，此時不可再走訪 self.devices
+        devices = instances = 0
+        try:
+            with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, self.enum_path) as base:
+                for name in self._roots():
+                    subkeys = self._root_subkeys(registry, base, name, cached_roots.get(name))
+                    if only is not None:
+                        subkeys = [subkey for subkey in subkeys if self.key_for(subkey) in only]
+                    if pool is not None and len(subkeys) > 1:
+                        results = pool.map(lambda subkey: _query_device(registry, base, subkey), subkeys)
+                    else:
+                        results = (_query_device(registry, base, subkey) for subkey in subkeys)
+                    for result in results:
+                        if result is not None:
+                            devices += 1
+                            instances += result[1]
+                            yield self._add_result(result, cached_devices)
+            self.complete = only is None
+        except FileNotFoundError:
+            logging.warning("[Index] 找不到 ENUM 註冊表路徑")
+        except Exception as e:
+            logging.error(f"[Index] 建立 ENUM 索引失敗: {e}")
+        finally:
+            if pool is not None:
+                # 呼叫端提前關閉產生器（例如設定工具取消掃描）時，尚未開始的裝置鍵查詢直接取消，不等整個根鍵走完
+                pool.shutdown(cancel_futures=True)
+
+        self.scan_seconds = time.perf_counter() - start
+        self.scanned = True
+        logging.debug(f"[Index] 索引完成：{devices} 個裝置鍵，共 {instances} 個實例")
+        if cache:
+            checked = self.cache_hits + self.cache_misses
+            ratio = self.cache_hits / checked * 100 if checked else 0.0
+            logging.info(f"[Index] 掃描快取：沿用 {self.cache_hits}/{checked} 個裝置鍵的實例清單（{ratio:.1f}%），"
+                         f"掃描耗時 {self.scan_seconds:.2f}s（未使用快取時 {cache.get('full_scan_seconds', 0.0):.2f}s）")
+
+    def save_cache(self, cache_file: str = SCAN_CACHE_FILE, previous: dict = None) -> dict:
+        """保存本次各裝置鍵的實例數、LastWriteTime 與已載入的實例名稱，供下次掃描沿用；回傳寫入的快取內容"""
+        full_scan_seconds = self.scan_seconds
+        if previous and self.cache_hits:
+            full_scan_seconds = previous.get("full_scan_seconds", self.scan_seconds)
+        roots = {name: [last_write, []] for name, last_write in self.root_last_writes.items()}
+        for entries in self.devices.values():
+            for subkey in entries:
+                root, name = _split_subkey(subkey)
+                if root in roots:
+                    roots[root][1].append(name)
+        cache = {
+            "version": SCAN_CACHE_VERSION,
+            "saved_at": time.time(),
+            "enum_path": self.enum_path,
+            "enumerators": list(self.enumerators) if self.enumerators else None,
+            "full_scan_seconds": full_scan_seconds,
+            "roots": roots,
+            "devices": {
+                entry.subkey: [entry.instance_count, entry.last_write, entry.instances, entry.ports]
+                for entries in self.devices.values() for entry in entries.values()
+            },
+        }
+        tmp_file = f"{cache_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+            os.replace(tmp_file, cache_file)
+            logging.debug(f"[Index] 掃描快取已寫入：{cache_file}")
+        except Exception as e:
+            logging.error(f"[Index] 寫入掃描快取失敗：{e}")
+        return cache
+
+    def _add_result(self, result, cached_devices) -> "ScanRecord":
+        subkey, instance_count, last_write = result
+        norm_key = self.key_for(subkey)
+        self.add(norm_key, subkey, instance_count, last_write)
+        if cached_devices is not None:
+            cached = cached_devices.get(subkey)
+            if cached and cached[0] == instance_count and cached[1] == last_write:
+                entry = self.devices[norm_key][subkey]
+                entry.instances, entry.ports = cached[2], cached[3]
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+        return ScanRecord(norm_key, instance_count, last_write)
+
+    def add(self, vidpid: str, subkey: str, instance_count: int, last_write: int) -> None:
+        self.devices.setdefault(vidpid, {})[subkey] = DeviceEntry(subkey, instance_count, last_write)
+
+    def __contains__(self, vidpid: str) -> bool:
+        return vidpid in self.devices
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def subkeys(self, vidpid: str) -> list[str]:
+        return list(self.devices.get(vidpid, {}))
+
+    def instance_count(self, vidpid: str) -> int:
+        return sum(entry.instance_count for entry in self.devices.get(vidpid, {}).values())
+
+    def breakdown(self, vidpid: str) -> dict:
+        """vidpid 在各列舉器的實例數"""
+        counts = {}
+        for entry in self.devices.get(vidpid, {}).values():
+            counts[entry.enumerator] = counts.get(entry.enumerator, 0) + entry.instance_count
+        return counts
+
+    def last_write(self, vidpid: str) -> int:
+        return max((entry.last_write for entry in self.devices.get(vidpid, {}).values()), default=0)
+
+    def total_instances(self) -> int:
+        return sum(entry.instance_count for entries in self.devices.values() for entry in entries.values())
+
+    def iter_records(self):
+        """依走訪順序產生每個 VID/PID 彙總後的 ScanRecord"""
+        for vidpid, entries in self.devices.items():
+            yield ScanRecord(vidpid,
+                             sum(entry.instance_count for entry in entries.values()),
+                             max((entry.last_write for entry in entries.values()), default=0))
+
+    def iter_counts(self):
+        """依走訪順序產生 (vidpid, 實例數)"""
+        for vidpid, entries in self.devices.items():
+            yield vidpid, sum(entry.instance_count for entry in entries.values())
+
+    def _instances(self, registry, root, entry: DeviceEntry) -> list[str]:
+        """裝置鍵底下的實例名稱，每個裝置鍵至多列舉一次"""
+        if entry.instances is None:
+            entry.instances = []
+            try:
+                with registry.OpenKey(root, entry.subkey) as dev_key:
+                    for j in range(registry.QueryInfoKey(dev_key)[0]):
+                        try:
+                            entry.instances.append(registry.EnumKey(dev_key, j))
+                        except OSError:
+                            continue
+            except OSError as e:
+                logging.warning(f"[Index] 列舉實例失敗: {entry.subkey} - {e}")
+            entry.instance_count = len(entry.instances)
+        return entry.instances
+
+    def instance_paths(self, root, vidpid: str) -> list[str]:
+        """回傳 vidpid 所有實例相對於 root 的路徑（子鍵\\實例），首次呼叫時才列舉實例名稱；
+        SERIAL_KEYED_ENUMERATORS 的裝置鍵本身即代表一個裝置，回傳裝置鍵路徑（整個刪除）"""
+        registry = get_registry()
+        paths = []
+        for entry in self.devices.get(vidpid, {}).values():
+            if self.enumerators is not None and entry.enumerator in SERIAL_KEYED_ENUMERATORS:
+                paths.append(entry.subkey)
+                continue
+            paths.extend(f"{entry.subkey}\\{name}" for name in self._instances(registry, root, entry))
+        return paths
+
+    def com_ports(self, root, enumerators) -> set[int]:
+        """索引中屬於 enumerators 的實例目前佔用的 COM 編號（Device Parameters\\PortName）。
+        每個裝置鍵只讀取一次並隨掃描快取保存，裝置鍵未變動的下次執行不再開啟；已刪除的實例由 discard_instances 移除"""
+        from comdb import parse_port
+
+        registry = get_registry()
+        enumerators = {name.upper() for name in enumerators}
+        ports = set()
+        for entries in self.devices.values():
+            for entry in entries.values():
+                if entry.enumerator not in enumerators:
+                    continue
+                if entry.ports is None:
+                    entry.ports = {}
+                    for name in self._instances(registry, root, entry):
+                        try:
+                            with registry.OpenKey(root, f"{entry.subkey}\\{name}\\Device Parameters") as params:
+                                port = parse_port(registry.QueryValueEx(params, "PortName")[0])
+                        except OSError:
+                            continue
+                        if port is not None:
+                            entry.ports[name] = port
+                ports.update(entry.ports.values())
+        return ports
+
+    def instance_details(self, root, vidpid: str) -> list[InstanceInfo]:
+        """vidpid 各實例的 LastWriteTime 與是否目前接上（實例底下有揮發性的 Control 子鍵）；無法開啟的實例略過"""
+        registry = get_registry()
+        entries = self.devices.get(vidpid, {})
+        details = []
+        for path in self.instance_paths(root, vidpid):
+            try:
+                with registry.OpenKey(root, path) as key:
+                    instance_count, _, last_write = registry.QueryInfoKey(key)
+                    # 整個裝置鍵（SERIAL_KEYED_ENUMERATORS）時檢查底下任一實例
+                    controls = ([f"{registry.EnumKey(key, i)}\\Control" for i in range(instance_count)]
+                                if path in entries else ["Control"])
+                    present = False
+                    for control in controls:
+                        try:
+                            with registry.OpenKey(key, control):
+                                present = True
+                                break
+                        except FileNotFoundError:
+                            continue
+            except OSError as e:
+                logging.warning(f"[Index] 查詢實例失敗: {path} - {e}")
+                continue
+            details.append(InstanceInfo(path, last_write, present))
+        return details
+
+    def refresh_device(self, root, vidpid: str) -> int:
+        """重新查詢 vidpid 各裝置鍵的實例數與 LastWriteTime（不重掃根鍵），時間戳變動時清除已載入的實例名稱"""
+        registry = get_registry()
+        entries = self.devices.get(vidpid, {})
+        for subkey in list(entries):
+            result = _query_device(registry, root, subkey)
+            if result is None:
+                del entries[subkey]
+                continue
+            entry = entries[subkey]
+            _, instance_count, last_write = result
+            if last_write != entry.last_write or instance_count != entry.instance_count:
+                entry.instances = None
+                entry.ports = None
+            entry.instance_count = instance_count
+            entry.last_write = last_write
+        return self.instance_count(vidpid)
+
+    def refresh_changed(self, root, skip=()) -> list[str]:
+        """重新查詢索引中各裝置鍵（略過 skip 的 VID/PID），實例數或 LastWriteTime 與索引不同時以 refresh_device 更新，
+        回傳有變動的 VID/PID。既有裝置鍵底下新增實例不會改變根鍵的 LastWriteTime，refresh_root 看不到這類變動"""
+        registry = get_registry()
+        changed = []
+        for vidpid, entries in list(self.devices.items()):
+            if vidpid in skip:
+                continue
+            for subkey, entry in list(entries.items()):
+                result = _query_device(registry, root, subkey)
+                if result is None or (result[1], result[2]) != (entry.instance_count, entry.last_write):
+                    changed.append(vidpid)
+                    break
+        for vidpid in changed:
+            self.refresh_device(root, vidpid)
+        return changed
+
+    def refresh_root(self, root) -> list[str]:
+        """列舉器根鍵 LastWriteTime 變動時（有裝置鍵新增/刪除）只列舉該根鍵一次，把新出現的裝置鍵加入索引並回傳其 VID/PID"""
+        registry = get_registry()
+        known = None
+        changed = []
+        for name in self._roots():
+            handle = self._open_root(registry, root, name)
+            if handle is None:
+                continue
+            with handle as enum_root:
+                root_last_write = registry.QueryInfoKey(enum_root)[2]
+                if root_last_write == self.root_last_writes.get(name):
+                    continue
+                self.root_last_writes[name] = root_last_write
+                if known is None:
+                    known = {subkey for entries in self.devices.values() for subkey in entries}
+                prefix = f"{name}\\" if name else ""
+                i = 0
+                while True:
+                    try:
+                        subkey = prefix + registry.EnumKey(enum_root, i)
+                    except OSError:
+                        break
+                    i += 1
+                    if subkey in known:
+                        continue
+                    result = _query_device(registry, root, subkey)
+                    if result is not None:
+                        record = self._add_result(result, None)
+                        if record.vidpid not in changed:
+                            changed.append(record.vidpid)
+        return changed
+
+    def discard_instances(self, vidpid: str, paths) -> None:
+        """刪除成功後就地移除實例（paths 為 instance_paths 回傳的相對路徑；整個裝置鍵時移除該裝置鍵）"""
+        entries = self.devices.get(vidpid, {})
+        removed = {}
+        for path in paths:
+            if path in entries:
+                del entries[path]
+                continue
+            subkey, _, name = path.rpartition("\\")
+            removed.setdefault(subkey, set()).add(name)
+        for subkey, names in removed.items():
+            entry = entries.get(subkey)
+            if entry is None:
+                continue
+            if entry.instances is not None:
+                entry.instances = [name for name in entry.instances if name not in names]
+                entry.instance_count = len(entry.instances)
+            else:
+                entry.instance_count = max(0, entry.instance_count - len(names))
+            if entry.ports:
+                for name in names:
+                    entry.ports.pop(name, None)
@@ -0,0 +1,167 @@
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+
+HISTORY_FILE = "growth_history.db"
+HISTORY_KEEP_DAYS = 730
+LOOKBACK_DAYS = 14
+MIN_SAMPLES = 3
+HORIZON_HOURS = 24.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    time INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_time ON runs (time);
+CREATE TABLE IF NOT EXISTS counts (
+    run_id INTEGER NOT NULL,
+    vid_pid TEXT NOT NULL,
+    instances INTEGER NOT NULL,
+    PRIMARY KEY (run_id, vid_pid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS counts_device ON counts (vid_pid, run_id);
+"""
+
+class GrowthHistory:
+    """各 VID/PID 實例數的時間序列（SQLite）：每次執行一筆 runs，所有裝置的實例數在同一個交易內批次寫入。
+
+    counts 以 (run_id, vid_pid) 為主鍵、另有 (vid_pid, run_id) 索引，查詢只掃描時間窗內的資料，不受歷史長度影響。
+    """
+
+    def __init__(self, db_file: str = HISTORY_FILE):
+        self.db_file = db_file
+        self.db = sqlite3.connect(db_file)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        self.db.close()
+
+    def record_run(self, counts: dict, when: float = None) -> int:
+        """寫入一次執行的 {vidpid: 實例數}，回傳 run id"""
+        with self.db:
+            run_id = self.db.execute("INSERT INTO runs (time) VALUES (?)", (int(when if when is not None else time.time()),)).lastrowid
+            self.db.executemany("INSERT INTO counts (run_id, vid_pid, instances) VALUES (?, ?, ?)",
+                                ((run_id, vidpid, count) for vidpid, count in counts.items()))
+        return run_id
+
+    def _first_run_since(self, since: float) -> int:
+        row = self.db.execute("SELECT MIN(id) FROM runs WHERE time >= ?", (int(since),)).fetchone()
+        return row[0] if row[0] is not None else sys.maxsize
+
+    def samples(self, since: float, vidpids=None) -> dict[str, list[tuple[int, int]]]:
+        """時間窗內各 VID/PID 的 [(時間, 實例數), ...]（依時間排序）；vidpids 指定時只取這些裝置。
+        不指定時依主鍵順序掃描時間窗（以 run_id 排序，避免查詢計畫改走 (vid_pid, run_id) 索引掃過全部歷史）"""
+        first = self._first_run_since(since)
+        result = {}
+        if vidpids is None:
+            rows = self.db.execute("SELECT c.vid_pid, r.time, c.instances FROM counts c JOIN runs r ON r.id = c.run_id "
+                                   "WHERE c.run_id >= ? ORDER BY c.run_id", (first,))
+        else:
+            rows = (row for vidpid in vidpids for row in self.db.execute(
+                "SELECT c.vid_pid, r.time, c.instances FROM counts c JOIN runs r ON r.id = c.run_id "
+                "WHERE c.vid_pid = ? AND c.run_id >= ? ORDER BY c.run_id", (vidpid, first)))
+        for vidpid, when, count in rows:
+            result.setdefault(vidpid, []).append((when, count))
+        return result
+
+    def growth_rates(self, lookback_days: float = LOOKBACK_DAYS, min_samples: int = MIN_SAMPLES,
+                     vidpids=None, now: float = None) -> dict[str, float]:
+        """各 VID/PID 近 lookback_days 天的成長率（實例/小時）；樣本不足的裝置不列入"""
+        now = time.time() if now is None else now
+        rates = {}
+        for vidpid, points in self.samples(now - lookback_days * 86400, vidpids).items():
+            rate = estimate_rate(points, min_samples)
+            if rate is not None:
+                rates[vidpid] = rate
+        return rates
+
+    def top_growers(self, days: float = 7, limit: int = 20, now: float = None) -> list[dict]:
+        """近 days 天實例數增加最多的 VID/PID（只累計增加量，清理造成的下降不抵銷）"""
+        now = time.time() if now is None else now
+        growers = []
+        for vidpid, points in self.samples(now - days * 86400).items():
+            growth = sum(max(0, b - a) for (_, a), (_, b) in zip(points, points[1:]))
+            if growth > 0:
+                growers.append({"vid_pid": vidpid, "growth": growth, "samples": len(points), "latest": points[-1][1]})
+        growers.sort(key=lambda item: (-item["growth"], item["vid_pid"]))
+        return growers[:limit]
+
+    def prune(self, keep_days: float = HISTORY_KEEP_DAYS, now: float = None) -> int:
+        """刪除超過 keep_days 天的執行紀錄，回傳刪除的執行數"""
+        now = time.time() if now is None else now
+        first = self._first_run_since(now - keep_days * 86400)
+        with self.db:
+            self.db.execute("DELETE FROM counts WHERE run_id < ?", (first,))
+            removed = self.db.execute("DELETE FROM runs WHERE id < ?", (first,)).rowcount
+        return removed
+
+def estimate_rate(points: list[tuple[int, int]], min_samples: int = MIN_SAMPLES):
+    """以最小平方法估計成長率（實例/小時）；只使用最後一次下降（清理）之後的樣本，不足 min_samples 筆時回傳 None"""
+    start = 0
+    for i in range(1, len(points)):
+        if points[i][1] < points[i - 1][1]:
+            start = i
+    points = points[start:]
+    if len(points) < max(2, min_samples):
+        return None
+    hours = [(when - points[0][0]) / 3600 for when, _ in points]
+    mean_x = sum(hours) / len(hours)
+    mean_y = sum(count for _, count in points) / len(points)
+    var_x = sum((x - mean_x) ** 2 for x in hours)
+    if var_x == 0:
+        return None
+    return sum((x - mean_x) * (count - mean_y) for x, (_, count) in zip(hours, points)) / var_x
+
+def predict_offenders(counts: dict, rates: dict, limits: dict, horizon_hours: float, locked_list=()) -> list[tuple[str, int, float]]:
+    """找出目前未達 limits[vidpid]、但依成長率推估在 horizon_hours 內會超過的裝置，
+    回傳 [(vidpid, 目前實例數, 推估實例數), ...]（推估值由大到小）"""
+    predicted = []
+    for vidpid, rate in rates.items():
+        count = counts.get(vidpid)
+        limit = limits.get(vidpid)
+        if count is None or limit is None or count >= limit or rate <= 0 or vidpid in locked_list:
+            continue
+        projected = count + rate * horizon_hours
+        if projected >= limit:
+            predicted.append((vidpid, count, round(projected, 1)))
+    predicted.sort(key=lambda item: item[2], reverse=True)
+    return predicted
+
+def main():
+    parser = argparse.ArgumentParser(description="查詢 VID/PID 實例數成長紀錄")
+    parser.add_argument("--db", default=HISTORY_FILE, help="成長紀錄資料庫")
+    sub = parser.add_subparsers(dest="command", required=True)
+    top = sub.add_parser("top", help="近期成長最多的 VID/PID")
+    top.add_argument("--days", type=float, default=7)
+    top.add_argument("--limit", type=int, default=20)
+    rates = sub.add_parser("rates", help="各 VID/PID 成長率（實例/小時）")
+    rates.add_argument("--days", type=float, default=LOOKBACK_DAYS)
+    prune = sub.add_parser("prune", help="刪除過舊的紀錄")
+    prune.add_argument("--keep-days", type=float, default=HISTORY_KEEP_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
+
+    with GrowthHistory(args.db) as history:
+        if args.command == "top":
+            for item in history.top_growers(args.days, args.limit):
+                print(f"{item['vid_pid']}  +{item['growth']:<6} 目前 {item['latest']}（{item['samples']} 筆樣本）")
+        elif args.command == "rates":
+            for vidpid, rate in sorted(history.growth_rates(args.days).items(), key=lambda item: item[1], reverse=True):
+                print(f"{vidpid}  {rate:+.2f}/h")
+        else:
+            logging.info(f"[History] 已刪除 {history.prune(args.keep_days)} 次執行的紀錄")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import os
+import json
+import logging
+import threading
+
+JOURNAL_SUFFIX = ".journal"
+COMPACT_THRESHOLD = 256
+
+class LockListStore:
+    """lock_list.json 的集合式快取：以檔案 mtime/size 判斷是否重讀，新增項目先附加到 journal，
+    累積到 compact_threshold 筆後再以原子替換方式寫回 lock_list.json。"""
+
+    def __init__(self, lock_list_file: str = "lock_list.json", compact_threshold: int = COMPACT_THRESHOLD):
+        self.lock_list_file = lock_list_file
+        self.journal_file = lock_list_file + JOURNAL_SUFFIX
+        self.compact_threshold = compact_threshold
+        self._locked = set()
+        self._frozen = None
+        self._ordered = []
+        self._journal_count = 0
+        self._journal_torn = None
+        self._corrupt = False
+        self._signature = None
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        except FileNotFoundError:
+            return None
+
+    def _current_signature(self):
+        return self._stat(self.lock_list_file), self._stat(self.journal_file)
+
+    def _load_base(self) -> list[str]:
+        self._corrupt = False
+        if not os.path.exists(self.lock_list_file):
+            return []
+        try:
+            with open(self.lock_list_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            locked = data.get("locked", [])
+            if not isinstance(locked, list):
+                logging.error(f"[LockList] lock_list.json 格式錯誤，locked 應為 list：{type(locked)}")
+            elif not all(isinstance(item, str) for item in locked):
+                logging.error(f"[LockList] locked 清單內容非全為字串：{locked}")
+            else:
+                return locked
+        except Exception as e:
+            logging.error(f"[LockList] 載入 Lock List 失敗：{e}")
+        self._corrupt = True
+        return []
+
+    def _reload_if_changed(self) -> None:
+        signature = self._current_signature()
+        if signature == self._signature:
+            return
+        ordered = self._load_base()
+        journal_count = 0
+        self._journal_torn = None
+        if signature[1] is not None:
+            try:
+                with open(self.journal_file, 'rb') as f:
+                    data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    # 寫入中斷留下的半行：略過，下次 add 前截掉，避免與新項目接成同一行
+                    self._journal_torn = end
+                    logging.warning(f"[LockList] journal 最後一行不完整，已略過：{data[end:][:40]!r}")
+                for line in data[:end].decode('utf-8').splitlines():
+                    vidpid = line.strip()
+                    if vidpid:
+                        ordered.append(vidpid)
+                        journal_count += 1
+            except Exception as e:
+                logging.error(f"[LockList] 讀取 journal 失敗：{e}")
+
+        self._locked = set()
+        self._frozen = None
+        self._ordered = []
+        for vidpid in ordered:
+            if vidpid not in self._locked:
+                self._locked.add(vidpid)
+                self._ordered.append(vidpid)
+        self._journal_count = journal_count
+        self._signature = signature
+        logging.debug(f"[LockList] 已載入 {len(self._locked)} 筆鎖定項目（journal {journal_count} 筆）")
+
+    def __contains__(self, vidpid: str) -> bool:
+        with self._lock:
+            self._reload_if_changed()
+            return vidpid in self._locked
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self._locked)
+
+    def locked(self) -> frozenset:
+        with self._lock:
+            self._reload_if_changed()
+            if self._frozen is None:
+                self._frozen = frozenset(self._locked)
+            return self._frozen
+
+    def add(self, vidpid: str) -> bool:
+        """加入一筆鎖定項目（附加寫入 journal），已存在時回傳 False"""
+        with self._lock:
+            self._reload_if_changed()
+            if vidpid in self._locked:
+                return False
+            if self._journal_torn is not None:
+                os.truncate(self.journal_file, self._journal_torn)
+                self._journal_torn = None
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(vidpid + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._locked.add(vidpid)
+            self._frozen = None
+            self._ordered.append(vidpid)
+            self._journal_count += 1
+            self._signature = self._current_signature()
+            if self._journal_count >= self.compact_threshold:
+                self.compact()
+            return True
+
+    def compact(self) -> None:
+        """將 journal 合併回 lock_list.json（暫存檔 + os.replace），之後清除 journal"""
+        with self._lock:
+            self._reload_if_changed()
+            if self._corrupt:
+                logging.error("[LockList] lock_list.json 無法解析，為避免覆蓋原始內容暫不合併 journal")
+                return
+            if not self._journal_count:
+                return
+            tmp_file = f"{self.lock_list_file}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump({"locked": self._ordered}, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.lock_list_file)
+            os.remove(self.journal_file)
+            self._journal_count = 0
+            self._signature = self._current_signature()
+            logging.info(f"[LockList] 已合併 journal，共 {len(self._ordered)} 筆鎖定項目")
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_lock_list_store(lock_list_file: str = "lock_list.json") -> LockListStore:
+    """同一個檔案在同一個行程內共用同一個 LockListStore"""
+    key = os.path.abspath(lock_list_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = LockListStore(key)
+        return store
@@ -0,0 +1,618 @@
+import os
+import re
+import sys
+import csv
+import glob
+import json
+import mmap
+import time
+import codecs
+import logging
+import argparse
+from collections import Counter
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from enum_index import ENUMERATORS, device_key
+
+CHUNK_BYTES = 16 * 1024 * 1024
+ANALYSIS_WORKERS = os.cpu_count() or 1
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+TOP_VIDPIDS = 50
+KEY_BLOCK_WINDOW = 4096
+
+_ROTATED_SUFFIX = re.compile(r"\.(?:\d+|\d{4}-\d{2}-\d{2})$")
+_RUN_STARTED = "====== EnumGuardian Auto Scan & Cleanup Started ======"
+_RUN_FINISHED = "====== 全部流程執行完畢 ======"
+_RUN_OUTSIDE_SCHEDULE = "當前不在設定執行時間，已退出。"
+_KEY_DELETED = "已刪除 ENUM 註冊表項目: "
+_MARKERS = {_RUN_STARTED: "start", _RUN_FINISHED: "end", _RUN_OUTSIDE_SCHEDULE: "exit"}
+
+# enum_guardian_log.txt（LOG_FORMAT："[YYYY-MM-DD HH:MM:SS,mmm] [模組] 訊息"）。樣式都以 "] [模組] " 開頭，
+# 讓 re 以字面前綴快速略過無關的行；時間固定在其前 23 個字元
+_TIMESTAMP_WIDTH = 23
+_TIMESTAMP = re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2},\d{3}")
+_MARKER_PATTERN = re.compile(rf"\] \[AUTO\] ({'|'.join(re.escape(marker) for marker in _MARKERS)})")
+_EVENT_PATTERNS = (
+    ("AUTO", re.compile(r"\] \[AUTO\] ([^\r\n]*)")),
+    ("Monitor", re.compile(r"\] \[Monitor\] ([^\r\n]*)")),
+    ("Cleaner", re.compile(rf"\] \[Cleaner\] (?!{re.escape(_KEY_DELETED)})([^\r\n]*)")),
+)
+_KEY_LINE = f"] [Cleaner] {_KEY_DELETED}"
+# 逐鍵刪除的行佔 log 絕大部分，只取出裝置鍵（含可能的列舉器前綴）
+_KEY_LINE_PATTERN = re.compile(rf"{re.escape(_KEY_LINE)}((?i:(?:{'|'.join(ENUMERATORS)})\\)?[^\\\r\n]+)")
+# 批次檔包裝的 echo 行（%date% %time%，日期後可能帶星期，小時可能以空白補位）
+_WRAPPER_PATTERN = re.compile(r"^\[(\d{4})/(\d{2})/(\d{2})[^\]\r\n]*?(\d{1,2}):(\d{2}):(\d{2})\.(\d{2})\] (Starting|Ended)",
+                              re.MULTILINE)
+_AUTO_PATTERNS = (
+    ("offenders", re.compile(r"本次掃描共偵測到 (\d+) 個裝置項目")),
+    ("resumed", re.compile(r"接續上次中斷的清理，尚有 (\d+) 個裝置項目")),
+    ("result", re.compile(r"本次清理完成，共處理 (\d+) 項，跳過 (\d+) 項")),
+    ("failed", re.compile(r"共 (\d+) 項清理失敗")),
+    ("locked", re.compile(r"\[\d+\] (\S+) 已存在於 Lock List，跳過")),
+    ("error", re.compile(r"\[\d+\] 清理 (\S+) 發生錯誤")),
+    ("run_error", re.compile(r"執行失敗：")),
+)
+_KEYS_AGGREGATED = re.compile(r"已刪除 ENUM 註冊表項目：(\S+) 共 (\d+) 項")
+_KEYS_SUMMARY = re.compile(r"(\S+) 共刪除 (\d+) 個註冊表鍵")
+_KEY_ERROR = re.compile(r"刪除 (.+?) 發生錯誤")
+_PRUNE_KEPT = re.compile(r"(\S+) 部分清理：保留 (\d+) 個實例")
+_COMDB_FREED = re.compile(r"，釋放 (\d+) 個")
+_MONITOR_DETECTED = re.compile(r"偵測到 (\S+) 子鍵數量 (\d+)")
+_MONITOR_LOCKED = re.compile(r"已鎖定 (\S+)，略過統計")
+
+RUN_FIELDS = ("stream", "start", "end", "seconds", "status", "offenders", "resumed", "cleaned", "skipped", "failed",
+              "vidpids_cleaned", "instances_deleted", "keys_deleted", "kept", "errors", "comdb_freed", "lines")
+VIDPID_FIELDS = ("vid_pid", "cleaned_runs", "instances_deleted", "keys_deleted", "kept", "detected_runs", "max_instances",
+                 "locked_runs", "errors", "failures", "first_seen", "last_cleaned", "last_failure", "last_error")
+
+def detect_log_encoding(data) -> tuple[str, int]:
+    """判斷 log 檔編碼，回傳 (編碼, BOM 長度)：有 UTF-8 BOM 或開頭 ENCODING_SAMPLE_BYTES 可依 UTF-8 解碼時為 UTF-8，
+    否則視為 cp950（批次檔把 stdout 以主控台字碼頁附加到 Enum_Guardian.log）"""
+    if data[:3] == b"\xef\xbb\xbf":
+        return "utf-8", 3
+    try:
+        # 取樣可能切在多位元組字元中間，以增量解碼器（final=False）忽略結尾不完整的字元
+        codecs.getincrementaldecoder("utf-8")().decode(data[:ENCODING_SAMPLE_BYTES], False)
+        return "utf-8", 0
+    except UnicodeDecodeError:
+        return "cp950", 0
+
+def split_line_chunks(data, start: int, chunk_bytes: int = CHUNK_BYTES) -> list[tuple[int, int]]:
+    """把 [start, len(data)) 依換行切成約 chunk_bytes 大小的區段（UTF-8 與 cp950 的多位元組字元都不含 0x0A）"""
+    chunks = []
+    size = len(data)
+    while start < size:
+        end = data.find(b"\n", min(start + chunk_bytes, size) - 1)
+        end = size if end < 0 else end + 1
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def stream_name(path: str) -> str:
+    """同一個 log 的輪替檔（<檔名>.1、<檔名>.<YYYY-MM-DD>）屬於同一個串流，依修改時間由舊到新接續分析"""
+    return _ROTATED_SUFFIX.sub("", os.path.basename(path)).lower()
+
+def _normalize_timestamp(text: str) -> str:
+    """統一為 YYYY-MM-DD HH:MM:SS.mmm（text log 用逗號、JSON lines 用 T）"""
+    return text.replace("T", " ").replace(",", ".")
+
+class _Segment:
+    """兩個執行邊界之間的事件彙總：執行層級的計數與各 VID/PID 的計數"""
+    __slots__ = ("first", "last", "lines", "counters", "vidpids")
+
+    def __init__(self):
+        self.first = None
+        self.last = None
+        self.lines = 0
+        self.counters = {}
+        self.vidpids = {}
+
+    def vidpid(self, vidpid: str) -> dict:
+        stats = self.vidpids.get(vidpid)
+        if stats is None:
+            stats = self.vidpids[vidpid] = {"instances_deleted": 0, "keys_deleted": 0, "kept": 0, "detected": 0,
+                                             "max_instances": 0, "locked": 0, "errors": 0}
+        return stats
+
+    def add(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+class _ChunkParser:
+    """把一個區段的行轉成有序的時間線：("start" / "end" / "exit" / "wrapper_start" / "wrapper_end", 時間) 與 ("segment", _Segment)"""
+
+    def __init__(self):
+        self.timeline = []
+        self.segment = None
+        self.lines = 0
+        self._keys = {}
+
+    def marker(self, kind: str, timestamp: str) -> None:
+        if self.segment is not None:
+            self.timeline.append(("segment", self.segment))
+            self.segment = None
+        self.timeline.append((kind, timestamp))
+
+    def finish(self) -> list:
+        if self.segment is not None:
+            self.timeline.append(("segment", self.segment))
+            self.segment = None
+        return self.timeline
+
+    def key_vidpid(self, key: str) -> str:
+        """刪除的實例路徑（Enum\\USB 底下的 <裝置鍵>\\<實例>，或多列舉器的 <列舉器>\\<裝置鍵>[\\<實例>]）對應的 VID/PID"""
+        parts = key.split("\\", 2)
+        if len(parts) > 1 and parts[0].upper() in ENUMERATORS:
+            device = (parts[0], parts[1])
+        else:
+            device = ("USB", parts[0])
+        vidpid = self._keys.get(device)
+        if vidpid is None:
+            vidpid = self._keys[device] = device_key(*device)
+        return vidpid
+
+    def _segment(self, timestamp: str) -> _Segment:
+        if self.segment is None:
+            self.segment = _Segment()
+            self.segment.first = timestamp
+        return self.segment
+
+    def span(self, text: str, pos: int, endpos: int) -> None:
+        """text log 中兩個執行邊界之間的行：逐鍵刪除的行依裝置計數，其餘事件行逐行處理"""
+        events = []
+        for module, pattern in _EVENT_PATTERNS:
+            events += [(match.start(), module, match.group(1)) for match in pattern.finditer(text, pos, endpos)]
+        counts = self._count_key_lines(text, pos, endpos)
+        if not events and not counts:
+            return
+        events.sort()
+        first = min([at for at, _, _ in events[:1]] + [text.find(_KEY_LINE, pos, endpos)] * bool(counts))
+        segment = self._segment(text[first - _TIMESTAMP_WIDTH:first].replace(",", "."))
+        for device, count in counts.items():
+            segment.vidpid(self.key_vidpid(device))["instances_deleted"] += count
+            segment.lines += count
+            self.lines += count
+        for at, module, message in events:
+            timestamp = text[at - _TIMESTAMP_WIDTH:at]
+            if _TIMESTAMP.fullmatch(timestamp):
+                self.line(timestamp.replace(",", "."), module, message)
+        last = max([at for at, _, _ in events[-1:]] + [text.rfind(_KEY_LINE, pos, endpos)])
+        segment.last = text[last - _TIMESTAMP_WIDTH:last].replace(",", ".")
+
+    @staticmethod
+    def _count_key_lines(text: str, pos: int, endpos: int) -> dict:
+        """依裝置計算逐鍵刪除的行數。同一裝置的行通常連續：以倍增的視窗找到這一段的最後一行，str.count 一次數完再跳過；
+        總數與 _KEY_LINE 出現次數不符（不同裝置的行交錯）時改用 findall 逐行計數"""
+        total = text.count(_KEY_LINE, pos, endpos)
+        counts = {}
+        found = 0
+        cursor = pos
+        while found < total:
+            at = text.find(_KEY_LINE, cursor, endpos)
+            if at < 0:
+                break
+            match = _KEY_LINE_PATTERN.match(text, at, endpos)
+            if match is None:
+                break
+            # 連同裝置鍵之後的分隔字元（\\ 或行尾）一起比對，避免 VID_x&PID_y 與 VID_x&PID_y&MI_00 混淆
+            needle = text[at:match.end() + 1]
+            window = KEY_BLOCK_WINDOW
+            while True:
+                limit = min(endpos, at + window)
+                last = text.rfind(needle, at, limit)
+                if limit == endpos or last + 2 * len(needle) < limit - window // 2:
+                    break
+                window *= 2
+            end = text.find("\n", last, endpos) + 1 or endpos
+            count = text.count(needle, at, end)
+            counts[match.group(1)] = counts.get(match.group(1), 0) + count
+            found += count
+            cursor = end
+        if found != total:
+            return Counter(_KEY_LINE_PATTERN.findall(text, pos, endpos))
+        return counts
+
+    def line(self, timestamp: str, module: str, message: str) -> None:
+        if module == "AUTO" and message in _MARKERS:
+            return self.marker(_MARKERS[message], timestamp)
+        segment = self._segment(timestamp)
+        segment.last = timestamp
+        segment.lines += 1
+        self.lines += 1
+
+        if module == "Cleaner":
+            if message.startswith(_KEY_DELETED):
+                segment.vidpid(self.key_vidpid(message[len(_KEY_DELETED):].rstrip()))["instances_deleted"] += 1
+                return
+            match = _KEYS_SUMMARY.match(message)
+            if match:
+                segment.vidpid(match.group(1))["keys_deleted"] += int(match.group(2))
+                return
+            match = _KEYS_AGGREGATED.match(message)
+            if match:
+                segment.vidpid(match.group(1))["instances_deleted"] += int(match.group(2))
+                return
+            match = _KEY_ERROR.match(message)
+            if match:
+                segment.vidpid(self.key_vidpid(match.group(1)))["errors"] += 1
+                return
+            match = _PRUNE_KEPT.match(message)
+            if match:
+                segment.vidpid(match.group(1))["kept"] += int(match.group(2))
+                return
+            if message.startswith("ComDB"):
+                match = _COMDB_FREED.search(message)
+                if match:
+                    segment.add("comdb_freed", int(match.group(1)))
+        elif module == "Monitor":
+            match = _MONITOR_DETECTED.match(message)
+            if match:
+                stats = segment.vidpid(match.group(1))
+                stats["detected"] += 1
+                stats["max_instances"] = max(stats["max_instances"], int(match.group(2)))
+                return
+            match = _MONITOR_LOCKED.match(message)
+            if match:
+                segment.vidpid(match.group(1))["locked"] += 1
+        else:
+            for name, pattern in _AUTO_PATTERNS:
+                match = pattern.match(message)
+                if match is None:
+                    continue
+                if name in ("offenders", "resumed"):
+                    segment.counters["offenders"] = int(match.group(1))
+                    if name == "resumed":
+                        segment.counters["resumed"] = 1
+                elif name == "result":
+                    segment.counters["cleaned"] = int(match.group(1))
+                    segment.counters["skipped"] = int(match.group(2))
+                elif name == "failed":
+                    segment.counters["failed"] = int(match.group(1))
+                elif name == "locked":
+                    segment.vidpid(match.group(1))["locked"] += 1
+                elif name == "error":
+                    segment.vidpid(match.group(1))["errors"] += 1
+                else:
+                    segment.add("errors")
+                return
+
+def parse_log_chunk(log_file: str, encoding: str, json_lines: bool, start: int, end: int) -> dict:
+    """在子行程中解析一個區段，回傳有序的時間線（跨區段的執行由主行程依序接續）"""
+    with open(log_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode(encoding, errors="replace")
+    parser = _ChunkParser()
+    if json_lines:
+        for raw in text.splitlines():
+            if not raw.startswith("{"):
+                continue
+            try:
+                entry = json.loads(raw)
+            except ValueError:
+                continue
+            message = entry.get("msg", "")
+            if message.startswith("[") and message[1:8].split("]", 1)[0] in ("AUTO", "Cleaner", "Monitor"):
+                module, _, message = message[1:].partition("] ")
+                parser.line(_normalize_timestamp(entry.get("t", "")), module, message)
+    else:
+        markers = [(match.start(), match.group(1)) for match in _MARKER_PATTERN.finditer(text)
+                   if _TIMESTAMP.fullmatch(text, match.start() - _TIMESTAMP_WIDTH, match.start())]
+        if "] Starting " in text or "] Ended" in text:
+            markers += [(match.start(), match) for match in _WRAPPER_PATTERN.finditer(text)]
+            markers.sort(key=lambda item: item[0])
+        pos = 0
+        for at, marker in markers:
+            parser.span(text, pos, at)
+            pos = text.find("\n", at) + 1 or len(text)
+            parser.lines += 1
+            if isinstance(marker, str):
+                parser.marker(_MARKERS[marker], text[at - _TIMESTAMP_WIDTH:at].replace(",", "."))
+            else:
+                year, month, day, hour, minute, second, centis, kind = marker.groups()
+                parser.marker("wrapper_start" if kind == "Starting" else "wrapper_end",
+                              f"{year}-{month}-{day} {int(hour):02d}:{minute}:{second}.{centis}0")
+        parser.span(text, pos, len(text))
+    return {"timeline": parser.finish(), "lines": parser.lines, "bytes": end - start}
+
+def _new_vidpid_stats(vidpid: str) -> dict:
+    stats = dict.fromkeys(VIDPID_FIELDS, 0)
+    stats.update(vid_pid=vidpid, first_seen=None, last_cleaned=None, last_failure=None, last_error=None)
+    return stats
+
+def _seconds_between(start: str, end: str):
+    try:
+        return round((datetime.strptime(end, "%Y-%m-%d %H:%M:%S.%f")
+                      - datetime.strptime(start, "%Y-%m-%d %H:%M:%S.%f")).total_seconds(), 3)
+    except (TypeError, ValueError):
+        return None
+
+class LogAggregator:
+    """依序接收各區段的時間線，組成每次執行（批次檔的 Starting/Ended 或程式的開始/完畢標記）並累計各 VID/PID 統計。
+    每個串流各自追蹤目前的執行；同一次執行同時出現在 enum_guardian_log.txt 與批次檔 log 時，以程式開始時間判斷並只計一次。
+    完成的執行交給 on_run（例如直接寫入 CSV），本身只保留各 VID/PID 的統計與執行耗時，記憶體與 log 大小無關"""
+
+    def __init__(self, on_run=None):
+        self.on_run = on_run
+        self.vidpids = {}
+        self.durations = []
+        self.statuses = {}
+        self.duplicates = 0
+        self.failure_items = 0
+        self._current = {}
+        self._seen_starts = set()
+
+    def _open(self, stream: str, timestamp: str, wrapper: bool) -> dict:
+        run = {"stream": stream, "start": timestamp, "app_start": None, "end": None, "last": timestamp,
+               "wrapper": wrapper, "finished": False, "outside_schedule": False, "duplicate": False,
+               "counters": {}, "vidpids": {}, "lines": 0}
+        self._current[stream] = run
+        return run
+
+    def _start_app(self, run: dict, timestamp: str) -> None:
+        run["app_start"] = timestamp
+        if timestamp in self._seen_starts:
+            run["duplicate"] = True
+        self._seen_starts.add(timestamp)
+
+    def feed(self, stream: str, timeline: list) -> None:
+        for kind, value in timeline:
+            run = self._current.get(stream)
+            if kind == "segment":
+                if run is None:
+                    # log 從執行中途開始（例如較舊的輪替檔已刪除）
+                    run = self._open(stream, value.first, wrapper=False)
+                self._merge(run, value)
+            elif kind == "wrapper_start":
+                if run is not None:
+                    self._close(run, "interrupted")
+                self._open(stream, value, wrapper=True)
+            elif kind == "start":
+                if run is not None and not (run["wrapper"] and run["app_start"] is None and not run["finished"]):
+                    self._close(run, "interrupted")
+                    run = None
+                if run is None:
+                    run = self._open(stream, value, wrapper=False)
+                self._start_app(run, value)
+            elif run is None:
+                continue
+            elif kind == "end":
+                run["end"] = run["last"] = value
+                run["finished"] = True
+                if not run["wrapper"]:
+                    self._close(run)
+            elif kind == "exit":
+                run["end"] = run["last"] = value
+                run["outside_schedule"] = True
+                if not run["wrapper"]:
+                    self._close(run)
+            elif kind == "wrapper_end":
+                run["end"] = run["last"] = value
+                self._close(run)
+
+    def finish(self) -> None:
+        """所有檔案讀完後結束各串流仍未結束的執行"""
+        for run in list(self._current.values()):
+            self._close(run, "incomplete")
+
+    def _merge(self, run: dict, segment: _Segment) -> None:
+        run["last"] = segment.last
+        run["lines"] += segment.lines
+        for name, value in segment.counters.items():
+            if name in ("comdb_freed", "errors"):
+                run["counters"][name] = run["counters"].get(name, 0) + value
+            else:
+                run["counters"][name] = value
+        for vidpid, stats in segment.vidpids.items():
+            current = run["vidpids"].get(vidpid)
+            if current is None:
+                run["vidpids"][vidpid] = dict(stats)
+                continue
+            for name, value in stats.items():
+                current[name] = max(current[name], value) if name == "max_instances" else current[name] + value
+
+    def _close(self, run: dict, status: str = None) -> None:
+        del self._current[run["stream"]]
+        if run["duplicate"]:
+            self.duplicates += 1
+            return
+        if run["finished"]:
+            status = "completed"
+        elif run["outside_schedule"]:
+            status = "outside_schedule"
+        elif run["app_start"] is None and not run["lines"]:
+            status = "no_output"
+        status = status or "incomplete"
+        end = run["end"] or run["last"]
+        seconds = _seconds_between(run["start"], end)
+        if seconds is not None and status == "completed":
+            self.durations.append(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+        totals = {"instances_deleted": 0, "keys_deleted": 0, "kept": 0, "errors": run["counters"].get("errors", 0)}
+        cleaned = 0
+        for vidpid, stats in run["vidpids"].items():
+            target = self.vidpids.get(vidpid)
+            if target is None:
+                target = self.vidpids[vidpid] = _new_vidpid_stats(vidpid)
+            for name in ("instances_deleted", "keys_deleted", "kept", "errors"):
+                target[name] += stats[name]
+                totals[name] += stats[name]
+            target["max_instances"] = max(target["max_instances"], stats["max_instances"])
+            target["detected_runs"] += stats["detected"] > 0
+            target["locked_runs"] += stats["locked"] > 0
+            if target["first_seen"] is None or run["start"] < target["first_seen"]:
+                target["first_seen"] = run["start"]
+            if stats["instances_deleted"] or stats["keys_deleted"]:
+                cleaned += 1
+                target["cleaned_runs"] += 1
+                target["last_cleaned"] = max(target["last_cleaned"] or "", run["start"])
+
+        if self.on_run is not None:
+            counters = run["counters"]
+            self.on_run({
+                "stream": run["stream"], "start": run["start"], "end": end, "seconds": seconds, "status": status,
+                "offenders": counters.get("offenders"), "resumed": bool(counters.get("resumed")),
+                "cleaned": counters.get("cleaned"), "skipped": counters.get("skipped"), "failed": counters.get("failed", 0),
+                "vidpids_cleaned": cleaned, **totals, "comdb_freed": counters.get("comdb_freed", 0), "lines": run["lines"],
+            })
+
+    def add_failures(self, failures: list) -> None:
+        """failed_logs/failed_<日期>.json 的項目（{vid_pid, count, error, timestamp}）"""
+        for item in failures:
+            vidpid = item.get("vid_pid")
+            if not vidpid:
+                continue
+            target = self.vidpids.get(vidpid)
+            if target is None:
+                target = self.vidpids[vidpid] = _new_vidpid_stats(vidpid)
+            target["failures"] += 1
+            timestamp = item.get("timestamp", "")
+            if target["last_failure"] is None or timestamp >= target["last_failure"]:
+                target["last_failure"] = timestamp
+                target["last_error"] = item.get("error")
+            self.failure_items += 1
+
+    def run_summary(self) -> dict:
+        durations = sorted(self.durations)
+
+        def percentile(p: float):
+            return durations[min(len(durations) - 1, int(len(durations) * p))] if durations else None
+        return {
+            "total": sum(self.statuses.values()),
+            "status": dict(sorted(self.statuses.items())),
+            "duplicates_skipped": self.duplicates,
+            "seconds": {
+                "completed_runs": len(durations),
+                "mean": round(sum(durations) / len(durations), 3) if durations else None,
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "max": durations[-1] if durations else None,
+            },
+        }
+
+    def top_vidpids(self, limit: int = TOP_VIDPIDS) -> list[dict]:
+        """依被清理的執行次數（其次刪除的實例數）排序"""
+        return sorted(self.vidpids.values(), key=lambda stats: (-stats["cleaned_runs"], -stats["instances_deleted"],
+                                                               stats["vid_pid"]))[:limit]
+
+def collect_files(patterns: list[str]) -> tuple[list[str], list[str]]:
+    """展開路徑與萬用字元（Windows 命令列不會自動展開）；目錄則取其中的 enum_guardian_log.txt*、批次檔 log
+    （Enum_Guardian.log / EnumGuardian.log）與 failed_logs/failed_*.json。回傳 (log 檔, 失敗紀錄 JSON)"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for name in ("*log.txt*", "Enum*Guardian*.log*", "failed_*.json", os.path.join("failed_logs", "failed_*.json")):
+                paths += glob.glob(os.path.join(pattern, name))
+        else:
+            paths += glob.glob(pattern) or [pattern]
+    paths = list(dict.fromkeys(os.path.normpath(path) for path in paths))
+    failures = [path for path in paths if path.lower().endswith(".json")]
+    logs = [path for path in paths if path not in failures]
+    return logs, failures
+
+def analyse_logs(log_files: list[str], failure_files: list[str] = (), workers: int = ANALYSIS_WORKERS,
+                 chunk_bytes: int = CHUNK_BYTES, on_run=None) -> tuple[LogAggregator, dict]:
+    """串流分析 log（mmap 讀取、依換行分段、每個檔案各自判斷編碼與 text/JSON lines 格式），依序交給 LogAggregator，
+    最後加入失敗紀錄。workers > 1 時以行程池平行解析區段（結果依原順序合併）。回傳 (aggregator, 統計)"""
+    start_time = time.perf_counter()
+    # 同一串流的輪替檔依修改時間由舊到新
+    log_files = sorted(log_files, key=lambda path: (stream_name(path), os.path.getmtime(path)))
+    tasks = []
+    encodings = {}
+    for log_file in log_files:
+        with open(log_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoding, bom = detect_log_encoding(data)
+                json_lines = data[bom:bom + 1] == b"{"
+                encodings[log_file] = f"{encoding}{' json' if json_lines else ''}"
+                tasks += [(log_file, encoding, json_lines, start, end) for start, end in split_line_chunks(data, bom, chunk_bytes)]
+
+    aggregator = LogAggregator(on_run)
+    lines = 0
+    total_bytes = 0
+    streams = [stream_name(task[0]) for task in tasks]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(parse_log_chunk, *zip(*tasks))
+            for stream, result in zip(streams, results):
+                aggregator.feed(stream, result["timeline"])
+                lines += result["lines"]
+                total_bytes += result["bytes"]
+    else:
+        for stream, task in zip(streams, tasks):
+            result = parse_log_chunk(*task)
+            aggregator.feed(stream, result["timeline"])
+            lines += result["lines"]
+            total_bytes += result["bytes"]
+    aggregator.finish()
+
+    for failure_file in failure_files:
+        try:
+            with open(failure_file, "r", encoding="utf-8") as f:
+                aggregator.add_failures(json.load(f))
+        except (OSError, ValueError) as e:
+            logging.warning(f"[LogAnalyzer] 無法讀取失敗紀錄 {failure_file}：{e}")
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"[LogAnalyzer] 解析 {len(log_files)} 個 log（{len(tasks)} 個區段）與 {len(failure_files)} 個失敗紀錄，"
+                 f"{total_bytes / 1048576:.1f} MB、{lines} 行事件，耗時 {elapsed:.2f}s"
+                 f"（{total_bytes / 1048576 / elapsed if elapsed else 0:.1f} MB/s）")
+    return aggregator, {
+        "log_files": len(log_files), "failure_files": len(failure_files), "chunks": len(tasks), "encodings": encodings,
+        "bytes": total_bytes, "event_lines": lines, "seconds": round(elapsed, 3),
+        "mb_per_second": round(total_bytes / 1048576 / elapsed, 2) if elapsed else 0.0,
+        "lines_per_second": round(lines / elapsed, 1) if elapsed else 0.0,
+    }
+
+def write_csv(path: str, fields: tuple, rows) -> None:
+    # utf-8-sig：Excel 直接開啟時中文不會變亂碼
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main():
+    parser = argparse.ArgumentParser(description="分析 enum_guardian log、批次檔 log 與 failed_logs，統計每次執行與各 VID/PID 的清理紀錄")
+    parser.add_argument("paths", nargs="+", help="log 檔、failed_*.json、萬用字元或目錄（例如 enum_guardian_log.txt* failed_logs）")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS, help="解析行程數")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 1048576, help="每個區段大小（MB）")
+    parser.add_argument("--csv-dir", help="輸出 runs.csv（每次執行一列）與 vidpids.csv 的目錄")
+    parser.add_argument("--output", help="摘要輸出 JSON 檔（預設印到 stdout）")
+    parser.add_argument("--top", type=int, default=TOP_VIDPIDS, help="摘要列出的 VID/PID 數量")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
+
+    log_files, failure_files = collect_files(args.paths)
+    runs_file = None
+    on_run = None
+    if args.csv_dir:
+        os.makedirs(args.csv_dir, exist_ok=True)
+        runs_file = open(os.path.join(args.csv_dir, "runs.csv"), "w", encoding="utf-8-sig", newline="")
+        writer = csv.DictWriter(runs_file, fieldnames=RUN_FIELDS)
+        writer.writeheader()
+        on_run = writer.writerow
+    try:
+        aggregator, stats = analyse_logs(log_files, failure_files, args.workers, int(args.chunk_mb * 1048576), on_run)
+    finally:
+        if runs_file is not None:
+            runs_file.close()
+    if args.csv_dir:
+        write_csv(os.path.join(args.csv_dir, "vidpids.csv"), VIDPID_FIELDS, aggregator.top_vidpids(len(aggregator.vidpids)))
+        logging.info(f"[LogAnalyzer] 已輸出 {os.path.join(args.csv_dir, 'runs.csv')} 與 vidpids.csv")
+
+    report = {
+        "stats": stats,
+        "runs": aggregator.run_summary(),
+        "failure_items": aggregator.failure_items,
+        "vidpids": len(aggregator.vidpids),
+        "top_vidpids": aggregator.top_vidpids(args.top),
+    }
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+import os
+import sys
+import glob
+import json
+import queue
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, date
+
+LOG_FORMAT = '[%(asctime)s] %(message)s'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_BATCH_SIZE = 1024
+LOG_FLUSH_INTERVAL = 0.05
+FLUSH_TIMEOUT_SECONDS = 5.0
+
+class TextLineFormatter(logging.Formatter):
+    """與 LOG_FORMAT 相同的輸出，時間字串以秒為單位快取（同一秒內的大量紀錄不必重複 strftime）"""
+
+    def __init__(self):
+        super().__init__(LOG_FORMAT)
+        self._second = None
+        self._prefix = ""
+
+    def formatTime(self, record, datefmt=None) -> str:
+        second = int(record.created)
+        if second != self._second:
+            self._second = second
+            self._prefix = time.strftime(self.default_time_format, self.converter(record.created))
+        return f"{self._prefix},{int(record.msecs):03d}"
+
+class JsonLineFormatter(logging.Formatter):
+    """精簡 JSON lines：{"t": 時間, "lvl": 等級, "msg": 訊息}，有 vid_pid / count / 例外時一併寫入"""
+
+    def __init__(self):
+        super().__init__()
+        self._second = None
+        self._prefix = ""
+
+    def format(self, record) -> str:
+        second = int(record.created)
+        if second != self._second:
+            self._second = second
+            self._prefix = datetime.fromtimestamp(second).isoformat()
+        entry = {
+            "t": f"{self._prefix}.{int(record.msecs):03d}",
+            "lvl": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for name in ("vid_pid", "count"):
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+
+class RotatingLogFile:
+    """寫入執行緒使用的 log 檔（以位元組寫入，大小即時累計）。
+    rotate="size"：超過 max_bytes 時輪替為 <檔名>.1 ~ .backup_count；
+    rotate="daily"：日期改變時把舊檔改名為 <檔名>.<YYYY-MM-DD>，只保留最近 backup_count 份；"none"：不輪替"""
+
+    def __init__(self, path: str, rotate: str = "size", max_bytes: int = LOG_MAX_BYTES, backup_count: int = LOG_BACKUP_COUNT):
+        if rotate not in ("size", "daily", "none"):
+            raise ValueError(f"不支援的輪替方式：{rotate}")
+        self.path = path
+        self.rotate = rotate
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.rotations = 0
+        self._open()
+
+    def _open(self) -> None:
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        # 沿用既有檔案時以最後修改日期判斷是否需要按日輪替
+        self._day = date.fromtimestamp(os.path.getmtime(self.path)) if self._size else date.today()
+
+    def write(self, data: bytes) -> None:
+        """寫入一批完整的行；按大小輪替時在行的邊界切開，單一批次也不會超過 max_bytes（單行本身過長時除外）"""
+        if self.rotate == "size":
+            while self._size + len(data) > self.max_bytes:
+                cut = data.rfind(b"\n", 0, self.max_bytes - self._size) + 1
+                if not cut and not self._size:
+                    cut = data.find(b"\n") + 1 or len(data)
+                self._file.write(data[:cut])
+                data = data[cut:]
+                self._rotate_size()
+        elif self.rotate == "daily" and date.today() != self._day:
+            self._rotate_daily()
+        self._file.write(data)
+        self._size += len(data)
+
+    def flush(self) -> None:
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def _rotate_size(self) -> None:
+        self._file.close()
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def _rotate_daily(self) -> None:
+        self._file.close()
+        os.replace(self.path, f"{self.path}.{self._day.isoformat()}")
+        for old in sorted(glob.glob(f"{glob.escape(self.path)}.????-??-??"))[:-self.backup_count or None]:
+            os.remove(old)
+        self.rotations += 1
+        self._open()
+
+class LogPipeline(logging.Handler):
+    """非阻塞 log 管線：產生端（任何執行緒）只把 LogRecord 放入佇列，單一寫入執行緒每 flush_interval 秒
+    一次取出所有待寫紀錄，格式化後以一次 write 寫入 log 檔與 stdout（不逐筆喚醒寫入執行緒，避免與產生端搶 GIL）。
+
+    aggregate=True 時，帶有 aggregate 屬性的逐鍵紀錄（extra={"vid_pid", "aggregate", "item"}）不逐行寫出，
+    改在同一 VID/PID 的下一筆一般紀錄（通常是該 VID/PID 的清理摘要）之前輸出一行彙總；結束或 flush() 時輸出剩餘的彙總。
+    """
+
+    def __init__(self, log_file: str, fmt: str = "text", rotate: str = "size", max_bytes: int = LOG_MAX_BYTES,
+                 backup_count: int = LOG_BACKUP_COUNT, stream=None, aggregate: bool = True, batch_size: int = LOG_BATCH_SIZE,
+                 flush_interval: float = LOG_FLUSH_INTERVAL):
+        super().__init__()
+        if fmt not in ("text", "json"):
+            raise ValueError(f"不支援的 log 格式：{fmt}")
+        self.setFormatter(JsonLineFormatter() if fmt == "json" else TextLineFormatter())
+        self.file = RotatingLogFile(log_file, rotate, max_bytes, backup_count)
+        self.stream = stream
+        self.aggregate = aggregate
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.stats = {"records": 0, "aggregated": 0, "batches": 0, "max_batch": 0, "bytes": 0}
+        self._queue = queue.SimpleQueue()
+        self._pending = {}
+        self._closed = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def handle(self, record) -> bool:
+        """佇列本身可跨執行緒使用，不需取得 handler 鎖"""
+        rv = self.filter(record)
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record) -> None:
+        """只做入列；參數與例外先轉成字串，避免寫入前物件被改動"""
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        self._queue.put(record)
+
+    def flush(self) -> None:
+        """等待目前佇列中的紀錄（含彙總）都寫出"""
+        if self._closed or not self._thread.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        self._wake.set()
+        done.wait(FLUSH_TIMEOUT_SECONDS)
+
+    def close(self) -> None:
+        """寫完佇列中所有紀錄後停止寫入執行緒並關閉檔案"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._wake.set()
+            self._thread.join(FLUSH_TIMEOUT_SECONDS)
+            self.file.close()
+        super().close()
+
+    def _run(self) -> None:
+        full = False
+        while True:
+            batch = [self._queue.get()]
+            if not full and self.flush_interval and isinstance(batch[0], logging.LogRecord):
+                # 等待一小段時間讓紀錄累積成一批；flush()/close() 會提前喚醒，不必等滿 flush_interval
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            full = len(batch) >= self.batch_size
+            if self._write(batch):
+                return
+
+    def _write(self, batch: list) -> bool:
+        lines = []
+        events = []
+        stop = False
+        for item in batch:
+            if item is None:
+                stop = True
+            elif isinstance(item, threading.Event):
+                events.append(item)
+            else:
+                self._handle(item, lines)
+        if stop or events:
+            lines.extend(self._summaries())
+        if lines:
+            text = "\n".join(lines) + "\n"
+            data = text.encode("utf-8")
+            try:
+                self.file.write(data)
+                self.file.flush()
+                if self.stream is not None:
+                    self.stream.write(text)
+                    self.stream.flush()
+            except Exception:
+                self.handleError(logging.makeLogRecord({"msg": "[Log] 寫入 log 失敗"}))
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(lines))
+            self.stats["bytes"] += len(data)
+        for event in events:
+            event.set()
+        return stop
+
+    def _handle(self, record, lines: list) -> None:
+        self.stats["records"] += 1
+        vidpid = getattr(record, "vid_pid", None)
+        label = getattr(record, "aggregate", None)
+        if self.aggregate and label and vidpid:
+            item = getattr(record, "item", "")
+            pending = self._pending.get((vidpid, label))
+            if pending is None:
+                self._pending[(vidpid, label)] = [1, item, item, record]
+            else:
+                pending[0] += 1
+                pending[2] = item
+            self.stats["aggregated"] += 1
+            return
+        if vidpid and self._pending:
+            lines.extend(self._summaries(vidpid))
+        lines.append(self._format(record))
+
+    def _summaries(self, vidpid: str = None) -> list[str]:
+        """輸出（並清除）vidpid 的彙總，vidpid 為 None 時輸出全部"""
+        lines = []
+        for key in [key for key in self._pending if vidpid is None or key[0] == vidpid]:
+            count, first, last, record = self._pending.pop(key)
+            items = first if count == 1 else f"{first} … {last}"
+            lines.append(self._format(logging.makeLogRecord({
+                **record.__dict__, "msg": f"{key[1]}：{key[0]} 共 {count} 項（{items}）", "args": None,
+                "aggregate": None, "count": count,
+            })))
+        return lines
+
+    def _format(self, record) -> str:
+        try:
+            return self.format(record)
+        except Exception:
+            self.handleError(record)
+            return str(record.msg)
+
+_installed = None
+
+def lean_log_records() -> tuple:
+    """關閉 LogRecord 建立時用不到的欄位（呼叫位置、執行緒、行程資訊；LOG_FORMAT 與 JSON 格式都不使用），
+    降低產生端每筆 log 的成本。回傳原設定供 restore_log_records 還原"""
+    previous = (logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing)
+    logging._srcfile = None
+    logging.logThreads = logging.logProcesses = logging.logMultiprocessing = False
+    return previous
+
+def restore_log_records(previous: tuple) -> None:
+    logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing = previous
+
+def install_pipeline(log_file: str, options: dict = None, stream=sys.stdout) -> LogPipeline:
+    """以 LogPipeline 取代 root logger 既有的 stdout/檔案 handler（其他 handler，例如 metrics 的行數計數，保留），
+    options 為 config.json 的 logging 區段；行程結束時自動寫完佇列"""
+    global _installed
+    options = options or {}
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, (logging.StreamHandler, LogPipeline)):
+            root.removeHandler(handler)
+            handler.close()
+    pipeline = LogPipeline(log_file,
+                           fmt=options.get("format", "text"),
+                           rotate=options.get("rotate", "size"),
+                           max_bytes=options.get("max_bytes", LOG_MAX_BYTES),
+                           backup_count=options.get("backup_count", LOG_BACKUP_COUNT),
+                           stream=stream if options.get("console", True) else None,
+                           aggregate=options.get("aggregate", True),
+                           batch_size=options.get("batch_size", LOG_BATCH_SIZE),
+                           flush_interval=options.get("flush_interval", LOG_FLUSH_INTERVAL))
+    root.addHandler(pipeline)
+    lean_log_records()
+    if _installed is None:
+        atexit.register(_close_installed)
+    _installed = pipeline
+    return pipeline
+
+def _close_installed() -> None:
+    if _installed is not None:
+        _installed.close()
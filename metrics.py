@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+from collections import Counter
+
+METRICS_JSON_FILE = "enum_guardian_metrics.json"
+METRICS_PROM_FILE = "enum_guardian.prom"
+
+_enabled = False
+_lock = threading.Lock()
+_counters = Counter()
+_spans = []
+_NULL_SPAN = contextlib.nullcontext()
+
+def enable() -> None:
+    """開啟量測並清空先前資料；未開啟時 span()/inc() 幾乎沒有額外成本"""
+    global _enabled
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+    _enabled = True
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+def is_enabled() -> bool:
+    return _enabled
+
+def inc(name: str, amount: float = 1) -> None:
+    if _enabled:
+        with _lock:
+            _counters[name] += amount
+
+class _Span:
+    __slots__ = ("phase", "labels", "start")
+
+    def __init__(self, phase: str, labels: dict):
+        self.phase = phase
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        with _lock:
+            _spans.append({"phase": self.phase, "labels": self.labels, "seconds": elapsed})
+        return False
+
+def span(phase: str, **labels):
+    """量測一段流程的耗時：with metrics.span("scan_1"): ..."""
+    if not _enabled:
+        return _NULL_SPAN
+    return _Span(phase, labels)
+
+def snapshot() -> dict:
+    with _lock:
+        return {"counters": dict(_counters), "spans": list(_spans)}
+
+class CountingRegistry:
+    """包裝註冊表後端，統計列舉/開啟/刪除等操作次數與累計耗時（<計數>_seconds，只在量測開啟時安裝）"""
+
+    _COUNTED = {
+        "OpenKey": "registry_keys_opened",
+        "CreateKey": "registry_keys_opened",
+        "CreateKeyEx": "registry_keys_opened",
+        "QueryInfoKey": "registry_keys_queried",
+        "EnumKey": "registry_keys_enumerated",
+        "DeleteKey": "registry_keys_deleted",
+        "EnumValue": "registry_values_enumerated",
+        "QueryValueEx": "registry_values_read",
+        "SetValueEx": "registry_values_written",
+        "DeleteValue": "registry_values_deleted",
+    }
+
+    def __init__(self, registry):
+        self._registry = registry
+
+    def __getattr__(self, name):
+        attr = getattr(self._registry, name)
+        counter = self._COUNTED.get(name)
+        if counter is None:
+            return attr
+
+        def counted(*args, **kwargs):
+            start = time.perf_counter()
+            result = attr(*args, **kwargs)
+            elapsed = time.perf_counter() - start
+            inc(counter)
+            inc(f"{counter}_seconds", elapsed)
+            return result
+        return counted
+
+class LogLineCounter(logging.Handler):
+    """統計寫出的 log 行數"""
+
+    def emit(self, record):
+        inc("log_lines")
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _prom_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+def write_metrics(json_file: str = METRICS_JSON_FILE, prom_file: str = METRICS_PROM_FILE) -> None:
+    """輸出 JSON 與 Prometheus textfile collector 格式（皆以暫存檔 + os.replace 寫入）
+
+    同一 phase/labels 的 span 合併加總（count 為次數）；帶 labels（例如 vidpid）的 span 只寫入 JSON，
+    .prom 僅輸出各 phase 的總耗時，避免重複的序列與每次執行不同的 label 組合
+    """
+    data = snapshot()
+    data["timestamp"] = time.time()
+
+    merged = {}
+    for item in data["spans"]:
+        key = (item["phase"], tuple(sorted(item["labels"].items())))
+        span_total = merged.setdefault(key, {"phase": item["phase"], "labels": item["labels"], "seconds": 0.0, "count": 0})
+        span_total["seconds"] += item["seconds"]
+        span_total["count"] += 1
+    data["spans"] = list(merged.values())
+
+    phase_totals = Counter()
+    for item in data["spans"]:
+        phase_totals[item["phase"]] += item["seconds"]
+
+    lines = [
+        "# HELP enum_guardian_phase_seconds Total seconds spent in each phase of the last run.",
+        "# TYPE enum_guardian_phase_seconds gauge",
+    ]
+    lines += [f'enum_guardian_phase_seconds{_prom_labels({"phase": phase})} {seconds:.6f}'
+              for phase, seconds in sorted(phase_totals.items())]
+    for name, value in sorted(data["counters"].items()):
+        lines += [f"# TYPE enum_guardian_{name} gauge", f"enum_guardian_{name} {value}"]
+    lines += [
+        "# TYPE enum_guardian_last_run_timestamp_seconds gauge",
+        f"enum_guardian_last_run_timestamp_seconds {data['timestamp']:.0f}",
+    ]
+
+    for path, content in ((json_file, json.dumps(data, indent=4, ensure_ascii=False)), (prom_file, "\n".join(lines) + "\n")):
+        if not path:
+            continue
+        try:
+            tmp_file = f"{path}.tmp"
+            with open(tmp_file, 'w', encoding='utf-8', newline="\n") as f:
+                f.write(content)
+            os.replace(tmp_file, path)
+        except Exception as e:
+            logging.error(f"[Metrics] 寫入量測檔案失敗：{path} - {e}")
@@ -1,42 +1,53 @@
-import winreg
+import heapq
 import logging
-from utils import normalize_vidpid
 from utils import get_locked_list
+from enum_index import EnumIndex
 
-def scan_all_vidpid_counts(threshold=50):
-    counts = {}
-    enum_path = r"SYSTEM\CurrentControlSet\Enum\USB"
-    locked_list = get_locked_list("lock_list.json")
+def iter_scan(threshold=50, index=None, workers=1, cache=None, locked_list=None):
+    """串流產生超過門檻且未鎖定的 ScanRecord(vidpid, instance_count, last_write)。
 
-    try:
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, enum_path) as usb_root:
-            device_count = winreg.QueryInfoKey(usb_root)[0]
-            for i in range(device_count):
-                try:
-                    subkey = winreg.EnumKey(usb_root, i)
-                    norm_key = normalize_vidpid(subkey)
+    index 尚未掃描時邊走訪邊產生（可在走訪結束前就開始處理）；已掃描過則直接讀取索引。
+    """
+    if locked_list is None:
+        locked_list = get_locked_list("lock_list.json")
+    if index is None:
+        index = EnumIndex()
+    records = index.iter_records() if index.scanned else index.scan(cache=cache, workers=workers)
+    if index.enumerators is not None and not index.scanned:
+        # 多列舉器：同一 VID/PID 分散在各根鍵，全部根鍵走訪完、合併後才判斷門檻
+        for _ in records:
+            pass
+        records = index.iter_records()
+
+    for record in records:
+        if record.vidpid in locked_list:
+            logging.info(f"[Monitor] 已鎖定 {record.vidpid}，略過統計")
+            continue
+        if record.instance_count >= threshold:
+            detail = ""
+            if index.enumerators is not None:
+                detail = "（" + "、".join(f"{name} {count}" for name, count in index.breakdown(record.vidpid).items()) + "）"
+            logging.info(f"[Monitor] 偵測到 {record.vidpid} 子鍵數量 {record.instance_count}{detail}，超過門檻 {threshold}")
+            yield record
+        else:
+            logging.debug(f"[Monitor] {record.vidpid} 子鍵數 {record.instance_count} 未達門檻 {threshold}")
 
-                    if norm_key in locked_list:
-                        logging.info(f"[Monitor] 已鎖定 {norm_key}，略過統計")
-                        continue
+def select_offenders(records, top_k=None) -> list:
+    """依實例數由多到少排列；指定 top_k 時只以大小 k 的堆積保留最嚴重的 k 筆（O(n log k)）"""
+    if top_k is not None:
+        return heapq.nlargest(top_k, records, key=lambda record: record.instance_count)
+    heap = [(-record.instance_count, i, record) for i, record in enumerate(records)]
+    heapq.heapify(heap)
+    return [heapq.heappop(heap)[2] for _ in range(len(heap))]
 
-                    try:
-                        with winreg.OpenKey(usb_root, subkey) as device_key:
-                            instance_count = winreg.QueryInfoKey(device_key)[0]
-                            if instance_count >= threshold:
-                                counts[norm_key] = instance_count
-                                logging.info(f"[Monitor] 偵測到 {norm_key} 子鍵數量 {instance_count}，超過門檻 {threshold}")
-                            else:
-                                logging.debug(f"[Monitor] {norm_key} 子鍵數 {instance_count} 未達門檻 {threshold}")
-                    except PermissionError:
-                        logging.warning(f"[Monitor] 權限不足，無法開啟裝置鍵: {subkey}")
-                    except Exception as e:
-                        logging.warning(f"[Monitor] 開啟子鍵失敗: {subkey} - {e}")
-                except OSError:
-                    continue
-    except FileNotFoundError:
-        logging.warning("[Monitor] 找不到 ENUM 註冊表路徑")
+def scan_all_vidpid_counts(threshold=50, index=None, workers=1, locked_list=None):
+    """統計超過門檻的 VID/PID 實例數；傳入已掃描的 index 時直接使用既有索引，不再走訪註冊表。
+    workers > 1 時以執行緒池平行查詢裝置鍵"""
+    counts = {}
+    try:
+        for record in iter_scan(threshold, index=index, workers=workers, locked_list=locked_list):
+            counts[record.vidpid] = counts.get(record.vidpid, 0) + record.instance_count
     except Exception as e:
         logging.error(f"[Monitor] 掃描全部裝置失敗: {e}")
 
-    return counts
\ No newline at end of file
+    return counts
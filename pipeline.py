@@ -0,0 +1,157 @@
+import time
+import queue
+import logging
+import threading
+
+PIPELINE_QUEUE_SIZE = 64
+PIPELINE_WORKERS = 4
+MAX_CONCURRENT_DELETES = 2
+
+_STOP = object()
+
+class DeleteRateLimiter:
+    """限制同時進行的 DeleteKey 數量，並可限制每秒刪除次數，避免大量刪除時佔住 PnP 管理員"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_DELETES, per_second: float = 0.0):
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def __enter__(self):
+        start = time.perf_counter()
+        self._slots.acquire()
+        if self._interval:
+            with self._lock:
+                now = time.monotonic()
+                delay = self._next - now
+                self._next = max(now, self._next) + self._interval
+            if delay > 0:
+                time.sleep(delay)
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.waited_seconds += waited
+        return self
+
+    def __exit__(self, *exc):
+        self._slots.release()
+        return False
+
+class ThrottledRegistry:
+    """包裝註冊表後端，DeleteKey 一律經過 DeleteRateLimiter（其餘呼叫直接轉交）"""
+
+    def __init__(self, registry, limiter: DeleteRateLimiter):
+        self._registry = registry
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        return getattr(self._registry, name)
+
+    def DeleteKey(self, key, sub_key):
+        with self._limiter:
+            return self._registry.DeleteKey(key, sub_key)
+
+class PipelineStats:
+    """管線統計：進出佇列筆數、佇列深度、各工作執行緒處理量與整體吞吐量"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.produced = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_queue_depth = 0
+        self.depth_total = 0
+        self.producer_blocked_seconds = 0.0
+        self.per_worker = [0] * workers
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self._lock = threading.Lock()
+
+    def as_dict(self) -> dict:
+        return {
+            "workers": self.workers,
+            "produced": self.produced,
+            "processed": self.processed,
+            "failed": self.failed,
+            "max_queue_depth": self.max_queue_depth,
+            "avg_queue_depth": round(self.depth_total / self.produced, 2) if self.produced else 0.0,
+            "producer_blocked_seconds": round(self.producer_blocked_seconds, 4),
+            "per_worker": list(self.per_worker),
+            "elapsed_seconds": round(self.elapsed, 4),
+            "throughput_per_second": round(self.processed / self.elapsed, 2) if self.elapsed else 0.0,
+        }
+
+def coalesce_records(records):
+    """把合併鍵相同的連續 ScanRecord 合併成一筆（實例數相加、last_write 取最大）。
+
+    合併鍵來自 EnumIndex.key_for：例如多列舉器模式下同一 VID/PID 在不同列舉器（USB、HID…）的裝置鍵，
+    或大小寫/分隔符不同但標準化後相同的子鍵。normalize_vidpid 會保留 &MI_xx，介面子鍵是各自獨立的一筆，不會併入主鍵。
+    下一筆合併鍵不同時才交出前一筆，確保交給清理端時該鍵連續走訪到的子鍵都已加入索引。
+    """
+    pending = None
+    for record in records:
+        if pending is not None and pending.vidpid == record.vidpid:
+            pending = pending._replace(instance_count=pending.instance_count + record.instance_count,
+                                       last_write=max(pending.last_write, record.last_write))
+            continue
+        if pending is not None:
+            yield pending
+        pending = record
+    if pending is not None:
+        yield pending
+
+def run_pipeline(records, handle, workers: int = PIPELINE_WORKERS, queue_size: int = PIPELINE_QUEUE_SIZE,
+                 on_error=None) -> PipelineStats:
+    """呼叫端執行緒一邊走訪 records 一邊放入有界佇列（佇列滿時阻塞，形成背壓），workers 個執行緒取出後呼叫 handle(record)。
+
+    handle 拋出的例外交給 on_error(record, error)；records 本身拋出例外時先停下所有工作執行緒再往外拋。
+    """
+    stats = PipelineStats(workers)
+    work = queue.Queue(maxsize=max(1, queue_size))
+
+    def worker(slot: int):
+        while True:
+            record = work.get()
+            if record is _STOP:
+                return
+            try:
+                handle(record)
+            except Exception as e:
+                with stats._lock:
+                    stats.failed += 1
+                if on_error is not None:
+                    on_error(record, e)
+                else:
+                    logging.error(f"[Pipeline] 處理 {record} 發生錯誤：{e}")
+            with stats._lock:
+                stats.processed += 1
+                stats.per_worker[slot] += 1
+
+    threads = [threading.Thread(target=worker, args=(slot,), name=f"cleanup-{slot}", daemon=True)
+               for slot in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for record in records:
+            depth = work.qsize()
+            stats.depth_total += depth
+            stats.max_queue_depth = max(stats.max_queue_depth, min(depth + 1, work.maxsize))
+            if depth >= work.maxsize:
+                start = time.perf_counter()
+                work.put(record)
+                stats.producer_blocked_seconds += time.perf_counter() - start
+            else:
+                work.put(record)
+            stats.produced += 1
+    finally:
+        for _ in threads:
+            work.put(_STOP)
+        for thread in threads:
+            thread.join()
+        stats.elapsed = time.perf_counter() - stats.started
+
+    logging.info(f"[Pipeline] 共處理 {stats.processed}/{stats.produced} 項（失敗 {stats.failed}），"
+                 f"最大佇列深度 {stats.max_queue_depth}，耗時 {stats.elapsed:.2f}s")
+    return stats
@@ -0,0 +1,228 @@
+import os
+import json
+import time
+import logging
+import platform
+from datetime import datetime
+
+PLAN_FILE = "cleanup_plan.json"
+PLAN_VERSION = 1
+PLAN_SAMPLE_INSTANCES = 20
+
+# 沒有量測紀錄時使用的每次操作耗時（秒）
+DEFAULT_LATENCIES = {
+    "registry_keys_opened": 0.0002,
+    "registry_keys_queried": 0.00005,
+    "registry_keys_enumerated": 0.00005,
+    "registry_keys_deleted": 0.001,
+    "registry_values_written": 0.0005,
+    "registry_values_deleted": 0.0005,
+}
+
+def recorded_latencies(*counter_sets) -> tuple[dict, dict]:
+    """由 metrics 計數（<counter> 與 <counter>_seconds）算出每次操作的平均耗時；
+    依序採用第一個有紀錄的來源，都沒有時用 DEFAULT_LATENCIES。回傳 (耗時, 來源)"""
+    latencies = {}
+    sources = {}
+    for name, default in DEFAULT_LATENCIES.items():
+        latencies[name] = default
+        sources[name] = "default"
+        for source, counters in counter_sets:
+            count = counters.get(name, 0)
+            seconds = counters.get(f"{name}_seconds")
+            if count and seconds is not None:
+                latencies[name] = seconds / count
+                sources[name] = source
+                break
+    return latencies, sources
+
+def load_metrics_counters(metrics_file: str) -> dict:
+    """讀取上次執行輸出的 metrics JSON 計數，沒有檔案時回傳空 dict"""
+    try:
+        with open(metrics_file, 'r', encoding='utf-8') as f:
+            return json.load(f).get("counters", {})
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def sample_keys_per_instance(index, vidpids: list[str], samples: int = PLAN_SAMPLE_INSTANCES) -> float:
+    """唯讀走訪最多 samples 個實例子樹（平均分散在各 VID/PID），估計每個實例含多少個鍵（含自己）"""
+    from registry_backend import get_registry
+
+    registry = get_registry()
+    walked = 0
+    keys = 0
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, index.enum_path) as root:
+        for vidpid in vidpids[:samples]:
+            paths = index.instance_paths(root, vidpid)
+            for path in paths[:max(1, samples // max(1, len(vidpids)))]:
+                stack = [path]
+                while stack:
+                    current = stack.pop()
+                    try:
+                        with registry.OpenKey(root, current) as key:
+                            stack.extend(f"{current}\\{registry.EnumKey(key, i)}" for i in range(registry.QueryInfoKey(key)[0]))
+                    except OSError:
+                        continue
+                    keys += 1
+                walked += 1
+    return keys / walked if walked else 1.0
+
+def estimate_plan(plan: dict, keys_per_instance: float, latencies: dict) -> float:
+    """依計畫的動作數估計執行秒數：每個要刪除的鍵需開啟、查詢子鍵數、被父鍵列舉一次再刪除；
+    每個裝置鍵需列舉一次實例名稱；UsbFlags 與 ComDB 各為一次值寫入"""
+    instances = sum(entry["instances"] for entry in plan["cleanup"])
+    device_keys = sum(len(entry["subkeys"]) for entry in plan["cleanup"])
+    keys = instances * keys_per_instance
+    per_key = (latencies["registry_keys_opened"] + latencies["registry_keys_queried"]
+               + latencies["registry_keys_enumerated"] + latencies["registry_keys_deleted"])
+    seconds = keys * per_key
+    seconds += device_keys * (latencies["registry_keys_opened"] + latencies["registry_keys_queried"])
+    seconds += (len(plan["usb_flags"]["add"]) + (plan["comdb"]["action"] != "skip")) * latencies["registry_values_written"]
+    seconds += len(plan["usb_flags"]["remove"]) * latencies["registry_values_deleted"]
+    return seconds
+
+def build_plan(index, offenders, threshold: int, locked_list, monitored=(), ignore_values=(),
+               remove_stale: bool = False, comdb_due: bool = False, comdb_preview: dict = None, policies: dict = None) -> dict:
+    """由一次掃描的結果產生完整動作清單（不寫入註冊表）：要刪除的 Enum 子樹（含各裝置鍵的實例數與 LastWriteTime，
+    套用時用來判斷是否已變動）、UsbFlags 新增/移除、監控清單與 Lock List 新增，以及 ComDB 動作（comdb_due 只在產生計畫時判斷一次）。
+    monitored 為目前的監控 VID/PID，清理項目中不在其中的會列入 monitored_add（與 run_once 自動加入監控清單相同）。
+    comdb_preview 為 clean_comdb(dry_run=True) 的結果（清理前即可釋放的埠；清理刪除的實例所佔的埠套用時才會一併釋放）。
+    policies 為 {vidpid: PrunePolicy}，有設定的項目記下 prune，套用時只刪除舊實例（預估耗時仍以全部實例計算，為上限）"""
+    from utils import normalize_vidpid
+    from usb_flags_manager import IGNORE_PREFIX
+
+    policies = policies or {}
+    cleanup = []
+    seen = set()
+    locked_skipped = []
+    for record in offenders:
+        vidpid = normalize_vidpid(record.vidpid)
+        if vidpid in seen:
+            continue
+        seen.add(vidpid)
+        if vidpid in locked_list:
+            locked_skipped.append(vidpid)
+            continue
+        item = {
+            "vid_pid": vidpid,
+            "instances": index.instance_count(vidpid),
+            "subkeys": {entry.subkey: {"instances": entry.instance_count, "last_write": entry.last_write}
+                        for entry in index.devices.get(vidpid, {}).values()},
+        }
+        if policies.get(vidpid) is not None:
+            item["prune"] = policies[vidpid]._asdict()
+        cleanup.append(item)
+
+    existing = {name.upper() for name in ignore_values}
+    monitored = [normalize_vidpid(vidpid) for vidpid in monitored]
+    monitored_set = set(monitored)
+    wanted = [entry["vid_pid"] for entry in cleanup] + monitored
+    wanted = list(dict.fromkeys(vidpid for vidpid in wanted if len(vidpid) == 8))
+    wanted_names = {f"{IGNORE_PREFIX}{vidpid}".upper() for vidpid in wanted}
+    return {
+        "version": PLAN_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "threshold": threshold,
+        "enum_path": index.enum_path,
+        "enumerators": list(index.enumerators) if index.enumerators else None,
+        "root_last_write": index.root_last_write,
+        "cleanup": cleanup,
+        "usb_flags": {
+            "add": [vidpid for vidpid in wanted if f"{IGNORE_PREFIX}{vidpid}".upper() not in existing],
+            "remove": sorted(name for name in ignore_values if remove_stale and name.upper() not in wanted_names),
+        },
+        "monitored_add": [entry["vid_pid"] for entry in cleanup
+                          if len(entry["vid_pid"]) == 8 and entry["vid_pid"] not in monitored_set],
+        "lock_list_add": [entry["vid_pid"] for entry in cleanup],
+        "locked_skipped": locked_skipped,
+        "comdb": {
+            "action": "reconcile" if comdb_due else "skip",
+            "size_ports": comdb_preview["size_ports"] if comdb_preview else None,
+            "reserved": comdb_preview["reserved"] if comdb_preview else None,
+            "stale_ports": comdb_preview["freed"] if comdb_preview else [],
+        },
+    }
+
+def write_plan(plan: dict, plan_file: str = PLAN_FILE) -> None:
+    tmp_file = f"{plan_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(plan, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_file, plan_file)
+
+def load_plan(plan_file: str = PLAN_FILE) -> dict:
+    with open(plan_file, 'r', encoding='utf-8') as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"不支援的計畫檔版本：{plan.get('version')}")
+    return plan
+
+def check_plan(plan: dict, index, locked_list) -> tuple[list[dict], list[dict]]:
+    """比對計畫與目前註冊表（index 只需索引計畫內的 VID/PID），回傳 (仍可執行的項目, 已變動而略過的項目與原因)。
+    裝置鍵的 LastWriteTime 在新增/移除實例時會改變，因此任一裝置鍵的時間戳或實例數不同即視為已變動"""
+    ready = []
+    skipped = []
+    for entry in plan["cleanup"]:
+        vidpid = entry["vid_pid"]
+        current = {e.subkey: e for e in index.devices.get(vidpid, {}).values()}
+        reason = None
+        if vidpid in locked_list:
+            reason = "已在 Lock List"
+        elif set(current) != set(entry["subkeys"]):
+            reason = f"裝置鍵不同（計畫 {len(entry['subkeys'])} 個，目前 {len(current)} 個）"
+        else:
+            for subkey, planned in entry["subkeys"].items():
+                if (current[subkey].instance_count, current[subkey].last_write) != (planned["instances"], planned["last_write"]):
+                    reason = f"{subkey} 已變動（實例 {planned['instances']} → {current[subkey].instance_count}）"
+                    break
+        if reason is None:
+            ready.append(entry)
+        else:
+            skipped.append({"vid_pid": vidpid, "reason": reason})
+    return ready, skipped
+
+def summarize_plan(plan: dict) -> str:
+    estimate = plan.get("estimate", {})
+    return (f"清理 {len(plan['cleanup'])} 個 VID/PID（{sum(entry['instances'] for entry in plan['cleanup'])} 個實例），"
+            f"UsbFlags 新增 {len(plan['usb_flags']['add'])}、移除 {len(plan['usb_flags']['remove'])}，"
+            f"監控清單新增 {len(plan.get('monitored_add', []))}，"
+            f"Lock List 新增 {len(plan['lock_list_add'])}，ComDB {plan['comdb']['action']}，"
+            f"預估耗時 {estimate.get('seconds', 0):.1f}s")
+
+def apply_plan(plan: dict, index, locked_list, journal=None, snapshot_writer=None) -> dict:
+    """執行已審閱的計畫（不重新掃描）：UsbFlags 依計畫全部寫入（與 run_once 相同，在刪除前寫入），
+    已變動的項目略過刪除，其餘依計畫刪除並加入 Lock List。監控清單與 ComDB 動作由呼叫端處理。
+    回傳 {cleaned, skipped, failed, seconds}"""
+    from cleaner import clean_enum_for_vidpid
+    from config_model import PrunePolicy
+    from usb_flags_manager import reconcile_ignore_keys, remove_ignore_key_from_registry, IGNORE_PREFIX
+
+    start = time.perf_counter()
+    ready, skipped = check_plan(plan, index, locked_list)
+    for item in skipped:
+        logging.warning(f"[Plan] {item['vid_pid']} 自計畫產生後已變動，略過：{item['reason']}")
+
+    if journal is not None:
+        journal.add_offenders([(entry["vid_pid"], entry["instances"]) for entry in ready])
+    reconcile_ignore_keys(plan["usb_flags"]["add"])
+    for name in plan["usb_flags"]["remove"]:
+        remove_ignore_key_from_registry(name[len(IGNORE_PREFIX):])
+
+    cleaned = []
+    failed = []
+    for entry in ready:
+        vidpid = entry["vid_pid"]
+        try:
+            if snapshot_writer is not None:
+                snapshot_writer.write_vidpid(index, vidpid)
+            policy = PrunePolicy(**entry["prune"]) if entry.get("prune") else None
+            clean_enum_for_vidpid(vidpid, index=index, journal=journal, policy=policy)
+            cleaned.append(vidpid)
+        except Exception as e:
+            logging.error(f"[Plan] 清理 {vidpid} 發生錯誤：{e}")
+            failed.append({"vid_pid": vidpid, "count": entry["instances"], "error": str(e)})
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"[Plan] 計畫執行完成：清理 {len(cleaned)} 個，略過 {len(skipped)} 個，失敗 {len(failed)} 個，"
+                 f"耗時 {elapsed:.2f}s（預估 {plan.get('estimate', {}).get('seconds', 0):.2f}s）")
+    return {"cleaned": cleaned, "skipped": skipped, "failed": failed, "seconds": elapsed}
@@ -0,0 +1,184 @@
+import os
+import re
+import sys
+import json
+import mmap
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from utils import normalize_vidpid, get_locked_list
+from enum_index import EnumIndex
+from monitor import iter_scan, select_offenders, scan_all_vidpid_counts
+from usb_flags_manager import IGNORE_PREFIX
+from config_model import load_config, ConfigError
+
+CHUNK_BYTES = 16 * 1024 * 1024
+ANALYSIS_WORKERS = os.cpu_count() or 1
+
+_KEY_PATTERN = re.compile(r"^HKEY_LOCAL_MACHINE\\SYSTEM\\(?:CurrentControlSet|ControlSet\d{3})\\"
+                          r"(Enum\\USB|Control\\UsbFlags)(?:\\(.*))?$", re.IGNORECASE)
+_VALUE_PATTERN = re.compile(r'^"(' + IGNORE_PREFIX + r'[^"]*)"=', re.IGNORECASE)
+
+def detect_encoding(data) -> tuple[str, int]:
+    """依 BOM 判斷 .reg 編碼（regedit/reg export 為 UTF-16LE），回傳 (編碼, BOM 長度)"""
+    if data[:2] == b"\xff\xfe":
+        return "utf-16-le", 2
+    if data[:3] == b"\xef\xbb\xbf":
+        return "utf-8", 3
+    return "utf-8", 0
+
+def split_chunks(data, encoding: str, start: int, chunk_bytes: int = CHUNK_BYTES) -> list[tuple[int, int]]:
+    """把 [start, len(data)) 依鍵邊界（換行後的 '['）切成約 chunk_bytes 大小的區段，不會把一個鍵切成兩半"""
+    marker = "\n[".encode(encoding)
+    width = 2 if encoding.startswith("utf-16") else 1
+    chunks = []
+    size = len(data)
+    while start < size:
+        end = start + chunk_bytes
+        while end < size:
+            found = data.find(marker, end)
+            if found < 0:
+                end = size
+            elif (found - start) % width:
+                end = found + 1
+                continue
+            else:
+                end = found + width
+            break
+        end = min(end, size)
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+def parse_chunk(reg_file: str, encoding: str, start: int, end: int) -> dict:
+    """在子行程中解析一個區段：統計每個 Enum\\USB 裝置鍵的實例數，並收集 UsbFlags 的 IgnoreHWSerNum 值名稱"""
+    devices = {}
+    ignore_values = []
+    keys = 0
+    with open(reg_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode(encoding, errors="replace")
+    in_usb_flags = False
+    for line in text.splitlines():
+        if line.startswith("["):
+            keys += 1
+            in_usb_flags = False
+            match = _KEY_PATTERN.match(line[1:line.rfind("]")])
+            if match is None:
+                continue
+            if match.group(1).lower() == "control\\usbflags":
+                in_usb_flags = match.group(2) is None
+                continue
+            parts = (match.group(2) or "").split("\\")
+            if len(parts) == 1 and parts[0]:
+                devices.setdefault(parts[0], 0)
+            elif len(parts) == 2:
+                devices[parts[0]] = devices.get(parts[0], 0) + 1
+        elif in_usb_flags:
+            match = _VALUE_PATTERN.match(line)
+            if match:
+                ignore_values.append(match.group(1))
+    return {"devices": devices, "ignore_values": ignore_values, "keys": keys, "bytes": end - start}
+
+def analyse_exports(reg_files: list[str], workers: int = ANALYSIS_WORKERS, chunk_bytes: int = CHUNK_BYTES) -> dict:
+    """以行程池平行解析一或多個 .reg 匯出檔（mmap 讀取、依鍵邊界分段），記憶體用量只與分段大小與裝置數有關"""
+    start_time = time.perf_counter()
+    tasks = []
+    for reg_file in reg_files:
+        with open(reg_file, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                continue
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                encoding, bom = detect_encoding(data)
+                tasks += [(reg_file, encoding, start, end) for start, end in split_chunks(data, encoding, bom, chunk_bytes)]
+
+    devices = {}
+    ignore_values = set()
+    keys = 0
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        for result in pool.map(parse_chunk, *zip(*tasks)) if tasks else []:
+            for subkey, count in result["devices"].items():
+                devices[subkey] = devices.get(subkey, 0) + count
+            ignore_values.update(result["ignore_values"])
+            keys += result["keys"]
+            total_bytes += result["bytes"]
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"[Analyzer] 解析 {len(reg_files)} 個檔案（{len(tasks)} 個區段），{total_bytes / 1048576:.1f} MB、{keys} 個鍵，"
+                 f"耗時 {elapsed:.2f}s（{total_bytes / 1048576 / elapsed if elapsed else 0:.1f} MB/s）")
+    return {
+        "devices": devices,
+        "ignore_values": ignore_values,
+        "stats": {"files": len(reg_files), "chunks": len(tasks), "bytes": total_bytes, "keys": keys,
+                  "seconds": round(elapsed, 3),
+                  "mb_per_second": round(total_bytes / 1048576 / elapsed, 2) if elapsed else 0.0,
+                  "keys_per_second": round(keys / elapsed, 1) if elapsed else 0.0},
+    }
+
+def build_index(devices: dict) -> EnumIndex:
+    """以解析結果建立 EnumIndex（依登錄檔排序方式排列子鍵），讓掃描與門檻邏輯與線上執行完全相同"""
+    index = EnumIndex()
+    for subkey in sorted(devices, key=str.lower):
+        index.add(normalize_vidpid(subkey), subkey, devices[subkey], 0)
+    index.scanned = True
+    return index
+
+def build_cleanup_plan(index: EnumIndex, ignore_values, threshold: int, locked_list, monitored=()) -> dict:
+    """依 enum_auto_run 的流程產生清理計畫：超標且未鎖定的 VID/PID 依實例數排序、需新增的 UsbFlags 值與被鎖定略過的項目。
+    monitored 為正規化後的監控 VID/PID（AppConfig.devices 的鍵，與 enum_auto_run 寫入 UsbFlags 的來源相同）"""
+    offenders = select_offenders(iter_scan(threshold, index=index, locked_list=locked_list))
+    existing = {name.lower() for name in ignore_values}
+    plan_vidpids = []
+    for record in offenders:
+        if record.vidpid not in plan_vidpids:
+            plan_vidpids.append(record.vidpid)
+    wanted = plan_vidpids + list(monitored)
+    return {
+        "threshold": threshold,
+        "cleanup": [{"vid_pid": vidpid, "instances": index.instance_count(vidpid), "subkeys": index.subkeys(vidpid)}
+                    for vidpid in plan_vidpids],
+        "usb_flags_add": sorted({f"{IGNORE_PREFIX}{vidpid}" for vidpid in wanted
+                                 if len(vidpid) == 8 and f"{IGNORE_PREFIX}{vidpid}".lower() not in existing}),
+        "locked_skipped": sorted(vidpid for vidpid, count in index.iter_counts()
+                                 if vidpid in locked_list and count >= threshold),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="離線分析 reg export 匯出檔，產生與線上相同的實例統計與清理計畫")
+    parser.add_argument("reg_files", nargs="+", help="Enum_USB_*.reg / UsbFlags_*.reg 等匯出檔")
+    parser.add_argument("--config", default="config.json", help="讀取 threshold 與 monitored_devices 的設定檔")
+    parser.add_argument("--threshold", type=int, help="覆寫設定檔的 threshold")
+    parser.add_argument("--lock-list", default="lock_list.json", help="Lock List 檔案")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS, help="解析行程數")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / 1048576, help="每個區段大小（MB）")
+    parser.add_argument("--output", help="結果輸出 JSON 檔")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
+
+    try:
+        app_config = load_config(args.config)
+    except ConfigError as e:
+        logging.error(f"[Analyzer] {e}")
+        return 1
+    threshold = args.threshold if args.threshold is not None else app_config.threshold
+    locked_list = get_locked_list(args.lock_list)
+
+    result = analyse_exports(args.reg_files, args.workers, int(args.chunk_mb * 1048576))
+    index = build_index(result["devices"])
+    report = {
+        "stats": result["stats"],
+        "counts": scan_all_vidpid_counts(threshold, index=index, locked_list=locked_list),
+        "plan": build_cleanup_plan(index, result["ignore_values"], threshold, locked_list, list(app_config.devices)),
+    }
+    logging.info(f"[Analyzer] 超過門檻 {threshold} 的 VID/PID：{len(report['counts'])} 個，"
+                 f"計畫清理 {len(report['plan']['cleanup'])} 個，UsbFlags 需新增 {len(report['plan']['usb_flags_add'])} 個")
+    text = json.dumps(report, indent=4, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,270 @@
+import threading
+import time
+import logging
+from collections import Counter
+
+try:
+    import winreg
+except ImportError:
+    winreg = None
+
+_active_registry = None
+
+def get_registry():
+    """取得目前使用的註冊表後端（預設為 winreg，非 Windows 需先以 set_registry 指定）"""
+    if _active_registry is not None:
+        return _active_registry
+    if winreg is None:
+        raise RuntimeError("[Registry] 此平台沒有 winreg，請先以 set_registry() 指定註冊表後端")
+    return winreg
+
+def set_registry(registry):
+    """切換註冊表後端，回傳先前的後端；傳入 None 則還原為 winreg"""
+    global _active_registry
+    previous = _active_registry
+    _active_registry = registry
+    logging.debug(f"[Registry] 切換註冊表後端：{type(registry).__name__}")
+    return previous
+
+def _split_path(path: str) -> list[str]:
+    return [part for part in path.split("\\") if part]
+
+def _filetime_now() -> int:
+    """目前時間轉為 Windows FILETIME（1601 起算的 100ns 單位），與 QueryInfoKey 相同"""
+    return int(time.time() * 10_000_000) + 116444736000000000
+
+
+class _Node:
+    __slots__ = ("name", "children", "values", "last_write", "deleted", "_names", "_value_list")
+
+    def __init__(self, name: str, last_write: int):
+        self.name = name
+        self.children = {}
+        self.values = {}
+        self.last_write = last_write
+        self.deleted = False
+        self._names = None
+        self._value_list = None
+
+    def child_names(self) -> list[str]:
+        if self._names is None:
+            self._names = [child.name for child in self.children.values()]
+        return self._names
+
+    def value_list(self) -> list:
+        if self._value_list is None:
+            self._value_list = list(self.values.values())
+        return self._value_list
+
+
+class _Handle:
+    __slots__ = ("node", "path")
+
+    def __init__(self, node: _Node, path: str):
+        self.node = node
+        self.path = path
+
+    def Close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class MemoryRegistry:
+    """記憶體內的 winreg 替身，實作本專案用到的 winreg 子集合，供 Linux 上測試與效能量測"""
+
+    KEY_READ = 0x20019
+    KEY_WRITE = 0x20006
+    KEY_SET_VALUE = 0x0002
+    KEY_ALL_ACCESS = 0xF003F
+    REG_SZ = 1
+    REG_BINARY = 3
+    REG_DWORD = 4
+
+    def __init__(self, clock=None, latency: float = 0.0):
+        """clock 回傳 FILETIME 整數（可注入假時鐘）；latency 為每次 API 呼叫注入的延遲秒數"""
+        self.clock = clock or _filetime_now
+        self.latency = latency
+        self.ops = Counter()
+        self.faults = []
+        self._lock = threading.RLock()
+        self._root = _Node("", self.clock())
+        self.HKEY_LOCAL_MACHINE = _Handle(self._root, "HKLM")
+
+    # ---- 建立測試資料用的輔助方法 ----
+
+    def add_key(self, path: str, values: dict = None, last_write: int = None) -> None:
+        """建立 path（含中間層），可一併寫入值 {name: (data, type)} 並指定 LastWriteTime"""
+        with self._lock:
+            node = self._root
+            for part in _split_path(path):
+                node = self._create_child(node, part)
+            for name, (data, value_type) in (values or {}).items():
+                node.values[name.lower()] = (name, data, value_type)
+            node._value_list = None
+            if last_write is not None:
+                node.last_write = last_write
+
+    def inject_fault(self, op: str, path: str, error: OSError, times: int = 1) -> None:
+        """讓之後 times 次（None 為不限次數）路徑含 path 的 op 呼叫拋出 error，模擬權限不足或鍵被占用"""
+        with self._lock:
+            self.faults.append([op, path.lower(), error, times])
+
+    def set_last_write(self, path: str, last_write: int) -> None:
+        self._find(self._root, path).last_write = last_write
+
+    def exists(self, path: str) -> bool:
+        try:
+            self._find(self._root, path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def count_keys(self, path: str = "") -> int:
+        """計算 path 底下（含自身）的鍵總數"""
+        stack = [self._find(self._root, path)]
+        total = 0
+        while stack:
+            node = stack.pop()
+            total += 1
+            stack.extend(node.children.values())
+        return total
+
+    # ---- 內部 ----
+
+    def _create_child(self, node: _Node, name: str) -> _Node:
+        child = node.children.get(name.lower())
+        if child is None:
+            child = _Node(name, self.clock())
+            node.children[name.lower()] = child
+            node._names = None
+            node.last_write = child.last_write
+        return child
+
+    def _find(self, node: _Node, path: str) -> _Node:
+        if node.deleted:
+            raise OSError("[WinError 1018] 已標示為刪除的登錄機碼無法進行非法作業")
+        for part in _split_path(path):
+            node = node.children.get(part.lower())
+            if node is None:
+                raise FileNotFoundError(f"[WinError 2] 系統找不到指定的檔案。: {path}")
+        return node
+
+    def _delay(self, op: str = None, path: str = "") -> None:
+        if self.latency:
+            time.sleep(self.latency)
+        if not self.faults or op is None:
+            return
+        with self._lock:
+            for fault in self.faults:
+                fault_op, fault_path, error, times = fault
+                if fault_op == op and fault_path in path.lower():
+                    if times is not None:
+                        fault[3] -= 1
+                        if fault[3] <= 0:
+                            self.faults.remove(fault)
+                    raise error
+
+    def _touch(self, node: _Node) -> None:
+        node.last_write = self.clock()
+        node._value_list = None
+
+    # ---- winreg 相容 API ----
+
+    def OpenKey(self, key, sub_key, reserved=0, access=KEY_READ):
+        self.ops["OpenKey"] += 1
+        self._delay("OpenKey", f"{key.path}\\{sub_key}")
+        with self._lock:
+            node = self._find(key.node, sub_key)
+        return _Handle(node, f"{key.path}\\{sub_key}" if sub_key else key.path)
+
+    OpenKeyEx = OpenKey
+
+    def CreateKey(self, key, sub_key):
+        self.ops["CreateKey"] += 1
+        self._delay()
+        with self._lock:
+            node = self._find(key.node, "")
+            for part in _split_path(sub_key):
+                node = self._create_child(node, part)
+        return _Handle(node, f"{key.path}\\{sub_key}")
+
+    def CreateKeyEx(self, key, sub_key, reserved=0, access=KEY_WRITE):
+        return self.CreateKey(key, sub_key)
+
+    def CloseKey(self, key):
+        pass
+
+    def EnumKey(self, key, index):
+        self.ops["EnumKey"] += 1
+        self._delay()
+        with self._lock:
+            names = self._find(key.node, "").child_names()
+            if index >= len(names):
+                raise OSError("[WinError 259] 沒有更多資料。")
+            return names[index]
+
+    def EnumValue(self, key, index):
+        self.ops["EnumValue"] += 1
+        self._delay()
+        with self._lock:
+            values = self._find(key.node, "").value_list()
+            if index >= len(values):
+                raise OSError("[WinError 259] 沒有更多資料。")
+            return values[index]
+
+    def QueryInfoKey(self, key):
+        self.ops["QueryInfoKey"] += 1
+        self._delay("QueryInfoKey", key.path)
+        with self._lock:
+            node = self._find(key.node, "")
+            return len(node.children), len(node.values), node.last_write
+
+    def QueryValueEx(self, key, value_name):
+        self.ops["QueryValueEx"] += 1
+        self._delay()
+        with self._lock:
+            entry = self._find(key.node, "").values.get(value_name.lower())
+        if entry is None:
+            raise FileNotFoundError(f"[WinError 2] 系統找不到指定的檔案。: {value_name}")
+        return entry[1], entry[2]
+
+    def SetValueEx(self, key, value_name, reserved, value_type, value):
+        self.ops["SetValueEx"] += 1
+        self._delay("SetValueEx", f"{key.path}\\{value_name}")
+        with self._lock:
+            node = self._find(key.node, "")
+            node.values[value_name.lower()] = (value_name, value, value_type)
+            self._touch(node)
+
+    def DeleteValue(self, key, value_name):
+        self.ops["DeleteValue"] += 1
+        self._delay("DeleteValue", f"{key.path}\\{value_name}")
+        with self._lock:
+            node = self._find(key.node, "")
+            if node.values.pop(value_name.lower(), None) is None:
+                raise FileNotFoundError(f"[WinError 2] 系統找不到指定的檔案。: {value_name}")
+            self._touch(node)
+
+    def DeleteKey(self, key, sub_key):
+        """與 winreg.DeleteKey 相同：只能刪除沒有子鍵的鍵，否則拋出 PermissionError"""
+        self.ops["DeleteKey"] += 1
+        self._delay("DeleteKey", f"{key.path}\\{sub_key}")
+        with self._lock:
+            parts = _split_path(sub_key)
+            if not parts:
+                raise PermissionError("[WinError 5] 存取被拒。")
+            parent = self._find(key.node, "\\".join(parts[:-1]))
+            node = parent.children.get(parts[-1].lower())
+            if node is None:
+                raise FileNotFoundError(f"[WinError 2] 系統找不到指定的檔案。: {sub_key}")
+            if node.children:
+                raise PermissionError(f"[WinError 5] 存取被拒。: {sub_key}")
+            node.deleted = True
+            del parent.children[parts[-1].lower()]
+            parent._names = None
+            self._touch(parent)
@@ -0,0 +1,113 @@
+import random
+from registry_backend import MemoryRegistry
+
+ENUM_ROOT = "SYSTEM\\CurrentControlSet\\Enum"
+ENUM_USB = "SYSTEM\\CurrentControlSet\\Enum\\USB"
+USB_FLAGS = "SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
+COM_NAME_ARBITER = "SYSTEM\\CurrentControlSet\\Control\\COM Name Arbiter"
+INSTANCE_CHILDREN = ("Device Parameters", "Properties\\{a8b865dd-2e3d-4094-ad97-e593a70c75d6}\\0002")
+
+def device_subkey(n: int) -> str:
+    """第 n 個合成裝置的 Enum\\USB 子鍵名稱"""
+    return f"VID_{(n >> 16) & 0xFFFF:04X}&PID_{n & 0xFFFF:04X}"
+
+def build_device(registry: MemoryRegistry, subkey: str, instances: int, root: str = ENUM_USB) -> None:
+    """在 root\\subkey 底下建立 instances 個裝置實例（每個實例含常見的子鍵結構）"""
+    for i in range(instances):
+        base = f"{root}\\{subkey}\\{i:08X}"
+        registry.add_key(base, {"DeviceDesc": ("USB Serial Device", registry.REG_SZ)})
+        for child in INSTANCE_CHILDREN:
+            registry.add_key(f"{base}\\{child}")
+
+def instance_distribution(vidpids: int, max_instances: int, distribution: str, rng: random.Random) -> list[int]:
+    """uniform：1..max 均勻分布；skewed：Pareto 長尾，多數裝置只有少量實例、少數裝置極度膨脹"""
+    if distribution == "uniform":
+        return [rng.randint(1, max_instances) for _ in range(vidpids)]
+    if distribution == "skewed":
+        return [min(max_instances, int(rng.paretovariate(1.1))) for _ in range(vidpids)]
+    raise ValueError(f"不支援的分布：{distribution}")
+
+def generate_fixture(vidpids: int = 1000, max_instances: int = 500, distribution: str = "skewed",
+                     locked_ratio: float = 0.05, ignore_ratio: float = 0.1, comdb_bytes: int = 128,
+                     serial_ratio: float = 0.0, seed: int = 0, registry: MemoryRegistry = None) -> dict:
+    """產生合成的 Enum\\USB、UsbFlags 與 COM Name Arbiter 樹，回傳註冊表與各項清單。
+    serial_ratio > 0 時挑選該比例的裝置當作序列埠，每個實例的 Device Parameters 寫入 PortName 並在 ComDB 保留該編號"""
+    rng = random.Random(seed)
+    registry = registry or MemoryRegistry()
+    counts = instance_distribution(vidpids, max_instances, distribution, rng)
+
+    subkeys = []
+    for n, instances in enumerate(counts):
+        subkey = device_subkey(n)
+        build_device(registry, subkey, instances)
+        subkeys.append(subkey)
+
+    normalized = [subkey.replace("VID_", "").replace("&PID_", "") for subkey in subkeys]
+    locked = rng.sample(normalized, int(vidpids * locked_ratio))
+    ignored = rng.sample(normalized, int(vidpids * ignore_ratio))
+    registry.add_key(USB_FLAGS, {f"IgnoreHWSerNum{vidpid}": (b'\x01', registry.REG_BINARY) for vidpid in ignored})
+    comdb = bytearray(rng.randbytes(comdb_bytes))
+
+    com_ports = {}
+    if serial_ratio > 0:
+        port = 3
+        for n in sorted(rng.sample(range(vidpids), int(vidpids * serial_ratio))):
+            for i in range(counts[n]):
+                if port > comdb_bytes * 8:
+                    break
+                registry.add_key(f"{ENUM_USB}\\{subkeys[n]}\\{i:08X}\\Device Parameters", {"PortName": (f"COM{port}", registry.REG_SZ)})
+                comdb[(port - 1) // 8] |= 1 << ((port - 1) % 8)
+                com_ports[f"{subkeys[n]}\\{i:08X}"] = port
+                port += 1
+    registry.add_key(COM_NAME_ARBITER, {"ComDB": (bytes(comdb), registry.REG_BINARY)})
+
+    return {
+        "registry": registry,
+        "subkeys": subkeys,
+        "counts": dict(zip(normalized, counts)),
+        "locked": locked,
+        "ignored": ignored,
+        "com_ports": com_ports,
+        "total_instances": sum(counts),
+    }
+
+def generate_multi_root_fixture(vidpids: int = 300, max_instances: int = 60, seed: int = 0,
+                                registry: MemoryRegistry = None) -> dict:
+    """產生 USB、HID、FTDIBUS、USBSTOR、USBPRINT 多個列舉器根鍵的合成樹（各自的硬體 ID 命名方式），
+    回傳註冊表、合併後的預期實例數（鍵同 enum_index.device_key）與各根鍵的裝置鍵數"""
+    rng = random.Random(seed)
+    registry = registry or MemoryRegistry()
+    counts = {}
+    device_keys = {}
+
+    def add(enumerator: str, name: str, key: str, instances: int) -> None:
+        build_device(registry, name, instances, root=f"{ENUM_ROOT}\\{enumerator}")
+        counts[key] = counts.get(key, 0) + instances
+        device_keys[enumerator] = device_keys.get(enumerator, 0) + 1
+
+    for n in range(vidpids):
+        vid, pid = (n >> 16) & 0xFFFF, n & 0xFFFF
+        key = f"{vid:04X}{pid:04X}"
+        add("USB", device_subkey(n), key, rng.randint(1, max_instances))
+        if rng.random() < 0.3:
+            add("HID", f"{device_subkey(n)}&MI_00", key, rng.randint(1, max_instances))
+            if rng.random() < 0.5:
+                add("HID", f"{device_subkey(n)}&MI_01&Col02", key, rng.randint(1, max_instances))
+        if rng.random() < 0.05:
+            add("HID", f"{{00001124-0000-1000-8000-00805f9b34fb}}_VID&0002{vid:04x}_PID&{pid:04x}", key, rng.randint(1, 5))
+        if rng.random() < 0.2:
+            # FTDI：每個序號一個裝置鍵，底下只有一個實例
+            for _ in range(rng.randint(1, max_instances)):
+                add("FTDIBUS", f"VID_{vid:04X}+PID_{pid:04X}+{rng.getrandbits(32):08X}A", key, 1)
+        if rng.random() < 0.2:
+            add("USBSTOR", f"Disk&Ven_Vendor{n}&Prod_Flash_Disk&Rev_1.0{n % 10}", f"USBSTOR\\DISK&VEN_VENDOR{n}&PROD_FLASH_DISK",
+                rng.randint(1, max_instances))
+        if rng.random() < 0.05:
+            add("USBPRINT", f"PrinterModel{n}", f"USBPRINT\\PRINTERMODEL{n}", rng.randint(1, 5))
+
+    return {
+        "registry": registry,
+        "counts": counts,
+        "device_keys": device_keys,
+        "total_instances": sum(counts.values()),
+    }
@@ -13,69 +13,131 @@ WEEKDAYS_MAP = {
 
 TIME_TOLERANCE_SECONDS = 300
 
-def should_run_today(scan_strategy):
-    """檢查今日是否為排程允許執行的星期幾"""
-    logging.debug(f"[Scheduler] 執行週期策略檢查: {scan_strategy}")
+MONTH_NAMES = {name: i for i, name in enumerate(
+    ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"], start=1)}
+CRON_DAY_NAMES = {"Sun": 0, "Mon": 1, "Tue": 2, "Wed": 3, "Thu": 4, "Fri": 5, "Sat": 6}
+SEARCH_DAYS = 366 * 8  # 2/29 之類的規則最長要找到下一個閏年
 
-    if not scan_strategy.get("enabled", False):
-        return False
+def _parse_cron_field(field: str, low: int, high: int, names: dict = None) -> set[int]:
+    """解析 cron 單一欄位（*、*/n、a-b、a-b/n、a,b 以及英文縮寫）"""
+    values = set()
+    for part in field.split(","):
+        part, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if part == "*":
+            start, end = low, high
+        else:
+            bounds = [names.get(item.capitalize(), item) if names else item for item in part.split("-")]
+            start = int(bounds[0])
+            end = int(bounds[1]) if len(bounds) > 1 else (high if step > 1 else start)
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"cron 欄位超出範圍：{field}")
+        values.update(range(start, end + 1, step))
+    return values
 
-    mode = scan_strategy.get("mode", "manual")
+class CronExpression:
+    """標準 5 欄位 cron（分 時 日 月 星期，星期 0/7 = 週日）；日與星期都有限制時任一符合即可（與 cron 相同）"""
 
-    if mode not in ("manual", "daily", "weekly", "scheduled"):
-        logging.warning(f"[Scheduler] 不支援的模式: {mode}")
-        return False
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 需要 5 個欄位：{expression}")
+        self.expression = expression
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = _parse_cron_field(fields[2], 1, 31)
+        self.months = _parse_cron_field(fields[3], 1, 12, MONTH_NAMES)
+        cron_weekdays = _parse_cron_field(fields[4], 0, 7, CRON_DAY_NAMES)
+        self.weekdays = {(day - 1) % 7 for day in cron_weekdays}  # 轉為 Python weekday（週一 = 0）
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        self.times = sorted((hour, minute) for hour in self.hours for minute in self.minutes)
 
-    if mode == "manual":
-        return False
-    if mode == "daily":
-        return True
+    def matches_day(self, day: datetime.date) -> bool:
+        if day.month not in self.months:
+            return False
+        day_ok = day.day in self.days
+        weekday_ok = day.weekday() in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
 
-    if mode in ("weekly", "scheduled"):
-        weekdays = scan_strategy.get("days", [])
-        today = datetime.datetime.today().weekday()
-        weekday_indexes = []
-        for day in weekdays:
-            index = WEEKDAYS_MAP.get(day.capitalize(), -1)
-            if index == -1:
-                logging.warning(f"[Scheduler] 無效的星期縮寫: {day}")
-            else:
-                weekday_indexes.append(index)
-        return today in weekday_indexes
-
-    return False
-
-def is_time_to_run(scan_strategy):
-    now = datetime.datetime.now()
-    target_time_str = scan_strategy.get("time", "00:00")
-    try:
-        target_time = datetime.datetime.strptime(target_time_str, "%H:%M")
-    except ValueError:
-        example_time = now.strftime("%H:%M")
-        logging.warning(f"[Scheduler] 時間格式錯誤（應為 HH:MM，如 08:30）。收到：{target_time_str}，目前時間範例：{example_time}")
-        return False
+class Schedule:
+    """由 scan_strategy 編譯出的排程：可計算下一次觸發時間，並判斷某時間點是否該執行。
+
+    支援 time（單一 HH:MM）、times（一天多個時段）、days（星期）、cron（覆寫前三者）、
+    tolerance（秒，觸發時間前後容許誤差）與 min_interval_minutes（距上次執行太近則略過）。
+    """
+
+    def __init__(self, scan_strategy: dict):
+        self.enabled = scan_strategy.get("enabled", False)
+        self.mode = scan_strategy.get("mode", "manual")
+        self.tolerance = datetime.timedelta(seconds=scan_strategy.get("tolerance", TIME_TOLERANCE_SECONDS))
+        self.min_interval = datetime.timedelta(minutes=scan_strategy.get("min_interval_minutes", 0))
+        self.cron = CronExpression(scan_strategy["cron"]) if scan_strategy.get("cron") else None
+        self.weekdays = None
+        if self.mode in ("weekly", "scheduled"):
+            self.weekdays = {WEEKDAYS_MAP[day.capitalize()] for day in scan_strategy.get("days", [])
+                             if day.capitalize() in WEEKDAYS_MAP}
+        times = scan_strategy.get("times") or [scan_strategy.get("time", "00:00")]
+        self.times = sorted({(parsed.hour, parsed.minute)
+                             for parsed in (datetime.datetime.strptime(value, "%H:%M") for value in times)})
+
+    @property
+    def active(self) -> bool:
+        if not self.enabled:
+            return False
+        return self.cron is not None or self.mode in ("daily", "weekly", "scheduled")
 
-    scheduled_time = now.replace(hour=target_time.hour, minute=target_time.minute, second=0, microsecond=0)
-    delta = abs((now - scheduled_time).total_seconds())
-    tolerance = scan_strategy.get("tolerance", TIME_TOLERANCE_SECONDS)
+    def _day_times(self, day: datetime.date) -> list[tuple[int, int]]:
+        if self.cron is not None:
+            return self.cron.times if self.cron.matches_day(day) else []
+        if self.weekdays is not None and day.weekday() not in self.weekdays:
+            return []
+        return self.times
 
-    if delta <= tolerance:
-        logging.debug(f"[Scheduler] 現在時間 {now.strftime('%H:%M:%S')} 接近排程時間 {target_time_str}")
+    def next_fire(self, after: datetime.datetime):
+        """回傳嚴格晚於 after 的下一次觸發時間；永不觸發時回傳 None"""
+        if not self.active:
+            return None
+        for offset in range(SEARCH_DAYS):
+            day = after.date() + datetime.timedelta(days=offset)
+            for hour, minute in self._day_times(day):
+                fire = datetime.datetime.combine(day, datetime.time(hour, minute))
+                if fire > after:
+                    return fire
+        return None
+
+    def due(self, now: datetime.datetime, last_run: datetime.datetime = None) -> bool:
+        """now 是否落在某個觸發時間 ±tolerance 內，且距上次執行已超過 min_interval"""
+        fire = self.next_fire(now - self.tolerance - datetime.timedelta(microseconds=1))
+        if fire is None or fire > now + self.tolerance:
+            return False
+        if last_run is not None and self.min_interval and now - last_run < self.min_interval:
+            logging.info(f"[Scheduler] 上次執行於 {last_run:%Y-%m-%d %H:%M}，未超過最短間隔，略過")
+            return False
         return True
-    else:
-        logging.debug(f"[Scheduler] 距排程時間超過 {tolerance} 秒，略過執行")
-        return False
 
-def should_execute_now(scan_strategy):
-    today_check = should_run_today(scan_strategy)
-    time_check = is_time_to_run(scan_strategy)
-    logging.info(f"[Scheduler] Date Check: {today_check}, Time Check: {time_check}")
+def compile_schedule(scan_strategy: dict):
+    """編譯排程設定，格式錯誤時記錄警告並回傳 None"""
+    try:
+        return Schedule(scan_strategy)
+    except (ValueError, KeyError, TypeError) as e:
+        logging.warning(f"[Scheduler] 排程設定格式錯誤：{e}")
+        return None
 
-    if not today_check:
-        logging.info("[Scheduler] 今日不在排程日期，跳過執行")
-    elif not time_check:
-        logging.info("[Scheduler] 時間尚未到排程指定時間，跳過執行")
-    else:
-        logging.info("[Scheduler] 符合排程條件，執行開始")
+def should_execute_now(scan_strategy, now: datetime.datetime = None, last_run: datetime.datetime = None):
+    now = now or datetime.datetime.now()
+    schedule = compile_schedule(scan_strategy)
+    if schedule is None or not schedule.active:
+        logging.info("[Scheduler] 排程未啟用或設定無效，跳過執行")
+        return False
 
-    return today_check and time_check
\ No newline at end of file
+    run_now = schedule.due(now, last_run)
+    if run_now:
+        logging.info("[Scheduler] 符合排程條件，執行開始")
+    else:
+        next_fire = schedule.next_fire(now)
+        logging.info(f"[Scheduler] 目前不在排程時間，下次執行時間：{next_fire:%Y-%m-%d %H:%M}" if next_fire
+                     else "[Scheduler] 沒有可執行的排程時間，跳過執行")
+    return run_now
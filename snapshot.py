@@ -0,0 +1,432 @@
+import os
+import sys
+import json
+import mmap
+import time
+import zlib
+import struct
+import hashlib
+import logging
+import argparse
+import threading
+from datetime import datetime
+from utils import normalize_vidpid
+from registry_backend import get_registry
+from enum_index import ENUM_ROOT_PATH, device_key
+
+SNAPSHOT_MAGIC = b"EGSNAP01"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_DIR = "snapshots"
+SNAPSHOT_KEEP = 14
+SNAPSHOT_SUFFIX = ".egsnap"
+
+ENUM_USB_ROOT = "SYSTEM\\CurrentControlSet\\Enum\\USB"
+USB_FLAGS_ROOT = "SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
+COM_NAME_ARBITER_ROOT = "SYSTEM\\CurrentControlSet\\Control\\COM Name Arbiter"
+# Enum 實例底下的揮發性子鍵（裝置接上時由 PnP 建立、重開機即消失）：不寫入快照也不還原，
+# 否則還原後會變成永久鍵，EnumIndex.instance_details 會把實例一直當成目前接上
+VOLATILE_SUBKEYS = ("control",)
+
+# 檔案結構：MAGIC | 群組... | 目錄 | 結尾(目錄位移 Q, 目錄長度 I, MAGIC)
+# 群組 = I 標頭長 + 標頭 JSON(root, name, keys, digest) | I 壓縮後長度 + zlib(記錄...)
+#   每個群組（一個 Enum\USB 裝置鍵或整個小型根鍵）自帶標頭，寫到一半中斷時可由 repair_snapshot 重建目錄
+# 記錄 = H 路徑長 + 路徑 | Q LastWriteTime | H 值數量 | 每個值：H 名稱長 + 名稱, I 型別, B 資料種類, I 資料長 + 資料
+_TRAILER = struct.Struct("<QI8s")
+_BLOCK_LEN = struct.Struct("<I")
+_KIND_BYTES, _KIND_STR, _KIND_INT, _KIND_LIST, _KIND_NONE = range(5)
+
+def _clean_path(path: str) -> str:
+    return "\\".join(part for part in path.split("\\") if part)
+
+def _encode_data(data) -> tuple[int, bytes]:
+    if data is None:
+        return _KIND_NONE, b""
+    if isinstance(data, bytes):
+        return _KIND_BYTES, data
+    if isinstance(data, str):
+        return _KIND_STR, data.encode("utf-8")
+    if isinstance(data, int):
+        return _KIND_INT, data.to_bytes(8, "little")
+    if isinstance(data, list):
+        return _KIND_LIST, "\0".join(data).encode("utf-8")
+    raise TypeError(f"不支援的登錄值資料型別：{type(data).__name__}")
+
+def _decode_data(kind: int, raw: bytes):
+    if kind == _KIND_BYTES:
+        return raw
+    if kind == _KIND_STR:
+        return raw.decode("utf-8")
+    if kind == _KIND_INT:
+        return int.from_bytes(raw, "little")
+    if kind == _KIND_LIST:
+        return raw.decode("utf-8").split("\0") if raw else []
+    return None
+
+def _encode_record(path: str, last_write: int, values: list) -> tuple[bytes, bytes]:
+    """回傳 (完整記錄, 計算摘要用的內容)；摘要不含 LastWriteTime，只反映鍵與值本身"""
+    name = path.encode("utf-8")
+    body = [struct.pack("<H", len(values))]
+    for value_name, data, value_type in values:
+        value_name = value_name.encode("utf-8")
+        kind, raw = _encode_data(data)
+        body.append(struct.pack("<H", len(value_name)) + value_name + struct.pack("<IBI", value_type, kind, len(raw)) + raw)
+    body = b"".join(body)
+    head = struct.pack("<H", len(name)) + name
+    return head + struct.pack("<Q", last_write) + body, head + body
+
+def _decode_records(block: bytes):
+    offset = 0
+    while offset < len(block):
+        (length,) = struct.unpack_from("<H", block, offset)
+        offset += 2
+        path = block[offset:offset + length].decode("utf-8")
+        offset += length
+        last_write, count = struct.unpack_from("<QH", block, offset)
+        offset += 10
+        values = []
+        for _ in range(count):
+            (length,) = struct.unpack_from("<H", block, offset)
+            offset += 2
+            value_name = block[offset:offset + length].decode("utf-8")
+            offset += length
+            value_type, kind, length = struct.unpack_from("<IBI", block, offset)
+            offset += 9
+            values.append((value_name, _decode_data(kind, block[offset:offset + length]), value_type))
+            offset += length
+        yield path, last_write, values
+
+def _is_volatile(path: str) -> bool:
+    return any(part.lower() in VOLATILE_SUBKEYS for part in path.split("\\"))
+
+def _walk(registry, root, relpath: str, skip=()):
+    """以同一個根 handle 前序走訪 relpath 子樹（父鍵先於子鍵），產生 (相對路徑, LastWriteTime, 值清單)；
+    名稱在 skip（小寫）中的子鍵連同其子樹略過"""
+    stack = [relpath]
+    while stack:
+        path = stack.pop()
+        try:
+            with registry.OpenKey(root, path) as key:
+                subkey_count, value_count, last_write = registry.QueryInfoKey(key)
+                values = [registry.EnumValue(key, i) for i in range(value_count)]
+                children = [registry.EnumKey(key, i) for i in range(subkey_count)]
+        except FileNotFoundError:
+            continue
+        yield path, last_write, values
+        stack.extend(f"{path}\\{child}" if path else child for child in reversed(children) if child.lower() not in skip)
+
+class SnapshotWriter:
+    """串流寫入快照：每次 write_group 走訪一個子樹、壓縮成一個區塊後立即寫出，記憶體只保留一個群組。
+    可由多個執行緒共用（寫入時持有鎖）。"""
+
+    def __init__(self, snapshot_file: str):
+        self.snapshot_file = snapshot_file
+        self.groups = []
+        self.keys = 0
+        self._lock = threading.Lock()
+        self._written = set()
+        self._tmp_file = f"{snapshot_file}.tmp"
+        self._file = open(self._tmp_file, "wb")
+        self._file.write(SNAPSHOT_MAGIC)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def write_group(self, root_path: str, name: str = "") -> int:
+        """把 root_path\\name 整棵子樹寫成一個群組（name 為空時是整個根鍵），回傳鍵數；同一群組只寫一次"""
+        root_path = _clean_path(root_path)
+        registry = get_registry()
+        with self._lock:
+            if (root_path.lower(), name.lower()) in self._written:
+                return 0
+            self._written.add((root_path.lower(), name.lower()))
+            records = []
+            digest = hashlib.blake2b(digest_size=16)
+            skip = VOLATILE_SUBKEYS if root_path.lower().startswith(_clean_path(ENUM_ROOT_PATH).lower()) else ()
+            try:
+                with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, root_path) as root:
+                    for path, last_write, values in _walk(registry, root, name, skip):
+                        record, content = _encode_record(path, last_write, values)
+                        records.append(record)
+                        digest.update(content)
+            except FileNotFoundError:
+                logging.debug(f"[Snapshot] 找不到 {root_path}\\{name}，略過")
+                return 0
+            if not records:
+                return 0
+            block = zlib.compress(b"".join(records), 6)
+            group = {"root": root_path, "name": name, "keys": len(records), "digest": digest.hexdigest()}
+            header = json.dumps(group, ensure_ascii=False).encode("utf-8")
+            self._file.write(_BLOCK_LEN.pack(len(header)) + header)
+            group["offset"] = self._file.tell()
+            self._file.write(_BLOCK_LEN.pack(len(block)) + block)
+            self.groups.append(group)
+            self.keys += len(records)
+            return len(records)
+
+    def write_vidpid(self, index, vidpid: str) -> int:
+        """寫入 vidpid 在 Enum 底下的所有裝置鍵（依 EnumIndex 的子鍵清單，每個裝置鍵以其列舉器根鍵為群組根）並 fsync，
+        確保刪除前備份已落地"""
+        written = 0
+        for subkey in index.subkeys(vidpid):
+            root, _, name = subkey.rpartition("\\")
+            written += self.write_group(f"{index.enum_path}\\{root}" if root else index.enum_path, name)
+        self.sync()
+        return written
+
+    def sync(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file.closed:
+                return
+            _write_directory(self._file, self.groups, self.keys)
+            self._file.close()
+            os.replace(self._tmp_file, self.snapshot_file)
+        logging.info(f"[Snapshot] 已寫入快照 {self.snapshot_file}（{len(self.groups)} 個群組，{self.keys} 個鍵，"
+                     f"{os.path.getsize(self.snapshot_file) / 1024:.1f} KB）")
+
+    def abort(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+            if os.path.exists(self._tmp_file):
+                os.remove(self._tmp_file)
+
+def _write_directory(f, groups: list[dict], keys: int) -> None:
+    directory = {"version": SNAPSHOT_VERSION, "created": time.time(), "keys": keys,
+                 "groups": sorted(groups, key=lambda group: (group["root"], group["name"].lower()))}
+    footer = zlib.compress(json.dumps(directory, ensure_ascii=False).encode("utf-8"))
+    offset = f.tell()
+    f.write(footer)
+    f.write(_TRAILER.pack(offset, len(footer), SNAPSHOT_MAGIC))
+    f.flush()
+    os.fsync(f.fileno())
+
+def repair_snapshot(snapshot_file: str) -> bool:
+    """執行中斷而只留下 .tmp 時，依各群組標頭重建目錄並完成快照（丟棄最後不完整的群組）；成功或本來就完整時回傳 True"""
+    if os.path.exists(snapshot_file):
+        return True
+    tmp_file = f"{snapshot_file}.tmp"
+    if not os.path.exists(tmp_file):
+        return False
+    groups = []
+    keys = 0
+    with open(tmp_file, "r+b") as f:
+        data = f.read()
+        if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return False
+        position = len(SNAPSHOT_MAGIC)
+        while True:
+            try:
+                (length,) = _BLOCK_LEN.unpack_from(data, position)
+                group = json.loads(data[position + _BLOCK_LEN.size:position + _BLOCK_LEN.size + length])
+                offset = position + _BLOCK_LEN.size + length
+                (block_length,) = _BLOCK_LEN.unpack_from(data, offset)
+                end = offset + _BLOCK_LEN.size + block_length
+                zlib.decompress(data[offset + _BLOCK_LEN.size:end])
+            except (struct.error, ValueError, zlib.error):
+                break
+            group["offset"] = offset
+            groups.append(group)
+            keys += group["keys"]
+            position = end
+        f.seek(position)
+        f.truncate()
+        _write_directory(f, groups, keys)
+    os.replace(tmp_file, snapshot_file)
+    logging.warning(f"[Snapshot] 已修復中斷的快照 {snapshot_file}（{len(groups)} 個群組，{keys} 個鍵）")
+    return True
+
+class SnapshotReader:
+    """以 mmap 讀取快照：開啟時只解析結尾與目錄，群組內容在需要時才解壓"""
+
+    def __init__(self, snapshot_file: str):
+        self.snapshot_file = snapshot_file
+        self._file = open(snapshot_file, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC or len(self._map) < len(SNAPSHOT_MAGIC) + _TRAILER.size:
+                raise ValueError("不是有效的快照檔")
+            offset, length, magic = _TRAILER.unpack_from(self._map, len(self._map) - _TRAILER.size)
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError("快照檔結尾不完整")
+            directory = json.loads(zlib.decompress(self._map[offset:offset + length]))
+        except Exception:
+            self.close()
+            raise
+        if directory.get("version") != SNAPSHOT_VERSION:
+            self.close()
+            raise ValueError(f"不支援的快照版本：{directory.get('version')}")
+        self.created = directory["created"]
+        self.keys = directory["keys"]
+        self.groups = directory["groups"]
+        self._by_name = {(group["root"].lower(), group["name"].lower()): group for group in self.groups}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def group(self, root_path: str, name: str = ""):
+        return self._by_name.get((_clean_path(root_path).lower(), name.lower()))
+
+    def records(self, group: dict):
+        """解壓單一群組，產生 (相對路徑, LastWriteTime, 值清單)"""
+        (length,) = _BLOCK_LEN.unpack_from(self._map, group["offset"])
+        start = group["offset"] + _BLOCK_LEN.size
+        yield from _decode_records(zlib.decompress(self._map[start:start + length]))
+
+    def vidpid_groups(self, vidpid: str) -> list[dict]:
+        """vidpid 的裝置鍵群組：Enum\\USB 依 normalize_vidpid 比對，其他列舉器（多列舉器模式）依 device_key 比對"""
+        vidpid = normalize_vidpid(vidpid)
+        enum_prefix = _clean_path(ENUM_ROOT_PATH).lower() + "\\"
+        groups = []
+        for group in self.groups:
+            root = group["root"]
+            if not group["name"] or not root.lower().startswith(enum_prefix):
+                continue
+            enumerator = root[len(enum_prefix):]
+            if ((enumerator.upper() == "USB" and normalize_vidpid(group["name"]) == vidpid)
+                    or device_key(enumerator, group["name"]) == vidpid):
+                groups.append(group)
+        return groups
+
+def diff_snapshots(old_file: str, new_file: str) -> dict:
+    """比較兩份快照：摘要相同的群組直接略過（不解壓），只展開有變動的群組，耗時與變動量成正比。
+    回傳 {added, removed, changed}，各為完整鍵路徑清單（changed 為值有變動的鍵）"""
+    result = {"added": [], "removed": [], "changed": [], "groups_compared": 0}
+    with SnapshotReader(old_file) as old, SnapshotReader(new_file) as new:
+        for key in sorted(old._by_name.keys() | new._by_name.keys()):
+            before, after = old._by_name.get(key), new._by_name.get(key)
+            if before and after and before["digest"] == after["digest"]:
+                continue
+            result["groups_compared"] += 1
+            root = (before or after)["root"]
+            old_keys = {path.lower(): (path, values) for path, _, values in old.records(before)} if before else {}
+            new_keys = {path.lower(): (path, values) for path, _, values in new.records(after)} if after else {}
+            for lower in old_keys.keys() - new_keys.keys():
+                result["removed"].append(f"{root}\\{old_keys[lower][0]}")
+            for lower in new_keys.keys() - old_keys.keys():
+                result["added"].append(f"{root}\\{new_keys[lower][0]}")
+            for lower in old_keys.keys() & new_keys.keys():
+                if sorted(old_keys[lower][1]) != sorted(new_keys[lower][1]):
+                    result["changed"].append(f"{root}\\{new_keys[lower][0]}")
+    for name in ("added", "removed", "changed"):
+        result[name].sort()
+    return result
+
+def restore_vidpid(snapshot_file: str, vidpid: str) -> int:
+    """從快照還原單一 VID/PID 在 Enum\\USB 的所有子樹（依前序建立鍵並寫回值）與其 UsbFlags Ignore 值，回傳還原的鍵數。
+    舊快照中的揮發性子鍵（Control）不還原"""
+    vidpid = normalize_vidpid(vidpid)
+    registry = get_registry()
+    restored = 0
+    with SnapshotReader(snapshot_file) as snapshot:
+        groups = snapshot.vidpid_groups(vidpid)
+        if not groups:
+            logging.warning(f"[Snapshot] 快照中沒有 {vidpid} 的 Enum\\USB 資料")
+        for group in groups:
+            with registry.CreateKeyEx(registry.HKEY_LOCAL_MACHINE, group["root"], 0, registry.KEY_ALL_ACCESS) as root:
+                for path, _, values in snapshot.records(group):
+                    if _is_volatile(path):
+                        continue
+                    with registry.CreateKeyEx(root, path, 0, registry.KEY_ALL_ACCESS) as key:
+                        for value_name, data, value_type in values:
+                            registry.SetValueEx(key, value_name, 0, value_type, data)
+                    restored += 1
+
+        flags = snapshot.group(USB_FLAGS_ROOT)
+        ignore_name = f"IgnoreHWSerNum{vidpid}".lower()
+        for path, _, values in (snapshot.records(flags) if flags else []):
+            for value_name, data, value_type in values:
+                if not path and value_name.lower() == ignore_name:
+                    with registry.CreateKeyEx(registry.HKEY_LOCAL_MACHINE, USB_FLAGS_ROOT, 0, registry.KEY_ALL_ACCESS) as key:
+                        registry.SetValueEx(key, value_name, 0, value_type, data)
+    logging.info(f"[Snapshot] 已從 {snapshot_file} 還原 {vidpid}：{restored} 個鍵")
+    return restored
+
+def take_snapshot(snapshot_file: str) -> SnapshotWriter:
+    """完整快照：UsbFlags、COM Name Arbiter 與 Enum\\USB 每個裝置鍵各一個群組"""
+    registry = get_registry()
+    with SnapshotWriter(snapshot_file) as writer:
+        writer.write_group(USB_FLAGS_ROOT)
+        writer.write_group(COM_NAME_ARBITER_ROOT)
+        try:
+            with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_ROOT) as usb_root:
+                subkeys = [registry.EnumKey(usb_root, i) for i in range(registry.QueryInfoKey(usb_root)[0])]
+        except FileNotFoundError:
+            subkeys = []
+        for subkey in subkeys:
+            writer.write_group(ENUM_USB_ROOT, subkey)
+    return writer
+
+def snapshot_path(snapshot_dir: str = SNAPSHOT_DIR) -> str:
+    """以時間命名的新快照路徑；同一秒內已有快照（含未完成的 .tmp）時加上序號"""
+    os.makedirs(snapshot_dir, exist_ok=True)
+    base = os.path.join(snapshot_dir, f"snapshot_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    path, n = f"{base}{SNAPSHOT_SUFFIX}", 1
+    while os.path.exists(path) or os.path.exists(f"{path}.tmp"):
+        path, n = f"{base}_{n}{SNAPSHOT_SUFFIX}", n + 1
+    return path
+
+def prune_snapshots(snapshot_dir: str = SNAPSHOT_DIR, keep: int = SNAPSHOT_KEEP) -> None:
+    """只保留最新的 keep 份快照"""
+    if not os.path.isdir(snapshot_dir):
+        return
+    files = sorted(name for name in os.listdir(snapshot_dir) if name.endswith(SNAPSHOT_SUFFIX))
+    for name in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(os.path.join(snapshot_dir, name))
+        except OSError as e:
+            logging.warning(f"[Snapshot] 刪除舊快照失敗：{name} - {e}")
+
+def main():
+    parser = argparse.ArgumentParser(description="EnumGuardian 註冊表快照：建立、比較、還原")
+    sub = parser.add_subparsers(dest="command", required=True)
+    take = sub.add_parser("take", help="建立完整快照")
+    take.add_argument("file", nargs="?")
+    info = sub.add_parser("info", help="列出快照內容")
+    info.add_argument("file")
+    diff = sub.add_parser("diff", help="比較兩份快照")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    restore = sub.add_parser("restore", help="還原單一 VID/PID")
+    restore.add_argument("file")
+    restore.add_argument("vidpid", nargs="+")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
+
+    if args.command == "take":
+        take_snapshot(args.file or snapshot_path())
+    elif args.command == "info":
+        with SnapshotReader(args.file) as snapshot:
+            print(f"建立時間：{datetime.fromtimestamp(snapshot.created):%Y-%m-%d %H:%M:%S}，共 {snapshot.keys} 個鍵")
+            for group in snapshot.groups:
+                print(f"{group['root']}\\{group['name']}\t{group['keys']}")
+    elif args.command == "diff":
+        print(json.dumps(diff_snapshots(args.old, args.new), indent=4, ensure_ascii=False))
+    elif args.command == "restore":
+        for vidpid in args.vidpid:
+            restore_vidpid(args.file, vidpid)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from registry_backend import MemoryRegistry, set_registry
+from registry_fixtures import generate_fixture
+
+@pytest.fixture
+def registry():
+    """以 MemoryRegistry 取代 winreg，測試結束後還原"""
+    memory = MemoryRegistry()
+    previous = set_registry(memory)
+    yield memory
+    set_registry(previous)
+
+class RecordingRegistry(MemoryRegistry):
+    """記錄 UsbFlags 寫入與 Enum 刪除的先後順序"""
+
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def SetValueEx(self, key, value_name, reserved, value_type, value):
+        self.events.append(("flag", value_name))
+        return super().SetValueEx(key, value_name, reserved, value_type, value)
+
+    def DeleteKey(self, key, sub_key):
+        self.events.append(("delete", sub_key))
+        return super().DeleteKey(key, sub_key)
+
+@pytest.fixture
+def auto_run(tmp_path, monkeypatch):
+    """在暫存目錄以合成註冊表執行 enum_auto_run（import 時會切換目錄，之後再切回暫存目錄）"""
+    import enum_auto_run
+    import config_model
+
+    monkeypatch.chdir(tmp_path)
+    config_model._cache.clear()
+    registry = RecordingRegistry()
+    fixture = generate_fixture(vidpids=60, max_instances=40, distribution="uniform", locked_ratio=0, ignore_ratio=0,
+                               seed=5, registry=registry)
+    previous = set_registry(registry)
+
+    def configure(**values):
+        data = {"threshold": 30, "scan_strategy": {"enabled": False}, "monitored_devices": [],
+                "snapshot": {"enabled": False}, "journal": {"enabled": False}}
+        data.update(values)
+        (tmp_path / "config.json").write_text(json.dumps(data), encoding="utf-8")
+        enum_auto_run.load_config()
+        return enum_auto_run
+
+    yield configure, registry, fixture
+    set_registry(previous)
@@ -0,0 +1,108 @@
+import logging
+import time
+
+import pytest
+
+from cleaner import clean_enum_for_vidpid, delete_enum_keys, delete_registry_tree, select_prunable
+from config_model import PrunePolicy
+from enum_index import InstanceInfo
+from registry_fixtures import ENUM_USB, build_device
+from utils import filetime_from_timestamp, get_locked_list
+
+DAY = 86400
+NOW = 1_800_000_000.0
+
+def open_usb(registry):
+    return registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB, 0, registry.KEY_ALL_ACCESS)
+
+def test_delete_registry_tree_deletes_children_first(registry):
+    build_device(registry, "VID_1111&PID_2222", 3)
+    registry.add_key(f"{ENUM_USB}\\VID_1111&PID_2222\\00000001\\Device Parameters\\A\\B\\C")
+    total = registry.count_keys(f"{ENUM_USB}\\VID_1111&PID_2222")
+    errors = []
+    with open_usb(registry) as root:
+        # MemoryRegistry 與 winreg 相同，父鍵有子鍵時 DeleteKey 會 PermissionError，因此必須由下往上刪
+        with pytest.raises(PermissionError):
+            registry.DeleteKey(root, "VID_1111&PID_2222\\00000000")
+        assert delete_registry_tree(root, "VID_1111&PID_2222", errors) == total
+        # 已不存在的子樹不算錯誤
+        assert delete_registry_tree(root, "VID_1111&PID_2222", errors) == 0
+    assert errors == []
+    assert not registry.exists(f"{ENUM_USB}\\VID_1111&PID_2222")
+
+def test_failed_child_keeps_parent_and_reports_errors(registry):
+    build_device(registry, "VID_1111&PID_2222", 3)
+    registry.inject_fault("DeleteKey", "00000001\\Device Parameters", PermissionError("[WinError 5] 存取被拒。"))
+    keys = [f"VID_1111&PID_2222\\{i:08X}" for i in range(3)]
+    removed_calls = []
+    with open_usb(registry) as root:
+        deleted, removed, errors = delete_enum_keys(root, keys, on_removed=removed_calls.append)
+    assert removed == removed_calls == [keys[0], keys[2]]
+    # 子鍵刪除失敗後，父鍵因仍有子鍵而 PermissionError，兩者都記錄
+    assert [item["key"] for item in errors] == [f"{keys[1]}\\Device Parameters", keys[1]]
+    assert all("PermissionError" in item["error"] for item in errors)
+    assert registry.exists(f"{ENUM_USB}\\{keys[1]}\\Device Parameters")
+    assert not registry.exists(f"{ENUM_USB}\\{keys[1]}\\Properties")
+    # 每個實例 5 個鍵；失敗的實例只刪掉 Properties 子樹（3 個鍵）
+    assert deleted == 5 + 3 + 5
+
+def test_delete_enum_keys_batches(registry, caplog):
+    build_device(registry, "VID_1111&PID_2222", 7)
+    keys = [f"VID_1111&PID_2222\\{i:08X}" for i in range(7)]
+    removed_calls = []
+    with caplog.at_level(logging.DEBUG), open_usb(registry) as root:
+        deleted, removed, errors = delete_enum_keys(root, keys, batch_size=3, on_removed=removed_calls.append)
+    progress = [record.getMessage() for record in caplog.records if "批次刪除進度" in record.getMessage()]
+    assert [message.split("進度 ")[1].split("，")[0] for message in progress] == ["3/7", "6/7", "7/7"]
+    assert removed == removed_calls == keys and errors == []
+    assert deleted == 7 * 5
+    assert registry.count_keys(f"{ENUM_USB}\\VID_1111&PID_2222") == 1
+
+def info(name: str, age_days: float, present: bool = False) -> InstanceInfo:
+    return InstanceInfo(name, filetime_from_timestamp(NOW - age_days * DAY), present)
+
+INSTANCES = [info("a", 1), info("b", 50, present=True), info("c", 2), info("d", 40), info("e", 3), info("f", 60)]
+
+def test_prune_keep_instances():
+    policy = PrunePolicy(keep_instances=2, max_age_days=0, keep_present=False)
+    # 保留最新的 a、c，其餘由舊到新刪除
+    assert select_prunable(INSTANCES, policy, now=NOW) == ["f", "b", "d", "e"]
+
+def test_prune_max_age_days():
+    policy = PrunePolicy(keep_instances=5, max_age_days=30, keep_present=False)
+    # 只有 30 天內的 a、c、e 可保留，即使 keep_instances 更多
+    assert select_prunable(INSTANCES, policy, now=NOW) == ["f", "b", "d"]
+
+def test_prune_keep_present():
+    policy = PrunePolicy(keep_instances=1, max_age_days=30, keep_present=True)
+    # b 目前接上，不論新舊都保留，且不佔 keep_instances 名額
+    assert select_prunable(INSTANCES, policy, now=NOW) == ["f", "d", "e", "c"]
+    assert select_prunable(INSTANCES, policy._replace(keep_present=False), now=NOW) == ["f", "b", "d", "e", "c"]
+    assert select_prunable(INSTANCES, policy._replace(keep_instances=0), now=NOW) == ["f", "d", "e", "c", "a"]
+
+def test_clean_enum_for_vidpid_with_policy(registry, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    now = time.time()
+    ages = {"00000000": 90, "00000001": 1, "00000002": 60, "00000003": 2, "00000004": 120}
+    build_device(registry, "VID_1111&PID_2222", len(ages))
+    registry.add_key(f"{ENUM_USB}\\VID_1111&PID_2222\\00000004\\Control")
+    for name, age in ages.items():
+        registry.set_last_write(f"{ENUM_USB}\\VID_1111&PID_2222\\{name}", filetime_from_timestamp(now - age * DAY))
+
+    kept = clean_enum_for_vidpid("11112222", policy=PrunePolicy(keep_instances=1, max_age_days=30, keep_present=True))
+    remaining = {name for name in ages if registry.exists(f"{ENUM_USB}\\VID_1111&PID_2222\\{name}")}
+    assert kept == 2
+    # 最新的 00000001 與目前接上的 00000004 保留
+    assert remaining == {"00000001", "00000004"}
+    assert "11112222" in get_locked_list("lock_list.json")
+
+def test_clean_enum_for_vidpid_skips_locked(registry, tmp_path, monkeypatch):
+    from lock_list_store import get_lock_list_store
+
+    monkeypatch.chdir(tmp_path)
+    build_device(registry, "VID_1111&PID_2222", 2)
+    get_lock_list_store("lock_list.json").add("11112222")
+    assert clean_enum_for_vidpid("1111:2222") == 0
+    assert registry.exists(f"{ENUM_USB}\\VID_1111&PID_2222\\00000000")
+    clean_enum_for_vidpid("11112222", skip_locked=False)
+    assert not registry.exists(f"{ENUM_USB}\\VID_1111&PID_2222\\00000000")
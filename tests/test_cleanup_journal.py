@@ -0,0 +1,118 @@
+import json
+import os
+
+import pytest
+
+from cleanup_journal import CleanupJournal, read_journal, rollback, LAST_JOURNAL_SUFFIX
+from registry_fixtures import ENUM_USB
+
+class Crash(BaseException):
+    """模擬執行中被強制結束（不會被清理流程的 except Exception 攔下）"""
+
+def offenders_of(fixture, threshold: int = 30) -> list[str]:
+    return [vidpid for vidpid, count in fixture["counts"].items() if count >= threshold]
+
+def instance_keys(fixture, vidpid: str) -> list[str]:
+    subkey = f"VID_{vidpid[:4]}&PID_{vidpid[4:]}"
+    return [f"{subkey}\\{i:08X}" for i in range(fixture["counts"][vidpid])]
+
+def test_resume_after_crash_skips_completed_work(auto_run, monkeypatch):
+    configure, registry, fixture = auto_run
+    run = configure(journal={"enabled": True})
+    offenders = offenders_of(fixture)
+    assert len(offenders) > 3
+    delete_key = registry.DeleteKey
+    deletes = []
+
+    def crashing_delete(key, sub_key):
+        if len(deletes) >= 3 * 40 * 3:
+            raise Crash()
+        deletes.append(sub_key)
+        return delete_key(key, sub_key)
+
+    monkeypatch.setattr(registry, "DeleteKey", crashing_delete)
+    with pytest.raises(Crash):
+        run.run_once()
+    state, finished = read_journal("cleanup_journal.log")
+    assert not finished
+    assert 0 < len(state.completed) < len(offenders)
+    pending = [vidpid for vidpid, _ in state.pending_offenders()]
+    assert set(pending) == set(offenders) - state.completed
+    # 中斷時正在刪除的 VID/PID 已寫入計畫，且部分鍵已確認刪除
+    interrupted = next(vidpid for vidpid in pending if vidpid in state.planned)
+    first_run_deletes = set(deletes)
+
+    deletes.clear()
+    monkeypatch.setattr(registry, "DeleteKey", lambda key, sub_key: deletes.append(sub_key) or delete_key(key, sub_key))
+    run.run_once()
+    assert not os.path.exists("cleanup_journal.log")
+    state, finished = read_journal("cleanup_journal.log" + LAST_JOURNAL_SUFFIX)
+    assert finished and state.completed == set(offenders)
+    # 接續時只處理未完成的 VID/PID，已刪除的鍵不會再刪一次
+    assert not first_run_deletes & set(deletes)
+    touched = {path.split("\\")[0] for path in deletes}
+    assert touched == {f"VID_{vidpid[:4]}&PID_{vidpid[4:]}" for vidpid in pending}
+    for vidpid in offenders:
+        assert not any(registry.exists(f"{ENUM_USB}\\{key}") for key in instance_keys(fixture, vidpid))
+    assert interrupted in state.completed
+
+def test_read_journal_ignores_torn_and_corrupt_lines(tmp_path):
+    journal_file = str(tmp_path / "cleanup_journal.log")
+    journal = CleanupJournal(journal_file, sync_batch=2)
+    journal.begin("snap.ejsnap")
+    journal.add_offenders([("11112222", 40), ("33334444", 35)])
+    journal.plan("11112222", ["a\\1", "a\\2", "a\\3"])
+    journal.key_deleted("11112222", "a\\1")
+    journal.key_deleted("11112222", "a\\2")
+    journal.completed("11112222")
+    journal._file.close()
+    with open(journal_file, "a", encoding="utf-8") as f:
+        f.write("{not json}\n")
+        f.write(json.dumps({"op": "completed", "vid_pid": "33334444"})[:20])
+
+    state, finished = read_journal(journal_file)
+    assert not finished
+    assert state.snapshots == ["snap.ejsnap"]
+    assert state.offenders == [("11112222", 40), ("33334444", 35)]
+    assert state.done_keys == {"11112222": {"a\\1", "a\\2"}}
+    # 寫到一半的最後一行不算完成
+    assert state.completed == {"11112222"}
+    assert state.pending_offenders() == [("33334444", 35)]
+
+    resumed = CleanupJournal(journal_file)
+    assert resumed.recover() is not None
+    assert resumed.resuming("11112222") and not resumed.resuming("33334444")
+    assert resumed.pending_keys("11112222", ["a\\1", "a\\2", "a\\3"]) == ["a\\3"]
+
+def test_finished_journal_is_not_resumed(tmp_path):
+    journal_file = str(tmp_path / "cleanup_journal.log")
+    journal = CleanupJournal(journal_file)
+    journal.begin()
+    journal.add_offenders([("11112222", 40)])
+    journal.completed("11112222")
+    journal.finish()
+    assert not os.path.exists(journal_file)
+    assert CleanupJournal(journal_file).recover() is None
+    assert read_journal(journal_file + LAST_JOURNAL_SUFFIX)[1]
+
+def test_rollback_restores_from_snapshot(auto_run):
+    configure, registry, fixture = auto_run
+    offenders = offenders_of(fixture)
+    vidpid = offenders[0]
+    key = instance_keys(fixture, vidpid)[0]
+    assert registry.exists(f"{ENUM_USB}\\{key}\\Device Parameters")
+    configure(journal={"enabled": True}, snapshot={"enabled": True}).run_once()
+    for other in offenders:
+        assert not registry.exists(f"{ENUM_USB}\\{instance_keys(fixture, other)[0]}")
+
+    restored = rollback()
+    assert restored >= sum(fixture["counts"][other] for other in offenders)
+    for other in offenders:
+        assert all(registry.exists(f"{ENUM_USB}\\{path}") for path in instance_keys(fixture, other))
+    assert registry.exists(f"{ENUM_USB}\\{key}\\Device Parameters")
+
+def test_rollback_without_snapshot_restores_nothing(auto_run):
+    configure, registry, fixture = auto_run
+    configure(journal={"enabled": True}).run_once()
+    assert rollback() == 0
+    assert not registry.exists(f"{ENUM_USB}\\{instance_keys(fixture, offenders_of(fixture)[0])[0]}")
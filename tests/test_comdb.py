@@ -0,0 +1,88 @@
+import pytest
+
+import cleaner
+from comdb import (COMDB_PATH, SERIALCOMM_PATH, bitmap_for_ports, live_com_ports, ports_in_bitmap, reconcile_bitmap,
+                   reconcile_comdb)
+from enum_index import EnumIndex, ENUM_USB_PATH
+from registry_fixtures import COM_NAME_ARBITER, generate_fixture
+
+def comdb_ports(registry):
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, COMDB_PATH) as key:
+        return ports_in_bitmap(bytes(registry.QueryValueEx(key, "ComDB")[0]))
+
+def test_bitmap_round_trip():
+    assert ports_in_bitmap(bitmap_for_ports({1, 8, 9, 1024}, 128)) == {1, 8, 9, 1024}
+    assert bitmap_for_ports({1, 9}, 2) == b"\x01\x01"
+    assert bitmap_for_ports({17}, 2) == b"\x00\x00"
+
+def test_reconcile_bitmap_frees_only_unused_ports():
+    data = bitmap_for_ports({1, 3, 5, 700}, 128)
+    new, freed = reconcile_bitmap(data, {3, 700, 9})
+    assert freed == [1, 5]
+    assert ports_in_bitmap(new) == {3, 700}
+    assert len(new) == 128
+
+@pytest.fixture
+def serial_fixture(registry, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return generate_fixture(vidpids=40, max_instances=30, distribution="uniform", serial_ratio=0.2, seed=3,
+                            registry=registry)
+
+def test_index_ports_match_registry_walk(registry, serial_fixture):
+    index = EnumIndex.build()
+    assert live_com_ports(index=index) == live_com_ports() == set(serial_fixture["com_ports"].values())
+
+def test_reconcile_after_cleanup_frees_deleted_instance_ports(registry, serial_fixture):
+    ports = serial_fixture["com_ports"]
+    reserved_before = comdb_ports(registry)
+    index = EnumIndex.build()
+    subkey = next(iter(ports)).split("\\")[0]
+    vidpid = subkey.replace("VID_", "").replace("&PID_", "")
+    deleted_ports = {port for path, port in ports.items() if path.startswith(f"{subkey}\\")}
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_PATH) as root:
+        index.com_ports(root, ["USB"])
+    cleaner.clean_enum_for_vidpid(vidpid, index=index, skip_locked=False)
+
+    registry.ops.clear()
+    summary = reconcile_comdb(index=index)
+    # 使用中的埠全部來自索引快取，不再開啟任何 Device Parameters
+    assert registry.ops["QueryValueEx"] == 2
+    kept = set(ports.values()) - deleted_ports
+    assert set(summary["freed"]) == reserved_before - kept
+    assert deleted_ports <= set(summary["freed"])
+    assert summary["written"]
+    assert comdb_ports(registry) == kept
+
+def test_connected_and_unindexed_ports_are_kept(registry, serial_fixture):
+    registry.add_key(SERIALCOMM_PATH, {"\\Device\\VCP0": ("COM900", registry.REG_SZ)})
+    registry.add_key("SYSTEM\\CurrentControlSet\\Enum\\ACPI\\PNP0501\\1\\Device Parameters",
+                     {"PortName": ("COM901", registry.REG_SZ)})
+    registry.add_key(COM_NAME_ARBITER, {"ComDB": (bitmap_for_ports({900, 901, 902}, 128), registry.REG_BINARY)})
+    summary = reconcile_comdb(index=EnumIndex.build())
+    assert summary["freed"] == [902]
+    assert comdb_ports(registry) == {900, 901}
+
+def test_partial_index_falls_back_to_walk(registry, serial_fixture):
+    index = EnumIndex.build(only={"00000000"})
+    assert not index.complete
+    assert live_com_ports(index=index) == set(serial_fixture["com_ports"].values())
+
+def test_dry_run_does_not_write(registry, serial_fixture):
+    before = comdb_ports(registry)
+    summary = reconcile_comdb(dry_run=True, index=EnumIndex.build())
+    assert summary["freed"] and not summary["written"]
+    assert comdb_ports(registry) == before
+
+def test_ports_reused_from_scan_cache(registry, serial_fixture, tmp_path):
+    from enum_index import load_scan_cache
+
+    index = EnumIndex.build()
+    expected = live_com_ports(index=index)
+    cache_file = str(tmp_path / "scan_cache.json")
+    index.save_cache(cache_file)
+
+    registry.ops.clear()
+    warm = EnumIndex.build(cache=load_scan_cache(cache_file))
+    assert warm.cache_hits == len(serial_fixture["subkeys"])
+    assert live_com_ports(index=warm) == expected
+    assert registry.ops["QueryValueEx"] == 0
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+config_gui_tool = pytest.importorskip("config_gui_tool")
+
+class Var:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+@pytest.fixture
+def gui(tmp_path, monkeypatch):
+    """不建立 Tk 視窗，只設定 save() 會用到的欄位"""
+    from config_model import load_config
+
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"threshold": 100, "log_file": "log.txt", "monitored_devices": [],
+                                "scan_strategy": {"enabled": True, "mode": "scheduled", "time": "12:30", "days": []}}),
+                    encoding="utf-8")
+    errors = []
+    monkeypatch.setattr(config_gui_tool.messagebox, "showerror", lambda title, message: errors.append(message))
+    monkeypatch.setattr(config_gui_tool.messagebox, "showinfo", lambda title, message: None)
+    gui = config_gui_tool.ConfigGUI.__new__(config_gui_tool.ConfigGUI)
+    gui.app_config = load_config(str(path))
+    gui.config = gui.app_config.data
+    gui.threshold_var = Var("100")
+    gui.log_file_var = Var("log.txt")
+    gui.time_var = Var("12:30")
+    gui.enabled_var = Var(True)
+    gui.day_vars = {day: Var(False) for day in config_gui_tool.WEEKDAYS}
+    return gui, path, errors
+
+def test_invalid_settings_are_not_kept_in_memory(gui):
+    gui, path, errors = gui
+    gui.threshold_var = Var("0")
+    gui.time_var = Var("25:99")
+    gui.save()
+    assert len(errors) == 1
+    assert gui.app_config.threshold == 100
+    assert gui.app_config.data["scan_strategy"]["time"] == "12:30"
+    assert gui.app_config.to_dict()["threshold"] == 100
+
+    # 之後其他路徑寫回設定時不會帶出錯誤的值
+    gui.app_config.add_device("1234:5678")
+    assert gui.app_config.save()
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert saved["threshold"] == 100 and saved["scan_strategy"]["time"] == "12:30"
+
+def test_valid_settings_are_saved(gui):
+    gui, path, errors = gui
+    gui.threshold_var = Var("250")
+    gui.day_vars["Mon"] = Var(True)
+    gui.save()
+    assert not errors
+    saved = json.loads(path.read_text(encoding="utf-8"))
+    assert saved["threshold"] == 250 and saved["scan_strategy"]["days"] == ["Mon"]
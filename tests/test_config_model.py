@@ -0,0 +1,72 @@
+import json
+
+import config_model
+from config_model import AppConfig, load_config
+
+REPO_CONFIG = {
+    "threshold": 100,
+    "log_file": "enum_guardian_log.txt",
+    "monitored_devices": [
+        {"vid_pid": "VID045E&PID062A", "notify_threshold": 50},
+        {"vid_pid": "VID05C6&PID90B8", "notify_threshold": "fifty"},
+        {"vid_pid": "VID045E&PID062A", "notify_threshold": 30},
+        {"vid_pid": "not-a-device"},
+    ],
+}
+
+def write_config(tmp_path, data=REPO_CONFIG):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(data, indent=4, ensure_ascii=False), encoding="utf-8")
+    config_model._cache.clear()
+    return path
+
+def read_config(path):
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def test_repo_config_format_compiles(tmp_path):
+    app_config = load_config(str(write_config(tmp_path)))
+    assert list(app_config.devices) == ["045E062A", "05C690B8"]
+    assert app_config.devices["05C690B8"].notify_threshold == config_model.DEFAULT_NOTIFY_THRESHOLD
+
+def test_save_without_changes_does_not_write(tmp_path):
+    path = write_config(tmp_path)
+    app_config = load_config(str(path))
+    app_config.devices
+    assert not app_config.save()
+    assert read_config(path) == REPO_CONFIG
+
+def test_add_device_keeps_other_entries_and_unset_defaults(tmp_path):
+    path = write_config(tmp_path)
+    app_config = load_config(str(path))
+    assert app_config.add_device("VID_1234&PID_ABCD")
+    assert app_config.save()
+    saved = read_config(path)
+    assert saved["monitored_devices"] == REPO_CONFIG["monitored_devices"] + [
+        {"vid_pid": "1234ABCD", "notify_threshold": config_model.DEFAULT_NOTIFY_THRESHOLD}]
+    assert "scan_strategy" not in saved
+    assert set(saved) == set(REPO_CONFIG)
+
+def test_remove_device_drops_only_its_entries(tmp_path):
+    path = write_config(tmp_path)
+    app_config = load_config(str(path))
+    assert app_config.remove_devices(["045E:062A"]) == 1
+    app_config.save()
+    assert read_config(path)["monitored_devices"] == [
+        {"vid_pid": "VID05C6&PID90B8", "notify_threshold": "fifty"},
+        {"vid_pid": "not-a-device"},
+    ]
+
+def test_update_writes_only_changed_keys(tmp_path):
+    path = write_config(tmp_path)
+    app_config = load_config(str(path))
+    app_config.update(threshold=80)
+    app_config.save()
+    saved = read_config(path)
+    assert saved == {**REPO_CONFIG, "threshold": 80}
+
+def test_missing_file_saves_only_changes(tmp_path):
+    path = tmp_path / "config.json"
+    app_config = AppConfig(config_model.validate_config({}), str(path))
+    app_config.add_device("045E062A", 30)
+    app_config.save()
+    assert read_config(path) == {"monitored_devices": [{"vid_pid": "045E062A", "notify_threshold": 30}]}
@@ -0,0 +1,106 @@
+import time
+
+from device_table import DeviceTableModel, ScanWorker
+from registry_fixtures import generate_fixture
+
+def make_model():
+    model = DeviceTableModel()
+    model.load({"11112222": 50, "33334444": 10}, locked=["55556666"], usb_flags=["11112222", "77778888"])
+    model.apply_counts([("11112222", 3), ("33334444", 40), ("99990000", 7), ("11112222", 2)])
+    return model
+
+def test_load_merges_sources():
+    model = make_model()
+    assert sorted(model.view) == ["11112222", "33334444", "55556666", "77778888", "99990000"]
+    row = model.row("11112222")
+    # 同一 VID/PID 的多個子鍵累加
+    assert (row.instances, row.threshold, row.locked, row.usb_flags) == (5, 50, False, True)
+    assert model.row("55556666").values() == ("55556666", "", "", "是", "")
+    model.begin_scan()
+    assert model.row("11112222").instances is None
+
+def test_filter():
+    model = make_model()
+    model.set_filter(" 3333 ")
+    assert model.view == ["33334444"]
+    model.set_filter("xyz")
+    assert model.view == [] and len(model) == 0
+    model.set_filter("")
+    assert len(model) == 5
+
+def test_sort_keeps_missing_values_last():
+    model = make_model()
+    model.sort_by("instances")
+    # 數值欄位第一次點選為由大到小
+    assert model.view == ["33334444", "99990000", "11112222", "55556666", "77778888"]
+    model.sort_by("instances")
+    assert model.view == ["11112222", "99990000", "33334444", "55556666", "77778888"]
+    model.sort_by("threshold")
+    assert model.view == ["11112222", "33334444", "55556666", "77778888", "99990000"]
+    model.sort_by("vid_pid")
+    assert model.view == sorted(model.view)
+    model.sort_by("vid_pid")
+    assert model.view == sorted(model.view, reverse=True)
+
+def test_page_and_clamp_offset():
+    model = DeviceTableModel()
+    model.apply_counts((f"0000{i:04X}", i) for i in range(10))
+    assert [row.vid_pid for row in model.page(8, 5)] == ["00000008", "00000009"]
+    assert [row.vid_pid for row in model.page(-3, 2)] == ["00000000", "00000001"]
+    assert model.clamp_offset(9, 4) == 6
+    assert model.clamp_offset(-1, 4) == 0
+    # 列數少於可見列數
+    assert model.clamp_offset(3, 20) == 0
+
+def test_select_visible_keeps_hidden_selection():
+    model = make_model()
+    model.select_visible(["11112222", "33334444"], ["11112222", "33334444"])
+    model.select_visible(["33334444", "99990000"], ["99990000"])
+    assert model.selected == {"11112222", "99990000"}
+    # 只有在監控清單中的列可以刪除
+    assert model.selected_monitored() == ["11112222"]
+
+def collect(worker, timeout: float = 5.0) -> list[tuple]:
+    worker.join(timeout)
+    assert not worker.running
+    return worker.poll()
+
+def test_scan_worker_events(registry):
+    fixture = generate_fixture(vidpids=120, max_instances=20, seed=3, registry=registry)
+    worker = ScanWorker(workers=4, batch_size=25)
+    worker.start()
+    events = collect(worker)
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "usb_flags" and kinds[-1] == "done" and set(kinds[1:-1]) == {"counts"}
+    assert events[0][1] == set(fixture["ignored"])
+    counts = {}
+    for kind, batch in events[1:-1]:
+        assert len(batch) <= 25
+        for vidpid, count in batch:
+            counts[vidpid] = counts.get(vidpid, 0) + count
+    assert counts == fixture["counts"]
+    assert events[-1][1]["devices"] == 120 and events[-1][1]["cancelled"] is False
+
+def test_scan_worker_cancel_does_not_wait_for_queued_keys(registry, monkeypatch):
+    generate_fixture(vidpids=800, max_instances=2, seed=3, registry=registry)
+    open_key = registry.OpenKey
+
+    def slow_open(key, sub_key, *args):
+        # 只有開啟裝置鍵時延遲 10ms：完整查詢 800 個裝置鍵（4 個執行緒）約需 2 秒
+        if sub_key.startswith("VID_"):
+            time.sleep(0.01)
+        return open_key(key, sub_key, *args)
+
+    monkeypatch.setattr(registry, "OpenKey", slow_open)
+    worker = ScanWorker(workers=4, batch_size=1)
+    worker.start()
+    kind, _ = worker.events.get(timeout=5)
+    assert kind == "usb_flags"
+    kind, _ = worker.events.get(timeout=5)
+    assert kind == "counts"
+    start = time.perf_counter()
+    worker.cancel()
+    events = collect(worker)
+    assert time.perf_counter() - start < 0.5
+    done = events[-1]
+    assert done[0] == "done" and done[1]["cancelled"] is True and done[1]["devices"] < 800
@@ -0,0 +1,105 @@
+import json
+
+from registry_fixtures import ENUM_USB
+
+def test_pipeline_writes_usb_flags_before_deleting(auto_run):
+    configure, registry, fixture = auto_run
+    configure(pipeline={"enabled": True, "workers": 4}).run_once()
+    offenders = [vidpid for vidpid, count in fixture["counts"].items() if count >= 30]
+    assert offenders
+    for vidpid in offenders:
+        subkey = f"VID_{vidpid[:4]}&PID_{vidpid[4:]}"
+        flag = registry.events.index(("flag", f"IgnoreHWSerNum{vidpid}"))
+        first_delete = next(i for i, (kind, path) in enumerate(registry.events)
+                            if kind == "delete" and path.startswith(f"{subkey}\\"))
+        assert flag < first_delete, vidpid
+        assert not registry.exists(f"{ENUM_USB}\\{subkey}\\00000000")
+
+def test_growth_history_is_opt_in(auto_run, tmp_path):
+    configure, _, _ = auto_run
+    configure().run_once()
+    assert not (tmp_path / "growth_history.db").exists()
+
+def test_prediction_uses_threshold_not_notify_threshold(auto_run, tmp_path):
+    from growth_history import GrowthHistory
+
+    configure, registry, fixture = auto_run
+    below = sorted((count, vidpid) for vidpid, count in fixture["counts"].items() if count < 30)
+    slow, fast = below[-1][1], below[-2][1]
+    now = __import__("time").time()
+    with GrowthHistory(str(tmp_path / "growth_history.db")) as history:
+        # slow 每小時 +0.01（不會在下次執行前達到 threshold），fast 每小時 +1（24 小時內超過）
+        for i in range(3, 0, -1):
+            history.record_run({slow: fixture["counts"][slow] - i}, now - i * 100 * 3600)
+            history.record_run({fast: fixture["counts"][fast] - 10 * i}, now - i * 10 * 3600)
+    run = configure(history={"enabled": True, "predictive": True},
+                    monitored_devices=[{"vid_pid": slow, "notify_threshold": 1}])
+    run.run_once()
+    assert registry.exists(f"{ENUM_USB}\\VID_{slow[:4]}&PID_{slow[4:]}\\00000000")
+    assert not registry.exists(f"{ENUM_USB}\\VID_{fast[:4]}&PID_{fast[4:]}\\00000000")
+
+def test_plan_matches_run_once(auto_run, tmp_path, monkeypatch):
+    configure, registry, fixture = auto_run
+    run = configure(monitored_devices=[{"vid_pid": "VID0000&PID0001", "notify_threshold": 50}])
+    answers = iter([True, False])
+    monkeypatch.setattr(run, "should_clean_comdb_today", lambda: next(answers))
+    plan = run.make_plan(str(tmp_path / "plan.json"))
+    assert plan["comdb"]["action"] == "reconcile"
+
+    offenders = sorted(vidpid for vidpid, count in fixture["counts"].items() if count >= 30)
+    assert sorted(entry["vid_pid"] for entry in plan["cleanup"]) == offenders
+    assert sorted(plan["monitored_add"]) == sorted(vidpid for vidpid in offenders if vidpid != "00000001")
+    assert sorted(plan["usb_flags"]["add"]) == sorted(set(offenders) | {"00000001"})
+
+    # 計畫產生後才變動的項目略過刪除，但 UsbFlags 與監控清單仍依計畫寫入
+    changed = plan["cleanup"][0]
+    registry.add_key(f"{ENUM_USB}\\{next(iter(changed['subkeys']))}\\NEWINST")
+    result = run.run_plan(str(tmp_path / "plan.json"))
+    assert [item["vid_pid"] for item in result["skipped"]] == [changed["vid_pid"]]
+    flags = {name for kind, name in registry.events if kind == "flag"}
+    assert {f"IgnoreHWSerNum{vidpid}" for vidpid in plan["usb_flags"]["add"]} <= flags
+    saved = json.loads((tmp_path / "config.json").read_text(encoding="utf-8"))["monitored_devices"]
+    assert [item["vid_pid"] for item in saved] == ["VID0000&PID0001"] + plan["monitored_add"]
+
+def test_daemon_does_not_reload_after_own_save(auto_run, tmp_path, caplog):
+    import datetime
+
+    configure, _, _ = auto_run
+    run = configure(scan_strategy={"enabled": True, "mode": "daily", "times": ["12:00", "13:00"], "tolerance": 60})
+    now = [datetime.datetime(2026, 1, 1, 11, 0)]
+
+    def sleep(seconds):
+        now[0] += datetime.timedelta(seconds=seconds)
+        if now[0] == datetime.datetime(2026, 1, 1, 12, 30):
+            # 兩次執行之間由外部修改 config.json
+            data = json.loads((tmp_path / "config.json").read_text(encoding="utf-8"))
+            data["threshold"] = 35
+            (tmp_path / "config.json").write_text(json.dumps(data), encoding="utf-8")
+
+    with caplog.at_level("INFO"):
+        assert run.run_daemon(clock=lambda: now[0], sleep=sleep, max_runs=2) == 2
+    saved = json.loads((tmp_path / "config.json").read_text(encoding="utf-8"))
+    assert saved["threshold"] == 35 and saved["monitored_devices"]
+    assert caplog.text.count("config.json 已變更") == 1
+    assert run.AUTO_THRESHOLD == 35
+
+def test_existing_device_growing_during_run_is_rechecked(auto_run, monkeypatch):
+    configure, registry, fixture = auto_run
+    below = max((count, vidpid) for vidpid, count in fixture["counts"].items() if count < 30)[1]
+    subkey = f"VID_{below[:4]}&PID_{below[4:]}"
+    delete_key = registry.DeleteKey
+
+    def delete_and_grow(key, sub_key):
+        # 第一次刪除時，未超標的既有裝置鍵底下新增實例（根鍵 LastWriteTime 不變）
+        if not registry.exists(f"{ENUM_USB}\\{subkey}\\GROW0000"):
+            for i in range(30):
+                registry.add_key(f"{ENUM_USB}\\{subkey}\\GROW{i:04X}")
+        return delete_key(key, sub_key)
+
+    monkeypatch.setattr(registry, "DeleteKey", delete_and_grow)
+    configure().run_once()
+    assert registry.exists(f"{ENUM_USB}\\{subkey}")
+    assert not registry.exists(f"{ENUM_USB}\\{subkey}\\GROW0000")
+    assert not registry.exists(f"{ENUM_USB}\\{subkey}\\00000000")
+    report = json.loads(open("verify_report.json", encoding="utf-8").read())
+    assert next(item for item in report if item["vid_pid"] == below)["residual"] == 0
@@ -0,0 +1,57 @@
+from enum_index import EnumIndex, load_scan_cache
+from registry_fixtures import ENUM_USB, generate_fixture
+
+class GuardedDevices(dict):
+    """模擬其他執行緒正在修改索引：iterable 為 False 時禁止走訪"""
+    iterable = True
+
+    def values(self):
+        assert self.iterable, "scan() 在產生紀錄後走訪了共用的索引"
+        return super().values()
+
+    def items(self):
+        assert self.iterable, "scan() 在產生紀錄後走訪了共用的索引"
+        return super().items()
+
+def test_scan_does_not_walk_index_after_yielding(registry):
+    fixture = generate_fixture(vidpids=50, max_instances=20, seed=2, registry=registry)
+    index = EnumIndex()
+    index.devices = GuardedDevices()
+    count = 0
+    for record in index.scan():
+        # 管線模式下取得紀錄後清理執行緒即可能修改索引
+        index.devices.iterable = False
+        count += record.instance_count
+    index.devices.iterable = True
+    assert count == fixture["total_instances"] == index.total_instances()
+
+def test_scan_cache_reuses_instances_but_queries_every_device_key(registry, tmp_path):
+    fixture = generate_fixture(vidpids=30, max_instances=10, seed=4, registry=registry)
+    index = EnumIndex.build()
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, index.enum_path) as root:
+        for vidpid in list(index.devices):
+            index.instance_paths(root, vidpid)
+    cache_file = str(tmp_path / "scan_cache.json")
+    index.save_cache(cache_file)
+
+    # 新增實例只會更新裝置鍵的 LastWriteTime，根鍵不變
+    vidpid, subkey = next(iter(fixture["counts"])), fixture["subkeys"][0]
+    root_last_write = index.root_last_write
+    registry.add_key(f"{ENUM_USB}\\{subkey}\\NEW0001")
+    registry.set_last_write(f"{ENUM_USB}\\{subkey}", index.devices[vidpid][subkey].last_write + 1)
+
+    registry.ops.clear()
+    cached = EnumIndex.build(cache=load_scan_cache(cache_file))
+    assert cached.root_last_write == root_last_write
+    # 子鍵清單沿用快取（根鍵不 EnumKey），但每個裝置鍵都查詢一次，才會發現新增的實例
+    assert registry.ops["EnumKey"] == 0
+    assert registry.ops["QueryInfoKey"] == len(fixture["subkeys"]) + 1
+    assert (cached.cache_hits, cached.cache_misses) == (len(fixture["subkeys"]) - 1, 1)
+    assert cached.instance_count(vidpid) == fixture["counts"][vidpid] + 1
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, cached.enum_path) as root:
+        registry.ops.clear()
+        assert f"{subkey}\\NEW0001" in cached.instance_paths(root, vidpid)
+        for other in fixture["counts"]:
+            if other != vidpid:
+                cached.instance_paths(root, other)
+    assert registry.ops["EnumKey"] == fixture["counts"][vidpid] + 1
@@ -0,0 +1,22 @@
+from growth_history import GrowthHistory, estimate_rate, predict_offenders
+
+HOUR = 3600
+
+def test_estimate_rate_uses_samples_after_last_drop():
+    points = [(0, 10), (HOUR, 40), (2 * HOUR, 5), (3 * HOUR, 7), (4 * HOUR, 9), (5 * HOUR, 11)]
+    assert estimate_rate(points) == 2.0
+    assert estimate_rate(points[:4]) is None
+
+def test_predict_only_devices_below_limit():
+    counts = {"AAAA0001": 95, "AAAA0002": 120, "AAAA0003": 60, "AAAA0004": 99}
+    rates = {"AAAA0001": 1.0, "AAAA0002": 5.0, "AAAA0003": 1.0, "AAAA0004": -1.0}
+    limits = dict.fromkeys(counts, 100)
+    assert predict_offenders(counts, rates, limits, 24) == [("AAAA0001", 95, 119.0)]
+    assert predict_offenders(counts, rates, limits, 24, locked_list={"AAAA0001"}) == []
+
+def test_history_rates(tmp_path):
+    with GrowthHistory(str(tmp_path / "history.db")) as history:
+        for i in range(4):
+            history.record_run({"AAAA0001": 10 + 3 * i, "AAAA0002": 50}, when=1_000_000 + i * HOUR)
+        rates = history.growth_rates(now=1_000_000 + 4 * HOUR)
+    assert rates == {"AAAA0001": 3.0, "AAAA0002": 0.0}
@@ -0,0 +1,78 @@
+import json
+import os
+
+from lock_list_store import LockListStore, get_lock_list_store
+
+def write_lock_list(path, locked, mtime_offset: int = 0) -> None:
+    path.write_text(json.dumps({"locked": locked}), encoding="utf-8")
+    # 確保 mtime 與前一次不同（檔案系統時間解析度可能較粗）
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + mtime_offset * 1_000_000_000))
+
+def journal_lines(store) -> list[str]:
+    with open(store.journal_file, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+def test_add_appends_to_journal(tmp_path):
+    path = tmp_path / "lock_list.json"
+    write_lock_list(path, ["11112222"])
+    store = LockListStore(str(path))
+    assert "11112222" in store
+    assert store.add("33334444") and not store.add("33334444") and not store.add("11112222")
+    assert journal_lines(store) == ["33334444"]
+    assert json.loads(path.read_text(encoding="utf-8")) == {"locked": ["11112222"]}
+    # 另一個行程（新的 store）讀得到 journal 中的項目
+    assert LockListStore(str(path)).locked() == {"11112222", "33334444"}
+
+def test_reload_after_external_edit(tmp_path):
+    path = tmp_path / "lock_list.json"
+    write_lock_list(path, ["11112222"])
+    store = LockListStore(str(path))
+    first = store.locked()
+    assert store.locked() is first  # 檔案未變動時沿用快取
+    write_lock_list(path, ["55556666", "77778888"], mtime_offset=1)
+    assert store.locked() == {"55556666", "77778888"}
+    assert "11112222" not in store
+    path.unlink()
+    assert len(store) == 0
+
+def test_compaction(tmp_path):
+    path = tmp_path / "lock_list.json"
+    write_lock_list(path, ["11112222"])
+    store = LockListStore(str(path), compact_threshold=4)
+    added = [f"0000{i:04X}" for i in range(5)]
+    for vidpid in added[:3]:
+        store.add(vidpid)
+    assert journal_lines(store) == added[:3]
+    store.add(added[3])
+    # 達到門檻時合併回 lock_list.json（依加入順序）並刪除 journal
+    assert not os.path.exists(store.journal_file)
+    assert not os.path.exists(f"{path}.tmp")
+    assert json.loads(path.read_text(encoding="utf-8")) == {"locked": ["11112222"] + added[:4]}
+    store.add(added[4])
+    assert journal_lines(store) == [added[4]]
+    assert LockListStore(str(path)).locked() == {"11112222", *added}
+
+def test_compaction_keeps_corrupt_lock_list(tmp_path):
+    path = tmp_path / "lock_list.json"
+    path.write_text("{broken", encoding="utf-8")
+    store = LockListStore(str(path), compact_threshold=1)
+    store.add("11112222")
+    assert path.read_text(encoding="utf-8") == "{broken"
+    assert journal_lines(store) == ["11112222"]
+
+def test_torn_journal_line_is_ignored_and_truncated(tmp_path):
+    path = tmp_path / "lock_list.json"
+    write_lock_list(path, [])
+    with open(f"{path}.journal", "w", encoding="utf-8") as f:
+        f.write("11112222\n3333")
+    store = LockListStore(str(path))
+    assert store.locked() == {"11112222"}
+    store.add("55556666")
+    # 半行被截掉，新項目獨立成一行
+    assert journal_lines(store) == ["11112222", "55556666"]
+    assert LockListStore(str(path)).locked() == {"11112222", "55556666"}
+
+def test_store_is_shared_per_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert get_lock_list_store("lock_list.json") is get_lock_list_store(str(tmp_path / "lock_list.json"))
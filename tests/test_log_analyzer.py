@@ -0,0 +1,184 @@
+import json
+import logging
+from collections import Counter
+
+import pytest
+
+from log_analyzer import _ChunkParser, _KEY_LINE_PATTERN, analyse_logs, split_line_chunks, detect_log_encoding
+
+START = "====== EnumGuardian Auto Scan & Cleanup Started ======"
+FINISHED = "====== 全部流程執行完畢 ======"
+
+def stamp(second: int, ms: int = 0) -> str:
+    return f"2026-01-01 10:{second // 60:02d}:{second % 60:02d},{ms:03d}"
+
+def key_lines(subkey: str, count: int, second: int) -> list[str]:
+    return [f"[{stamp(second, i % 1000)}] [Cleaner] 已刪除 ENUM 註冊表項目: {subkey}\\{i:08X}" for i in range(count)]
+
+def run_lines(second: int, devices: dict, interleave: bool = False) -> list[str]:
+    """一次執行的 text log：devices 為 {子鍵: 刪除的實例數}"""
+    lines = [f"[{stamp(second)}] [AUTO] {START}",
+             f"[{stamp(second + 1)}] [AUTO] 本次掃描共偵測到 {len(devices)} 個裝置項目"]
+    for subkey, count in devices.items():
+        vidpid = subkey.replace("VID_", "").replace("&PID_", "")[:8]
+        lines.append(f"[{stamp(second + 1)}] [Monitor] 偵測到 {vidpid} 子鍵數量 {count}，超過門檻 30")
+    blocks = [key_lines(subkey, count, second + 2) for subkey, count in devices.items()]
+    if interleave:
+        for group in zip(*blocks):
+            lines.extend(group)
+    else:
+        for block in blocks:
+            lines.extend(block)
+    for subkey, count in devices.items():
+        vidpid = subkey.replace("VID_", "").replace("&PID_", "")[:8]
+        lines.append(f"[{stamp(second + 3)}] [Cleaner] {vidpid} 共刪除 {count * 5} 個註冊表鍵（{count}/{count} 個裝置實例），失敗 0 項")
+    lines += [f"[{stamp(second + 4)}] [AUTO] 本次清理完成，共處理 {len(devices)} 項，跳過 0 項",
+              f"[{stamp(second + 5)}] [AUTO] {FINISHED}"]
+    return lines
+
+def analyse(paths, **kwargs):
+    runs = []
+    aggregator, stats = analyse_logs([str(path) for path in paths], on_run=runs.append, workers=1, **kwargs)
+    return aggregator, stats, runs
+
+def test_text_log_runs_and_vidpids(tmp_path):
+    path = tmp_path / "enum_guardian_log.txt"
+    lines = run_lines(0, {"VID_1111&PID_2222": 40, "VID_3333&PID_4444": 35}) + run_lines(60, {"VID_1111&PID_2222": 31})
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    aggregator, stats, runs = analyse([path])
+    assert [(run["status"], run["offenders"], run["cleaned"], run["instances_deleted"], run["keys_deleted"]) for run in runs] == \
+        [("completed", 2, 2, 75, 375), ("completed", 1, 1, 31, 155)]
+    assert runs[0]["start"] == "2026-01-01 10:00:00.000" and runs[0]["seconds"] == 5.0
+    stats_1111 = aggregator.vidpids["11112222"]
+    assert (stats_1111["cleaned_runs"], stats_1111["instances_deleted"], stats_1111["max_instances"]) == (2, 71, 40)
+    assert aggregator.run_summary()["status"] == {"completed": 2}
+    assert stats["encodings"] == {str(path): "utf-8"}
+
+def test_run_split_across_chunks(tmp_path):
+    path = tmp_path / "enum_guardian_log.txt"
+    lines = run_lines(0, {"VID_1111&PID_2222": 300, "VID_3333&PID_4444&MI_00": 120}) + run_lines(60, {"VID_5555&PID_6666": 50})
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _, whole, expected = analyse([path])
+    aggregator, stats, runs = analyse([path], chunk_bytes=2000)
+    assert stats["chunks"] > 10
+    assert runs == expected
+    assert [run["instances_deleted"] for run in runs] == [420, 50]
+    assert aggregator.vidpids["33334444"]["instances_deleted"] == 120
+    assert stats["event_lines"] == whole["event_lines"]
+
+def test_interleaved_device_key_lines(tmp_path):
+    path = tmp_path / "enum_guardian_log.txt"
+    devices = {"VID_1111&PID_2222": 200, "VID_1111&PID_2222&MI_00": 200, "VID_3333&PID_4444": 200}
+    path.write_text("\n".join(run_lines(0, devices, interleave=True)) + "\n", encoding="utf-8")
+    aggregator, _, runs = analyse([path])
+    assert runs[0]["instances_deleted"] == 600
+    assert aggregator.vidpids["11112222"]["instances_deleted"] == 400
+    assert aggregator.vidpids["33334444"]["instances_deleted"] == 200
+
+@pytest.mark.parametrize("interleave", [False, True])
+def test_count_key_lines_matches_findall(interleave):
+    # 連續區塊遠大於 KEY_BLOCK_WINDOW，需要倍增視窗；&MI_00 與主裝置鍵不可混淆
+    devices = {"VID_1111&PID_2222": 500, "VID_1111&PID_2222&MI_00": 500, "USBSTOR\\Disk&Ven_A&Prod_B": 500}
+    text = "\n".join(run_lines(0, devices, interleave=interleave)) + "\n"
+    counts = _ChunkParser._count_key_lines(text, 0, len(text))
+    assert counts == Counter(_KEY_LINE_PATTERN.findall(text))
+    assert dict(counts) == devices
+
+def test_timestamp_offsets(tmp_path):
+    path = tmp_path / "enum_guardian_log.txt"
+    # 沒有時間前綴的行（例如例外追蹤）不影響固定寬度的時間截取
+    lines = run_lines(0, {"VID_1111&PID_2222": 3})
+    lines.insert(3, "Traceback (most recent call last): ] [AUTO] 執行失敗：假的行")
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _, _, runs = analyse([path])
+    assert (runs[0]["start"], runs[0]["end"]) == ("2026-01-01 10:00:00.000", "2026-01-01 10:00:05.000")
+    assert runs[0]["errors"] == 0
+
+def test_json_lines_log(tmp_path):
+    path = tmp_path / "enum_guardian_log.txt"
+    entries = []
+    for line in run_lines(0, {"VID_1111&PID_2222": 4}):
+        timestamp, message = line[1:24], line[26:]
+        entries.append({"t": timestamp.replace(" ", "T").replace(",", "."), "lvl": "INFO", "msg": message})
+    path.write_text("\n".join(json.dumps(entry, ensure_ascii=False) for entry in entries) + "\n", encoding="utf-8")
+    aggregator, stats, runs = analyse([path])
+    assert stats["encodings"] == {str(path): "utf-8 json"}
+    assert [(run["status"], run["instances_deleted"], run["keys_deleted"], run["seconds"]) for run in runs] == \
+        [("completed", 4, 20, 5.0)]
+
+def wrapper_log(lines: list[str]) -> bytes:
+    text = "[2026/01/01 週四  9:59:59.50] Starting enum_auto_run.exe\r\n" + "\r\n".join(lines) + \
+           "\r\n[2026/01/01 週四 10:00:06.25] Ended\r\n"
+    return text.encode("cp950")
+
+def test_cp950_wrapper_log(tmp_path):
+    path = tmp_path / "EnumGuardian.log"
+    path.write_bytes(wrapper_log(run_lines(0, {"VID_1111&PID_2222": 40})))
+    assert detect_log_encoding(path.read_bytes()) == ("cp950", 0)
+    aggregator, stats, runs = analyse([path])
+    assert stats["encodings"] == {str(path): "cp950"}
+    assert len(runs) == 1
+    run = runs[0]
+    # 執行範圍以批次檔的 Starting/Ended 為準
+    assert (run["start"], run["end"], run["status"]) == ("2026-01-01 09:59:59.500", "2026-01-01 10:00:06.250", "completed")
+    assert run["instances_deleted"] == 40 and run["keys_deleted"] == 200
+
+def test_wrapper_without_program_output(tmp_path):
+    path = tmp_path / "EnumGuardian.log"
+    path.write_bytes(wrapper_log([]))
+    _, _, runs = analyse([path])
+    assert [run["status"] for run in runs] == ["no_output"]
+
+def test_same_run_in_both_logs_is_counted_once(tmp_path):
+    lines = run_lines(0, {"VID_1111&PID_2222": 40})
+    main_log = tmp_path / "enum_guardian_log.txt"
+    main_log.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    wrapper = tmp_path / "EnumGuardian.log"
+    wrapper.write_bytes(wrapper_log(lines))
+    aggregator, _, runs = analyse([main_log, wrapper])
+    assert len(runs) == 1
+    assert aggregator.duplicates == 1
+    assert aggregator.vidpids["11112222"]["instances_deleted"] == 40
+    assert aggregator.vidpids["11112222"]["cleaned_runs"] == 1
+
+def test_aggregated_summary_from_log_pipeline(registry, tmp_path, monkeypatch):
+    from cleaner import clean_enum_for_vidpid
+    from log_pipeline import LogPipeline
+    from registry_fixtures import build_device
+
+    monkeypatch.chdir(tmp_path)
+    build_device(registry, "VID_1111&PID_2222", 12)
+    build_device(registry, "VID_3333&PID_4444", 7)
+    path = tmp_path / "enum_guardian_log.txt"
+    root = logging.getLogger()
+    level = root.level
+    pipeline = LogPipeline(str(path), flush_interval=0)
+    root.addHandler(pipeline)
+    root.setLevel(logging.INFO)
+    try:
+        logging.info(f"[AUTO] {START}")
+        logging.info("[AUTO] 本次掃描共偵測到 2 個裝置項目")
+        clean_enum_for_vidpid("11112222")
+        clean_enum_for_vidpid("33334444")
+        logging.info("[AUTO] 本次清理完成，共處理 2 項，跳過 0 項")
+        logging.info(f"[AUTO] {FINISHED}")
+    finally:
+        root.removeHandler(pipeline)
+        root.setLevel(level)
+        pipeline.close()
+
+    text = path.read_text(encoding="utf-8")
+    # 逐鍵紀錄被彙總成一行
+    assert "已刪除 ENUM 註冊表項目：11112222 共 12 項" in text
+    assert "已刪除 ENUM 註冊表項目: " not in text
+    aggregator, _, runs = analyse([path])
+    assert [(run["status"], run["instances_deleted"], run["keys_deleted"]) for run in runs] == [("completed", 19, 95)]
+    assert aggregator.vidpids["11112222"]["instances_deleted"] == 12
+    assert aggregator.vidpids["33334444"]["keys_deleted"] == 35
+
+def test_split_line_chunks_end_on_newlines():
+    data = b"".join(f"line {i}\n".encode() for i in range(100))
+    chunks = split_line_chunks(data, 0, 50)
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(data)
+    assert all(data[end - 1:end] == b"\n" for _, end in chunks)
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
@@ -0,0 +1,145 @@
+import io
+import json
+import logging
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import log_pipeline
+from log_pipeline import LogPipeline, RotatingLogFile, install_pipeline
+
+@pytest.fixture
+def logger():
+    """獨立的 logger，避免影響 root 與 pytest 的 handler"""
+    logger = logging.getLogger("test_log_pipeline")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    yield logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+def read_lines(path) -> list[str]:
+    with open(path, encoding="utf-8") as f:
+        return f.read().splitlines()
+
+def test_size_rotation_splits_on_line_boundaries(tmp_path):
+    path = str(tmp_path / "guardian.log")
+    log_file = RotatingLogFile(path, "size", max_bytes=100, backup_count=2)
+    lines = [f"line {i:03d} ".ljust(29, "x") + "\n" for i in range(20)]
+    for start in range(0, 20, 4):
+        log_file.write("".join(lines[start:start + 4]).encode("utf-8"))
+    log_file.close()
+    assert log_file.rotations >= 4
+    assert not os.path.exists(f"{path}.3")
+    kept = read_lines(f"{path}.2") + read_lines(f"{path}.1") + read_lines(path)
+    # 只保留最新的檔案，每行完整且順序不變
+    assert kept == [line.rstrip("\n") for line in lines[-len(kept):]]
+    for name in (path, f"{path}.1", f"{path}.2"):
+        assert os.path.getsize(name) <= 100
+
+def test_daily_rotation_renames_by_date_and_prunes(tmp_path):
+    path = tmp_path / "guardian.log"
+    path.write_text("old\n", encoding="utf-8")
+    yesterday = date.today() - timedelta(days=1)
+    stamp = (yesterday - date(1970, 1, 1)).days * 86400 + 43200
+    os.utime(path, (stamp, stamp))
+    for days in (5, 4, 3):
+        (tmp_path / f"guardian.log.{date.today() - timedelta(days=days)}").write_text("", encoding="utf-8")
+    log_file = RotatingLogFile(str(path), "daily", backup_count=2)
+    log_file.write(b"new\n")
+    log_file.close()
+    assert read_lines(path) == ["new"]
+    assert read_lines(f"{path}.{yesterday}") == ["old"]
+    dated = sorted(name for name in os.listdir(tmp_path) if name.startswith("guardian.log."))
+    assert dated == [f"guardian.log.{date.today() - timedelta(days=3)}", f"guardian.log.{yesterday}"]
+
+def test_invalid_options_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        RotatingLogFile(str(tmp_path / "a.log"), "weekly")
+    with pytest.raises(ValueError):
+        LogPipeline(str(tmp_path / "a.log"), fmt="xml")
+
+def test_json_lines_output(tmp_path, logger):
+    path = tmp_path / "guardian.log"
+    pipeline = LogPipeline(str(path), fmt="json", flush_interval=0)
+    logger.addHandler(pipeline)
+    logger.info("[AUTO] 開始 %s", "掃描")
+    logger.warning("[Cleaner] 完成", extra={"vid_pid": "11112222", "count": 3})
+    try:
+        raise RuntimeError("boom")
+    except RuntimeError:
+        logger.exception("[AUTO] 失敗")
+    pipeline.close()
+    entries = [json.loads(line) for line in read_lines(path)]
+    assert [entry["msg"] for entry in entries] == ["[AUTO] 開始 掃描", "[Cleaner] 完成", "[AUTO] 失敗"]
+    assert [entry["lvl"] for entry in entries] == ["INFO", "WARNING", "ERROR"]
+    assert entries[1]["vid_pid"] == "11112222" and entries[1]["count"] == 3
+    assert "RuntimeError: boom" in entries[2]["exc"]
+    assert "vid_pid" not in entries[0]
+
+def test_aggregates_per_vidpid(tmp_path, logger):
+    path = tmp_path / "guardian.log"
+    stream = io.StringIO()
+    pipeline = LogPipeline(str(path), stream=stream, flush_interval=0)
+    logger.addHandler(pipeline)
+    label = "[Cleaner] 已刪除 ENUM 註冊表項目"
+    for vidpid, items in (("11112222", ["a\\1", "a\\2", "a\\3"]), ("33334444", ["b\\1"])):
+        for item in items:
+            logger.info(f"{label}: {item}", extra={"vid_pid": vidpid, "aggregate": label, "item": item})
+    logger.info("[Cleaner] 11112222 共刪除 15 個註冊表鍵", extra={"vid_pid": "11112222"})
+    logger.info("[AUTO] 結束")
+    pipeline.close()
+    lines = [line.split("] ", 1)[1] for line in read_lines(path)]
+    # 同一 VID/PID 的下一筆一般紀錄前輸出彙總，其餘在結束時輸出
+    assert lines == [f"{label}：11112222 共 3 項（a\\1 … a\\3）",
+                     "[Cleaner] 11112222 共刪除 15 個註冊表鍵",
+                     "[AUTO] 結束",
+                     f"{label}：33334444 共 1 項（b\\1）"]
+    assert stream.getvalue().splitlines() == read_lines(path)
+    assert pipeline.stats["aggregated"] == 4 and pipeline.stats["records"] == 6
+
+def test_aggregate_disabled_writes_every_record(tmp_path, logger):
+    path = tmp_path / "guardian.log"
+    pipeline = LogPipeline(str(path), aggregate=False, flush_interval=0)
+    logger.addHandler(pipeline)
+    for i in range(3):
+        logger.info(f"item {i}", extra={"vid_pid": "11112222", "aggregate": "label", "item": str(i)})
+    pipeline.close()
+    assert [line.split("] ", 1)[1] for line in read_lines(path)] == ["item 0", "item 1", "item 2"]
+
+def test_flush_writes_pending_records_and_summaries(tmp_path, logger):
+    path = tmp_path / "guardian.log"
+    pipeline = LogPipeline(str(path), flush_interval=10)
+    logger.addHandler(pipeline)
+    logger.info("first")
+    logger.info("x", extra={"vid_pid": "11112222", "aggregate": "label", "item": "k"})
+    pipeline.flush()
+    assert [line.split("] ", 1)[1] for line in read_lines(path)] == ["first", "label：11112222 共 1 項（k）"]
+    pipeline.close()
+
+def test_installed_pipeline_is_closed_at_exit(tmp_path, monkeypatch):
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    previous = (logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing)
+    registered = []
+    monkeypatch.setattr(log_pipeline, "_installed", None)
+    monkeypatch.setattr(log_pipeline.atexit, "register", registered.append)
+    path = tmp_path / "guardian.log"
+    try:
+        pipeline = install_pipeline(str(path), {"console": False, "flush_interval": 10})
+        assert pipeline in root.handlers
+        assert not any(type(handler) is logging.StreamHandler for handler in root.handlers)
+        root.warning("[AUTO] 結束前的紀錄")
+        # 行程結束時 atexit 寫完佇列
+        assert registered == [log_pipeline._close_installed]
+        registered[0]()
+        assert read_lines(path)[-1].endswith("[AUTO] 結束前的紀錄")
+        assert not pipeline._thread.is_alive()
+    finally:
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            root.addHandler(handler)
+        log_pipeline.restore_log_records(previous)
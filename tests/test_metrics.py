@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+import metrics
+
+@pytest.fixture
+def enabled():
+    metrics.enable()
+    yield metrics
+    metrics.disable()
+
+def test_repeated_vidpid_span_is_summed_once(enabled, tmp_path):
+    # 同一 VID/PID 在主流程與驗證階段各清理一次
+    for _ in range(2):
+        with metrics.span("cleanup", vidpid="11112222"):
+            pass
+    with metrics.span("cleanup", vidpid="33334444"):
+        pass
+    with metrics.span("verify"):
+        pass
+    metrics.inc("registry_keys_deleted", 5)
+    json_file, prom_file = tmp_path / "metrics.json", tmp_path / "metrics.prom"
+    metrics.write_metrics(str(json_file), str(prom_file))
+
+    data = json.loads(json_file.read_text(encoding="utf-8"))
+    spans = {(item["phase"], item["labels"].get("vidpid")): item for item in data["spans"]}
+    assert len(data["spans"]) == 3
+    assert spans[("cleanup", "11112222")]["count"] == 2
+    assert spans[("cleanup", "33334444")]["count"] == 1
+    assert data["counters"] == {"registry_keys_deleted": 5}
+
+    series = [line.rsplit(" ", 1)[0] for line in prom_file.read_text(encoding="utf-8").splitlines() if not line.startswith("#")]
+    assert len(series) == len(set(series))
+    assert not any("vidpid" in line for line in series)
+    cleanup_total = spans[("cleanup", "11112222")]["seconds"] + spans[("cleanup", "33334444")]["seconds"]
+    assert f'enum_guardian_phase_seconds{{phase="cleanup"}} {cleanup_total:.6f}' in prom_file.read_text(encoding="utf-8")
+
+def test_disabled_spans_are_not_recorded(tmp_path):
+    metrics.enable()
+    metrics.disable()
+    with metrics.span("cleanup", vidpid="11112222"):
+        pass
+    assert metrics.snapshot()["spans"] == []
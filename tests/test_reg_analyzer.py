@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+
+import config_model
+import reg_analyzer
+
+REPO_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.json")
+ENUM_USB_KEY = "HKEY_LOCAL_MACHINE\\SYSTEM\\CurrentControlSet\\Enum\\USB"
+USB_FLAGS_KEY = "HKEY_LOCAL_MACHINE\\SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
+
+def write_export(path, devices: dict, ignored=()):
+    """寫出與 reg export 相同格式（UTF-16LE + BOM）的匯出檔"""
+    lines = ["Windows Registry Editor Version 5.00", "", f"[{USB_FLAGS_KEY}]"]
+    lines += [f'"IgnoreHWSerNum{vidpid}"=hex:01' for vidpid in ignored]
+    for subkey, instances in devices.items():
+        lines += ["", f"[{ENUM_USB_KEY}\\{subkey}]"]
+        for i in range(instances):
+            lines += ["", f"[{ENUM_USB_KEY}\\{subkey}\\{i:08X}]", '"DeviceDesc"="USB Serial Device"']
+    path.write_bytes(b"\xff\xfe" + "\r\n".join(lines + [""]).encode("utf-16-le"))
+
+def repo_devices():
+    config_model._cache.clear()
+    return list(config_model.load_config(REPO_CONFIG).devices)
+
+def test_repo_config_devices_are_all_planned():
+    with open(REPO_CONFIG, encoding="utf-8") as f:
+        raw = json.load(f)["monitored_devices"]
+    monitored = repo_devices()
+    assert raw[0]["vid_pid"] == "VID045E&PID062A" and "045E062A" in monitored
+    assert len(monitored) == len({item["vid_pid"] for item in raw})
+
+    plan = reg_analyzer.build_cleanup_plan(reg_analyzer.build_index({}), ["IgnoreHWSerNum05C690B8"], 100, set(),
+                                           monitored)
+    assert len(plan["usb_flags_add"]) == len(monitored) - 1
+    assert "IgnoreHWSerNum045E062A" in plan["usb_flags_add"]
+    assert "IgnoreHWSerNum05C690B8" not in plan["usb_flags_add"]
+
+def test_main_uses_config_model(tmp_path, monkeypatch, capsys):
+    export = tmp_path / "Enum_USB.reg"
+    write_export(export, {"VID_1234&PID_5678": 5, "VID_045E&PID_062A": 1}, ignored=["05C690B8"])
+    monkeypatch.setattr(sys, "argv", ["reg_analyzer.py", str(export), "--config", REPO_CONFIG, "--threshold", "3",
+                                      "--lock-list", str(tmp_path / "lock_list.json"), "--workers", "1"])
+    config_model._cache.clear()
+    assert reg_analyzer.main() is None
+    report = json.loads(capsys.readouterr().out)
+    plan = report["plan"]
+    assert [item["vid_pid"] for item in plan["cleanup"]] == ["12345678"]
+    assert set(plan["usb_flags_add"]) == {f"IgnoreHWSerNum{vidpid}" for vidpid in repo_devices() + ["12345678"]
+                                          if vidpid != "05C690B8"}
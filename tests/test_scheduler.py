@@ -0,0 +1,74 @@
+from datetime import datetime
+
+import pytest
+
+from scheduler import CronExpression, Schedule, compile_schedule, should_execute_now
+
+def test_next_fire_daily_times():
+    schedule = Schedule({"enabled": True, "mode": "daily", "times": ["17:00", "08:30"]})
+    assert schedule.next_fire(datetime(2026, 1, 1, 8, 0)) == datetime(2026, 1, 1, 8, 30)
+    # 嚴格晚於 after
+    assert schedule.next_fire(datetime(2026, 1, 1, 8, 30)) == datetime(2026, 1, 1, 17, 0)
+    assert schedule.next_fire(datetime(2026, 1, 1, 17, 0)) == datetime(2026, 1, 2, 8, 30)
+
+def test_next_fire_weekly_days():
+    # 2026-01-01 為週四
+    schedule = Schedule({"enabled": True, "mode": "weekly", "time": "09:00", "days": ["mon", "Fri"]})
+    assert schedule.next_fire(datetime(2026, 1, 1, 10, 0)) == datetime(2026, 1, 2, 9, 0)
+    assert schedule.next_fire(datetime(2026, 1, 2, 9, 0)) == datetime(2026, 1, 5, 9, 0)
+
+def test_inactive_schedule_never_fires():
+    assert Schedule({"enabled": False, "mode": "daily"}).next_fire(datetime(2026, 1, 1)) is None
+    assert Schedule({"enabled": True, "mode": "manual"}).next_fire(datetime(2026, 1, 1)) is None
+    # 沒有任何星期可執行
+    assert Schedule({"enabled": True, "mode": "weekly", "days": []}).next_fire(datetime(2026, 1, 1)) is None
+
+def test_due_tolerance_and_min_interval():
+    schedule = Schedule({"enabled": True, "mode": "daily", "time": "12:00", "tolerance": 120, "min_interval_minutes": 60})
+    assert schedule.due(datetime(2026, 1, 1, 11, 58))
+    assert schedule.due(datetime(2026, 1, 1, 12, 2))
+    assert not schedule.due(datetime(2026, 1, 1, 12, 3))
+    assert not schedule.due(datetime(2026, 1, 1, 12, 0), last_run=datetime(2026, 1, 1, 11, 30))
+    assert schedule.due(datetime(2026, 1, 1, 12, 0), last_run=datetime(2026, 1, 1, 10, 30))
+    assert should_execute_now({"enabled": True, "mode": "daily", "time": "12:00"}, now=datetime(2026, 1, 1, 12, 1))
+    assert not should_execute_now({"enabled": True, "mode": "daily", "time": "12:00"}, now=datetime(2026, 1, 1, 13, 0))
+
+def test_cron_field_parsing():
+    cron = CronExpression("*/15 9-17/4 1,15 Jan-Mar Sun,7")
+    assert cron.minutes == {0, 15, 30, 45}
+    assert cron.hours == {9, 13, 17}
+    assert cron.days == {1, 15}
+    assert cron.months == {1, 2, 3}
+    assert cron.weekdays == {6}
+    assert cron.times[:2] == [(9, 0), (9, 15)]
+    assert CronExpression("0 0 * * 1-5").weekdays == {0, 1, 2, 3, 4}
+
+@pytest.mark.parametrize("expression", ["0 12 * *", "60 * * * *", "0 24 * * *", "0 0 0 * *", "0 0 * 13 *", "0 0 5-1 * *",
+                                        "0 0 * * Foo"])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+    assert compile_schedule({"enabled": True, "cron": expression}) is None
+
+def test_cron_day_and_weekday():
+    # 只限制星期：每週一
+    schedule = Schedule({"enabled": True, "cron": "0 12 * * Mon"})
+    assert schedule.next_fire(datetime(2026, 1, 1, 12, 0)) == datetime(2026, 1, 5, 12, 0)
+    # 日與星期都有限制時任一符合即可
+    schedule = Schedule({"enabled": True, "cron": "30 6 13 * Fri"})
+    assert schedule.next_fire(datetime(2026, 1, 1)) == datetime(2026, 1, 2, 6, 30)
+    assert schedule.next_fire(datetime(2026, 1, 12)) == datetime(2026, 1, 13, 6, 30)
+
+def test_cron_step_in_day_field_is_restricted():
+    # */2 不是 *，與星期欄位以「或」合併：奇數日或週一都會觸發
+    cron = CronExpression("0 12 */2 * Mon")
+    assert not cron.any_day
+    schedule = Schedule({"enabled": True, "cron": "0 12 */2 * Mon"})
+    assert schedule.next_fire(datetime(2026, 1, 1, 12, 0)) == datetime(2026, 1, 3, 12, 0)
+    # 1/12 為週一（偶數日）
+    assert schedule.next_fire(datetime(2026, 1, 11, 12, 0)) == datetime(2026, 1, 12, 12, 0)
+    assert schedule.next_fire(datetime(2026, 1, 12, 12, 0)) == datetime(2026, 1, 13, 12, 0)
+
+def test_cron_overrides_mode_and_searches_leap_years():
+    schedule = Schedule({"enabled": True, "mode": "manual", "time": "08:00", "cron": "0 0 29 2 *"})
+    assert schedule.next_fire(datetime(2026, 3, 1)) == datetime(2028, 2, 29, 0, 0)
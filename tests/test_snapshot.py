@@ -0,0 +1,54 @@
+from enum_index import EnumIndex, ENUM_USB_PATH
+from registry_fixtures import ENUM_USB, USB_FLAGS, build_device
+from snapshot import SnapshotReader, SnapshotWriter, restore_vidpid
+from cleaner import delete_enum_keys
+
+SUBKEY = "VID_1234&PID_5678"
+
+def presence(registry, index):
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_PATH) as root:
+        return {item.path: item.present for item in index.instance_details(root, "12345678")}
+
+def test_restore_keeps_presence(registry, tmp_path):
+    build_device(registry, SUBKEY, 4)
+    registry.add_key(USB_FLAGS)
+    registry.add_key(f"{ENUM_USB}\\{SUBKEY}\\00000001\\Control", {"ActiveService": ("usbser", registry.REG_SZ)})
+    index = EnumIndex.build(only={"12345678"})
+    before = presence(registry, index)
+    assert sum(before.values()) == 1
+
+    snapshot_file = str(tmp_path / "before.egsnap")
+    with SnapshotWriter(snapshot_file) as writer:
+        writer.write_vidpid(index, "12345678")
+    with SnapshotReader(snapshot_file) as snapshot:
+        paths = [path for group in snapshot.groups for path, _, _ in snapshot.records(group)]
+    assert paths and not any(path.endswith("\\Control") for path in paths)
+
+    # 清理刪除未接上的實例後還原，實例是否接上必須與清理前相同
+    absent = [path for path, present in before.items() if not present]
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_PATH, 0, registry.KEY_ALL_ACCESS) as root:
+        delete_enum_keys(root, absent)
+    assert restore_vidpid(snapshot_file, "12345678") > 0
+    assert presence(registry, EnumIndex.build(only={"12345678"})) == before
+
+    # 整個裝置鍵刪除（裝置已拔除，Control 隨之消失）後還原，不得把實例還原成目前接上
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_PATH, 0, registry.KEY_ALL_ACCESS) as root:
+        delete_enum_keys(root, [SUBKEY])
+    restore_vidpid(snapshot_file, "12345678")
+    assert presence(registry, EnumIndex.build(only={"12345678"})) == dict.fromkeys(before, False)
+
+def test_restore_skips_volatile_keys_from_old_snapshots(registry, tmp_path, monkeypatch):
+    import snapshot
+    build_device(registry, SUBKEY, 1)
+    registry.add_key(f"{ENUM_USB}\\{SUBKEY}\\00000000\\Control")
+    monkeypatch.setattr(snapshot, "VOLATILE_SUBKEYS", ())
+    snapshot_file = str(tmp_path / "old.egsnap")
+    with SnapshotWriter(snapshot_file) as writer:
+        writer.write_vidpid(EnumIndex.build(only={"12345678"}), "12345678")
+    monkeypatch.undo()
+
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, ENUM_USB_PATH, 0, registry.KEY_ALL_ACCESS) as root:
+        delete_enum_keys(root, [SUBKEY])
+    restore_vidpid(snapshot_file, "12345678")
+    assert registry.exists(f"{ENUM_USB}\\{SUBKEY}\\00000000\\Device Parameters")
+    assert not registry.exists(f"{ENUM_USB}\\{SUBKEY}\\00000000\\Control")
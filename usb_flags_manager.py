@@ -1,14 +1,16 @@
-import winreg
 import ctypes
 import logging
 from utils import normalize_vidpid
+from registry_backend import get_registry
 
 IGNORE_SERIAL_NUM = b'\x01'
+IGNORE_PREFIX = "IgnoreHWSerNum"
+USB_FLAGS_PATH = r"SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
 
 def format_ignore_key(vidpid: str) -> str:
     """將 VID/PID 轉為 Ignore 鍵名格式，會自動正規化"""
     vidpid = normalize_vidpid(vidpid)
-    return f"IgnoreHWSerNum{vidpid}"
+    return f"{IGNORE_PREFIX}{vidpid}"
 
 def prompt_user_add_ignore_key(formatted_key: str) -> bool:
     """跳出提示詢問是否加入 Ignore"""
@@ -19,6 +21,9 @@ def prompt_user_add_ignore_key(formatted_key: str) -> bool:
 
 def add_ignore_key_to_registry(vidpid: str, auto=True) -> bool:
     """將特定 VID/PID 加入 UsbFlags 註冊表 Ignore 項目"""
+    if len(normalize_vidpid(vidpid)) != 8:
+        logging.debug(f"[UsbFlags] {vidpid} 不是 VID/PID（例如 USBSTOR 型號），無法設定 IgnoreHWSerNum")
+        return False
     formatted_key = format_ignore_key(vidpid)
     logging.debug(f"[UsbFlags] 準備設定 Ignore 鍵值: {formatted_key}")
 
@@ -27,18 +32,19 @@ def add_ignore_key_to_registry(vidpid: str, auto=True) -> bool:
             return False
 
     try:
-        key_path = r"SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
+        registry = get_registry()
+        key_path = USB_FLAGS_PATH
         logging.debug(f"[UsbFlags] 嘗試開啟註冊表路徑: {key_path}")
-        with winreg.CreateKey(winreg.HKEY_LOCAL_MACHINE, key_path) as usb_flags:
+        with registry.CreateKey(registry.HKEY_LOCAL_MACHINE, key_path) as usb_flags:
             try:
-                winreg.QueryValueEx(usb_flags, formatted_key)
+                registry.QueryValueEx(usb_flags, formatted_key)
                 logging.info(f"[UsbFlags] 已存在: {formatted_key}，略過設定")
                 return True
             except FileNotFoundError:
                 pass 
 
             logging.debug(f"[UsbFlags] 正在新增鍵值 {formatted_key} 至註冊表 {key_path}")
-            winreg.SetValueEx(usb_flags, formatted_key, 0, winreg.REG_BINARY, IGNORE_SERIAL_NUM)
+            registry.SetValueEx(usb_flags, formatted_key, 0, registry.REG_BINARY, IGNORE_SERIAL_NUM)
             logging.debug(f"[UsbFlags] 註冊表已寫入成功：{formatted_key}")
 
         logging.info(f"[UsbFlags] 已新增: {formatted_key}")
@@ -55,11 +61,12 @@ def add_ignore_key_to_registry(vidpid: str, auto=True) -> bool:
 def remove_ignore_key_from_registry(vidpid: str) -> bool:
     """從註冊表中移除指定 VID/PID 的 IgnoreHWSerNum 鍵"""
     formatted_key = format_ignore_key(vidpid)
-    key_path = r"SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
+    key_path = USB_FLAGS_PATH
 
     try:
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_ALL_ACCESS) as usb_flags:
-            winreg.DeleteValue(usb_flags, formatted_key)
+        registry = get_registry()
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, key_path, 0, registry.KEY_ALL_ACCESS) as usb_flags:
+            registry.DeleteValue(usb_flags, formatted_key)
             logging.info(f"[UsbFlags] 已成功移除 Ignore 鍵：{formatted_key}")
             return True
     except FileNotFoundError:
@@ -72,24 +79,74 @@ def remove_ignore_key_from_registry(vidpid: str) -> bool:
 
     return False
 
+def _read_ignore_values(registry, key) -> list[str]:
+    """依 QueryInfoKey 的值數量一次列舉所有 IgnoreHWSerNum* 值名稱"""
+    names = []
+    for i in range(registry.QueryInfoKey(key)[1]):
+        try:
+            name = registry.EnumValue(key, i)[0]
+        except OSError:
+            break
+        if name.startswith(IGNORE_PREFIX):
+            names.append(name)
+    return names
+
 def list_all_ignore_keys() -> list:
     """列出所有目前 UsbFlags 中的 IgnoreHWSerNum 鍵"""
-    key_path = r"SYSTEM\\CurrentControlSet\\Control\\UsbFlags"
-    found_keys = []
     try:
-        with winreg.OpenKey(winreg.HKEY_LOCAL_MACHINE, key_path, 0, winreg.KEY_READ) as key:
-            i = 0
-            while True:
-                try:
-                    name, _, _ = winreg.EnumValue(key, i)
-                    if name.startswith("IgnoreHWSerNum"):
-                        found_keys.append(name)
-                    i += 1
-                except OSError:
-                    break
+        registry = get_registry()
+        with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, USB_FLAGS_PATH, 0, registry.KEY_READ) as key:
+            return _read_ignore_values(registry, key)
     except Exception as e:
         logging.error(f"[UsbFlags] 無法列出 UsbFlags 鍵：{e}")
-    return found_keys
+    return []
+
+def reconcile_ignore_keys(vidpids, remove_stale: bool = False) -> dict:
+    """以單一 handle 批次同步 UsbFlags：列舉一次既有 IgnoreHWSerNum*，補寫缺少的值，
+    remove_stale=True 時一併刪除不在 vidpids 內的值。回傳 added/removed/failed/existing 摘要。"""
+    desired = {}
+    for vidpid in vidpids:
+        normalized = normalize_vidpid(vidpid)
+        if len(normalized) != 8:
+            logging.debug(f"[UsbFlags] 略過格式異常的 VID/PID：{vidpid}")
+            continue
+        desired[f"{IGNORE_PREFIX}{normalized}".upper()] = f"{IGNORE_PREFIX}{normalized}"
+
+    summary = {"existing": 0, "added": [], "removed": [], "failed": []}
+    try:
+        registry = get_registry()
+        with registry.CreateKeyEx(registry.HKEY_LOCAL_MACHINE, USB_FLAGS_PATH, 0, registry.KEY_ALL_ACCESS) as usb_flags:
+            existing = {name.upper(): name for name in _read_ignore_values(registry, usb_flags)}
+            summary["existing"] = len(existing)
+
+            for upper_name, formatted_key in desired.items():
+                if upper_name in existing:
+                    continue
+                try:
+                    registry.SetValueEx(usb_flags, formatted_key, 0, registry.REG_BINARY, IGNORE_SERIAL_NUM)
+                    summary["added"].append(formatted_key)
+                except OSError as e:
+                    summary["failed"].append({"key": formatted_key, "error": f"{type(e).__name__} - {e}"})
+
+            if remove_stale:
+                for upper_name, name in existing.items():
+                    if upper_name in desired:
+                        continue
+                    try:
+                        registry.DeleteValue(usb_flags, name)
+                        summary["removed"].append(name)
+                    except OSError as e:
+                        summary["failed"].append({"key": name, "error": f"{type(e).__name__} - {e}"})
+    except PermissionError:
+        logging.warning("[UsbFlags] 權限不足，請以系統管理員或排程器方式執行")
+        summary["failed"].append({"key": USB_FLAGS_PATH, "error": "PermissionError"})
+    except Exception as e:
+        logging.error(f"[UsbFlags] 批次同步 UsbFlags 失敗: {e}")
+        summary["failed"].append({"key": USB_FLAGS_PATH, "error": str(e)})
+
+    logging.info(f"[UsbFlags] 批次同步完成：既有 {summary['existing']}，新增 {len(summary['added'])}，"
+                 f"移除 {len(summary['removed'])}，失敗 {len(summary['failed'])}")
+    return summary
 
 if __name__ == "__main__":
     if not logging.getLogger().hasHandlers():
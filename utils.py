@@ -1,6 +1,5 @@
-import os
-import json
 import logging
+from lock_list_store import get_lock_list_store
 
 def normalize_vidpid(vidpid: str) -> str:
     """標準化 VID/PID 字串格式（去除前綴與符號後轉大寫）"""
@@ -9,6 +8,9 @@ def normalize_vidpid(vidpid: str) -> str:
         return ""
 
     vidpid = vidpid.strip().upper()
+    if "\\" in vidpid:
+        # 沒有 VID/PID 的列舉器（USBSTOR、USBPRINT）以「列舉器\\型號」為鍵，原樣保留
+        return vidpid
     normalized = (
         vidpid.replace("VID_", "")
               .replace("PID_", "")
@@ -22,21 +24,15 @@ def normalize_vidpid(vidpid: str) -> str:
         logging.warning(f"[Utils] normalize_vidpid() 結果長度異常：{normalized}")
     return normalized
 
-def get_locked_list(lock_list_file: str = "lock_list.json") -> list[str]:
-    """讀取鎖定的 VIDPID 清單，預期格式：{"locked": [ "VIDXXXXPIDYYYY", ... ]}"""
+def filetime_from_timestamp(seconds: float) -> int:
+    """Unix 時間轉為 Windows FILETIME（1601 起算的 100ns 單位），用來與 QueryInfoKey 的 LastWriteTime 比較"""
+    return int(seconds * 10_000_000) + 116444736000000000
+
+def get_locked_list(lock_list_file: str = "lock_list.json") -> frozenset[str]:
+    """讀取鎖定的 VIDPID 集合，預期格式：{"locked": [ "VIDXXXXPIDYYYY", ... ]}（含尚未合併的 journal）。
+    檔案未變動時直接使用行程內快取。"""
     try:
-        if not os.path.exists(lock_list_file):
-            return []
-        with open(lock_list_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        locked = data.get("locked", [])
-        if not isinstance(locked, list):
-            logging.error(f"[Utils] lock_list.json 格式錯誤，locked 應為 list：{type(locked)}")
-            return []
-        if not all(isinstance(item, str) for item in locked):
-            logging.error(f"[Utils] locked 清單內容非全為字串：{locked}")
-            return []
-        return locked
+        return get_lock_list_store(lock_list_file).locked()
     except Exception as e:
         logging.error(f"[Utils] 載入 Lock List 失敗：{e}")
-        return []
\ No newline at end of file
+        return frozenset()
@@ -0,0 +1,68 @@
+import json
+import time
+import logging
+from registry_backend import get_registry
+from cleaner import clean_enum_for_vidpid
+
+VERIFY_REPORT_FILE = "verify_report.json"
+VERIFY_RETRIES = 2
+VERIFY_BACKOFF_SECONDS = 0.5
+VERIFY_MAX_BACKOFF_SECONDS = 5.0
+
+def find_new_offenders(index, threshold: int, locked_list, skip=()) -> dict:
+    """找出執行期間超過門檻的 VID/PID，回傳 {vidpid: 實例數}：根鍵 LastWriteTime 有變動時新出現的裝置鍵，
+    以及 LastWriteTime 或實例數已變動的既有裝置鍵（略過 skip，即本次已清理、由 verify_cleanup 確認的 VID/PID）"""
+    registry = get_registry()
+    offenders = {}
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, index.enum_path) as root:
+        added = index.refresh_root(root)
+        changed = index.refresh_changed(root, skip=set(skip) | set(added) | set(locked_list))
+        for vidpid in added + changed:
+            count = index.instance_count(vidpid)
+            if count >= threshold and vidpid not in locked_list:
+                reason = "新增裝置鍵" if vidpid in added else "實例增加"
+                logging.info(f"[Verify] 執行期間{reason} {vidpid}（{count} 個實例）")
+                offenders[vidpid] = count
+    return offenders
+
+def verify_cleanup(index, before: dict, retries: int = VERIFY_RETRIES,
+                   backoff: float = VERIFY_BACKOFF_SECONDS, sleep=time.sleep, kept: dict = None, policies: dict = None) -> list[dict]:
+    """只重新查詢本次清理過的 VID/PID，不重新走訪整個 Enum\\USB；殘留實例以指數退避重試清除。
+
+    before 為 {vidpid: 清理前實例數}；kept 為部分清理刻意保留的實例數，policies 為重試時沿用的 PrunePolicy。
+    回傳每個 VID/PID 的 before/after/kept/residual 報表。
+    """
+    registry = get_registry()
+    kept = kept or {}
+    policies = policies or {}
+    report = []
+    with registry.OpenKey(registry.HKEY_LOCAL_MACHINE, index.enum_path) as root:
+        for vidpid, before_count in before.items():
+            after = index.refresh_device(root, vidpid)
+            keep = kept.get(vidpid, 0)
+            residual = max(0, after - keep)
+            attempts = 0
+            delay = backoff
+            while residual > 0 and attempts < retries:
+                attempts += 1
+                logging.info(f"[Verify] {vidpid} 仍殘留 {residual} 個實例，第 {attempts} 次重試（等待 {delay:.1f}s）")
+                sleep(delay)
+                delay = min(delay * 2, VERIFY_MAX_BACKOFF_SECONDS)
+                keep = clean_enum_for_vidpid(vidpid, index=index, skip_locked=False, policy=policies.get(vidpid))
+                residual = max(0, index.refresh_device(root, vidpid) - keep)
+
+            report.append({"vid_pid": vidpid, "before": before_count, "after": after,
+                           "kept": keep, "residual": residual, "retries": attempts})
+            kept_note = f"（保留 {keep} 個）" if keep else ""
+            if residual:
+                logging.warning(f"[Verify] {vidpid} 清理前 {before_count}，清理後 {after}{kept_note}，重試後仍殘留 {residual}")
+            else:
+                logging.info(f"[Verify] {vidpid} 清理前 {before_count}，清理後 {after}{kept_note}，已無殘留")
+    return report
+
+def save_verify_report(report: list[dict], report_file: str = VERIFY_REPORT_FILE) -> None:
+    try:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        logging.error(f"[Verify] 儲存確認報表失敗：{e}")